@@ -1,57 +1,127 @@
-from fastapi import APIRouter, HTTPException #type: ignore
-from models.chat import ChatRequest, ChatResponse, NewChatRequest, SendMessageRequest, ChatSummary, ChatMessage, RenameRequest
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response #type: ignore
+from fastapi.responses import StreamingResponse #type: ignore
+from starlette.background import BackgroundTask #type: ignore
+from models.chat import ChatRequest, ChatResponse, NewChatRequest, SendMessageRequest, ChatSummary, ChatHistoryPage, RenameRequest, BatchItem, BatchRequest
 from models.user import UserLogin, UserCreate, UserResponse
 from services.user_service import authenticate_user, create_user
 from services.chat_service import handle_chat
-from core.mongo import chat_collection
-from core.gemini import generate_response
-from core.exceptions import APIException, ValidationException, AuthenticationException, NotFoundException
+from services.batch_service import BatchRun
+from services import chat_store, jobs, memory, write_behind
+from services.chat_titles import DEFAULT_TITLE, title_new_chat
+from services.chat_session import store_exchange
+from services.prompt_builder import chat_prompt_prefix, forget_prompt_prefix, refresh_summary, summary_is_stale
+from core.config import settings
+from core.gemini import agenerate_response, astream_response, is_available, response_cache, inflight, policy
+from core.exceptions import APIException, ValidationException, AuthenticationException, NotFoundException, ServiceUnavailableException
 from core.logging import log_error, log_info
+from core.security import create_session_token, verify_session_token
+from pydantic import ValidationError #type: ignore
+from typing import List, Optional
 from uuid import uuid4
-from datetime import datetime
-from typing import List
+import anyio #type: ignore
+import hashlib
+import json
 
 router = APIRouter()
 
+def _session_user(authorization: Optional[str] = Header(None)) -> str:
+    """Resolve the caller's user id from the `Authorization: Bearer <token>` header"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Session token required")
+    try:
+        return verify_session_token(authorization[len("Bearer "):])
+    except AuthenticationException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+def _check_owner(session_user: str, user_id: str):
+    """Only let users touch their own chats"""
+    if user_id and user_id != session_user:
+        raise HTTPException(status_code=403, detail="Not allowed to access another user's chats")
+
+async def _load_prompt(user_id: str, chat_id: str, message: str):
+    """Build the prompt for a new message from the chat's summary and recent turns"""
+    chat = await chat_store.get_chat(user_id, chat_id)
+    await write_behind.sync_chat(chat_id)
+    prefix = await chat_prompt_prefix(chat_id)
+    upto = chat.get("summary_upto") or 0
+    memories = await memory.recall(user_id, message, prefix.window(upto))
+    return chat, prefix.build(message, chat.get("summary"), memories, upto)
+
+async def _after_exchange(user_id: str, chat: dict):
+    """Background task once the exchange is stored: title a new chat, refresh the rolling summary"""
+    if chat.get("message_count", 0) == 0:
+        await title_new_chat(user_id, chat["chat_id"])
+    # The exchange just stored added two messages
+    if summary_is_stale({**chat, "message_count": chat.get("message_count", 0) + 2}):
+        await refresh_summary(user_id, chat["chat_id"])
+
+def _etag(*parts) -> str:
+    """Weak ETag over what a response is derived from (weak: the bytes differ per Content-Encoding)"""
+    return 'W/"%s"' % hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names `etag`"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 asks for If-None-Match
+    return etag[2:] in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+# Browsers keep the response but revalidate it on every use
+REVALIDATE_HEADERS = {"Cache-Control": "private, no-cache"}
+
+def _sse(data: dict, event: str = None) -> str:
+    """Format a server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def _stream_reply(user_id: str, chat_id: str, message: str, prompt: str, use_cache: bool = True):
+    """Relay Gemini chunks as SSE events and persist the exchange afterwards"""
+    parts = []
+    try:
+        async for chunk in astream_response(prompt, use_cache=use_cache):
+            parts.append(chunk)
+            yield _sse({"chunk": chunk})
+        yield _sse({"response": "".join(parts)}, event="done")
+    except Exception as e:
+        log_error(e, "stream_response")
+        yield _sse({"detail": "AI service unavailable"}, event="error")
+    finally:
+        # Runs on completion and on client disconnect; keep whatever was streamed
+        if parts:
+            with anyio.CancelScope(shield=True):
+                try:
+                    await store_exchange(user_id, chat_id, message, "".join(parts))
+                    log_info("Streamed message stored for user %s, chat %s", user_id, chat_id)
+                except Exception as e:
+                    log_error(e, "store_streamed_message")
+
 @router.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest, session_user: str = Depends(_session_user)):
     """Handle simple chat request"""
+    _check_owner(session_user, request.user_id)
     try:
-        reply = handle_chat(request.user_id, request.message)
+        reply = await handle_chat(request.user_id, request.message, use_cache=not request.bypass_cache)
         return ChatResponse(response=reply)
     except APIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
 @router.post("/new_chat")
-def create_new_chat(request: NewChatRequest):
+async def create_new_chat(request: NewChatRequest, session_user: str = Depends(_session_user)):
     """Create a new chat session"""
+    _check_owner(session_user, request.user_id)
     try:
         if not request.user_id:
             raise ValidationException("User ID is required")
         
         if not request.title or len(request.title.strip()) == 0:
-            request.title = "New Chat"
-        
-        chat = {
-            "chat_id": str(uuid4()),
-            "created_at": datetime.utcnow().isoformat(),
-            "title": request.title,
-            "history": []
-        }
-
-        existing_user = chat_collection.find_one({"user_id": request.user_id})
-        if existing_user:
-            chat_collection.update_one(
-                {"user_id": request.user_id},
-                {"$push": {"chats": chat}}
-            )
-        else:
-            chat_collection.insert_one({
-                "user_id": request.user_id,
-                "chats": [chat]
-            })
-
-        log_info(f"New chat created for user {request.user_id}")
+            request.title = DEFAULT_TITLE
+        
+        chat = await chat_store.create_chat(request.user_id, request.title)
+
+        log_info("New chat created for user %s", request.user_id)
         return { "message": "New chat created", "chat_id": chat["chat_id"] }
         
     except ValidationException as e:
@@ -61,8 +131,9 @@ def create_new_chat(request: NewChatRequest):
         raise HTTPException(status_code=500, detail="Failed to create chat")
 
 @router.post("/send_message", response_model=ChatResponse)
-def send_message(request: SendMessageRequest):
+async def send_message(request: SendMessageRequest, background_tasks: BackgroundTasks, session_user: str = Depends(_session_user)):
     """Send a message in a specific chat"""
+    _check_owner(session_user, request.user_id)
     try:
         if not request.user_id:
             raise ValidationException("User ID is required")
@@ -73,65 +144,134 @@ def send_message(request: SendMessageRequest):
         if not request.message or len(request.message.strip()) == 0:
             raise ValidationException("Message cannot be empty")
         
-        user_doc = chat_collection.find_one({"user_id": request.user_id})
-        if not user_doc:
-            raise NotFoundException("User not found")
-        
-        chat = next((c for c in user_doc["chats"] if c["chat_id"] == request.chat_id), None)
-        if not chat:
-            raise NotFoundException("Chat not found")
-
-        # Building prompt from history
-        history = ""
-        for msg in chat["history"]:
-            history += f"{msg['sender'].capitalize()}: {msg['message']}\n"
-        full_prompt = f"{history}User: {request.message}\nBot:"
+        chat, full_prompt = await _load_prompt(request.user_id, request.chat_id, request.message)
 
         # Get Gemini reply
         try:
-            reply = generate_response(full_prompt)
+            reply = await agenerate_response(full_prompt, use_cache=not request.bypass_cache)
         except Exception as e:
             log_error(e, "generate_response")
-            raise HTTPException(status_code=503, detail="AI service unavailable")
+            raise ServiceUnavailableException("AI service unavailable")
 
-        # Add both user and bot messages
-        new_messages = [
-            {"sender": "user", "message": request.message, "timestamp": datetime.utcnow().isoformat()},
-            {"sender": "bot", "message": reply, "timestamp": datetime.utcnow().isoformat()}
-        ]
-
-        chat_collection.update_one(
-            {"user_id": request.user_id, "chats.chat_id": request.chat_id},
-            {"$push": {"chats.$.history": {"$each": new_messages}}}
-        )
+        await store_exchange(request.user_id, request.chat_id, request.message, reply)
+        background_tasks.add_task(_after_exchange, request.user_id, chat)
 
-        log_info(f"Message sent successfully for user {request.user_id}, chat {request.chat_id}")
+        log_info("Message sent successfully for user %s, chat %s", request.user_id, request.chat_id)
         return ChatResponse(response=reply)
         
-    except (ValidationException, NotFoundException) as e:
+    except (ValidationException, NotFoundException, ServiceUnavailableException) as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         log_error(e, "send_message")
         raise HTTPException(status_code=500, detail="Failed to send message")
 
+@router.post("/send_message/stream")
+async def send_message_stream(request: SendMessageRequest, session_user: str = Depends(_session_user)):
+    """Send a message in a specific chat and stream the reply as server-sent events"""
+    _check_owner(session_user, request.user_id)
+    try:
+        if not request.user_id:
+            raise ValidationException("User ID is required")
+        
+        if not request.chat_id:
+            raise ValidationException("Chat ID is required")
+        
+        if not request.message or len(request.message.strip()) == 0:
+            raise ValidationException("Message cannot be empty")
+        
+        if not is_available():
+            raise ServiceUnavailableException("AI service unavailable")
+
+        chat, full_prompt = await _load_prompt(request.user_id, request.chat_id, request.message)
+
+        log_info("Streaming reply for user %s, chat %s", request.user_id, request.chat_id)
+        return StreamingResponse(
+            _stream_reply(request.user_id, request.chat_id, request.message, full_prompt, not request.bypass_cache),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(_after_exchange, request.user_id, chat)
+        )
+        
+    except (ValidationException, NotFoundException, ServiceUnavailableException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        log_error(e, "send_message_stream")
+        raise HTTPException(status_code=500, detail="Failed to send message")
+
+async def _batch_request(request: Request) -> BatchRequest:
+    """Parse a batch body: a JSON BatchRequest, or NDJSON with one item per line"""
+    body = await request.body()
+    if "ndjson" not in request.headers.get("content-type", ""):
+        try:
+            return BatchRequest.model_validate_json(body)
+        except ValidationError:
+            raise ValidationException("Invalid batch request")
+
+    items = []
+    for number, line in enumerate(body.decode("utf-8").splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            items.append(BatchItem.model_validate_json(line))
+        except ValidationError:
+            raise ValidationException(f"Invalid item on line {number}")
+    return BatchRequest(items=items)
+
+@router.post("/batch")
+async def batch(
+    request: Request,
+    batch_id: Optional[str] = Query(None, max_length=128, description="Reuse to resume a batch; generated if omitted"),
+    concurrency: Optional[int] = Query(None, ge=1),
+    session_user: str = Depends(_session_user)
+):
+    """Generate replies for many items with bounded concurrency, streaming NDJSON results as they complete"""
+    try:
+        batch_request = await _batch_request(request)
+        if not batch_request.items:
+            raise ValidationException("Batch has no items")
+
+        if len(batch_request.items) > settings.BATCH_MAX_ITEMS:
+            raise ValidationException(f"Batch too large (max {settings.BATCH_MAX_ITEMS} items)")
+
+        batch_id = batch_id or batch_request.batch_id or uuid4().hex
+        run = BatchRun(
+            session_user, batch_id, batch_request.items, concurrency or batch_request.concurrency,
+            admission=request.app.state.admission
+        )
+
+        log_info("Batch %s started for user %s with %s items", batch_id, session_user, len(batch_request.items))
+        return StreamingResponse(
+            run.results(),
+            media_type="application/x-ndjson",
+            headers={"X-Batch-ID": batch_id, "X-Accel-Buffering": "no"}
+        )
+
+    except ValidationException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        log_error(e, "batch")
+        raise HTTPException(status_code=500, detail="Failed to start batch")
+
 @router.get("/get_chats/{user_id}", response_model=List[ChatSummary])
-def get_all_chats(user_id: str):
+async def get_all_chats(user_id: str, request: Request, response: Response, session_user: str = Depends(_session_user)):
     """Get all chats for a user"""
+    _check_owner(session_user, user_id)
     try:
         if not user_id:
             raise ValidationException("User ID is required")
         
-        user_doc = chat_collection.find_one({"user_id": user_id})
-        if not user_doc:
-            return []
-        
-        chats = user_doc.get("chats", [])
+        chats = await chat_store.list_chats(user_id)
+        # The list itself is small and cached; only creates, renames and deletes change it
+        etag = _etag(user_id, [(c["chat_id"], c["title"], c["created_at"]) for c in chats])
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, **REVALIDATE_HEADERS})
+        response.headers.update({"ETag": etag, **REVALIDATE_HEADERS})
         summaries = [
             ChatSummary(chat_id=c["chat_id"], title=c["title"], created_at=c["created_at"])
             for c in chats
         ]
         
-        log_info(f"Retrieved {len(summaries)} chats for user {user_id}")
+        log_info("Retrieved %s chats for user %s", len(summaries), user_id)
         return summaries
         
     except ValidationException as e:
@@ -140,9 +280,18 @@ def get_all_chats(user_id: str):
         log_error(e, "get_all_chats")
         raise HTTPException(status_code=500, detail="Failed to retrieve chats")
 
-@router.get("/chat/{user_id}/{chat_id}", response_model=List[ChatMessage])
-def get_chat_history(user_id: str, chat_id: str):
-    """Get chat history for a specific chat"""
+@router.get("/chat/{user_id}/{chat_id}", response_model=ChatHistoryPage)
+async def get_chat_history(
+    user_id: str,
+    chat_id: str,
+    request: Request,
+    response: Response,
+    before: Optional[int] = Query(None, ge=0, description="Return messages older than this cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    session_user: str = Depends(_session_user)
+):
+    """Get a page of chat history, newest first page unless a cursor is given"""
+    _check_owner(session_user, user_id)
     try:
         if not user_id:
             raise ValidationException("User ID is required")
@@ -150,18 +299,18 @@ def get_chat_history(user_id: str, chat_id: str):
         if not chat_id:
             raise ValidationException("Chat ID is required")
         
-        user_doc = chat_collection.find_one({"user_id": user_id})
-        if not user_doc:
-            raise NotFoundException("User not found")
-
-        chat = next((c for c in user_doc["chats"] if c["chat_id"] == chat_id), None)
-        if not chat:
-            raise NotFoundException("Chat not found")
-
-        history = chat.get("history", [])
+        await chat_store.get_chat(user_id, chat_id)
+        await write_behind.sync_chat(chat_id)
+        # Uncached and read after the sync, so no worker answers 304 for messages it has not seen
+        version = await chat_store.get_chat_version(chat_id)
+        etag = _etag(chat_id, version, before, limit)
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, **REVALIDATE_HEADERS})
+        response.headers.update({"ETag": etag, **REVALIDATE_HEADERS})
+        history, next_cursor = await chat_store.get_messages_page(chat_id, before, limit)
         
-        log_info(f"Retrieved {len(history)} messages for chat {chat_id}")
-        return history
+        log_info("Retrieved %s messages for chat %s", len(history), chat_id)
+        return ChatHistoryPage(messages=history, next_cursor=next_cursor)
         
     except (ValidationException, NotFoundException) as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
@@ -170,8 +319,9 @@ def get_chat_history(user_id: str, chat_id: str):
         raise HTTPException(status_code=500, detail="Failed to retrieve chat history")
 
 @router.delete("/chat/{user_id}/{chat_id}")
-def delete_chat(user_id: str, chat_id: str):
+async def delete_chat(user_id: str, chat_id: str, session_user: str = Depends(_session_user)):
     """Delete a specific chat"""
+    _check_owner(session_user, user_id)
     try:
         if not user_id:
             raise ValidationException("User ID is required")
@@ -179,15 +329,15 @@ def delete_chat(user_id: str, chat_id: str):
         if not chat_id:
             raise ValidationException("Chat ID is required")
         
-        result = chat_collection.update_one(
-            {"user_id": user_id},
-            {"$pull": {"chats": {"chat_id": chat_id}}}
-        )
-
-        if result.modified_count == 0:
+        deleted = await chat_store.delete_chat(user_id, chat_id)
+        if deleted:
+            write_behind.discard_chat(chat_id)
+            forget_prompt_prefix(chat_id)
+            memory.forget_user(user_id)
+        if not deleted:
             raise NotFoundException("Chat not found or already deleted")
 
-        log_info(f"Chat {chat_id} deleted successfully for user {user_id}")
+        log_info("Chat %s deleted successfully for user %s", chat_id, user_id)
         return { "message": "Chat deleted successfully" }
         
     except (ValidationException, NotFoundException) as e:
@@ -197,8 +347,9 @@ def delete_chat(user_id: str, chat_id: str):
         raise HTTPException(status_code=500, detail="Failed to delete chat")
 
 @router.patch("/chat/{user_id}/{chat_id}/rename")
-def rename_chat(user_id: str, chat_id: str, request: RenameRequest):
+async def rename_chat(user_id: str, chat_id: str, request: RenameRequest, session_user: str = Depends(_session_user)):
     """Rename a chat"""
+    _check_owner(session_user, user_id)
     try:
         if not user_id:
             raise ValidationException("User ID is required")
@@ -209,15 +360,11 @@ def rename_chat(user_id: str, chat_id: str, request: RenameRequest):
         if not request.new_title or len(request.new_title.strip()) == 0:
             raise ValidationException("New title is required")
         
-        result = chat_collection.update_one(
-            {"user_id": user_id, "chats.chat_id": chat_id},
-            {"$set": {"chats.$.title": request.new_title}}
-        )
-
-        if result.modified_count == 0:
+        renamed = await chat_store.rename_chat(user_id, chat_id, request.new_title)
+        if not renamed:
             raise NotFoundException("Chat not found or title unchanged")
 
-        log_info(f"Chat {chat_id} renamed to '{request.new_title}' for user {user_id}")
+        log_info("Chat %s renamed to '%s' for user %s", chat_id, request.new_title, user_id)
         return { "message": "Chat title updated" }
         
     except (ValidationException, NotFoundException) as e:
@@ -226,22 +373,43 @@ def rename_chat(user_id: str, chat_id: str, request: RenameRequest):
         log_error(e, "rename_chat")
         raise HTTPException(status_code=500, detail="Failed to rename chat")
 
+@router.get("/jobs")
+async def job_status(session_user: str = Depends(_session_user)):
+    """Background job queue depth and lag, plus this worker's job counters"""
+    if jobs.queue is None:
+        return {"enabled": False}
+    try:
+        return await jobs.queue.stats()
+    except Exception as e:
+        log_error(e, "job_status")
+        raise HTTPException(status_code=500, detail="Failed to retrieve job status")
+
+@router.get("/cache/stats")
+async def cache_stats(session_user: str = Depends(_session_user)):
+    """Response cache, chat cache, request coalescing and upstream resilience counters"""
+    return {
+        "response_cache": response_cache.stats() if response_cache else {"enabled": False},
+        "chat_cache": chat_store.cache.stats() if chat_store.cache else {"enabled": False},
+        "coalescing": inflight.stats() if inflight else {"enabled": False},
+        "upstream": policy.stats()
+    }
+
 @router.post("/signup", response_model=UserResponse)
-def signup(user: UserCreate):
+async def signup(user: UserCreate):
     """User registration"""
     try:
-        user_id = create_user(user.username, user.password)
-        log_info(f"User registered successfully: {user.username}")
+        user_id = await create_user(user.username, user.password)
+        log_info("User registered successfully: %s", user.username)
         return UserResponse(user_id=user_id, username=user.username)
     except APIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
 @router.post("/login", response_model=UserResponse)
-def login(user: UserLogin):
-    """User authentication"""
+async def login(user: UserLogin):
+    """User authentication; returns a session token for the chat routes"""
     try:
-        user_id = authenticate_user(user.username, user.password)
-        log_info(f"User logged in successfully: {user.username}")
-        return UserResponse(user_id=user_id, username=user.username)
+        user_id = await authenticate_user(user.username, user.password)
+        log_info("User logged in successfully: %s", user.username)
+        return UserResponse(user_id=user_id, username=user.username, token=create_session_token(user_id, user.username))
     except APIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
\ No newline at end of file
@@ -0,0 +1,178 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect #type: ignore
+from services.chat_session import ChatSession
+from core.admission import AdmissionController, RateLimitedException
+from core.config import settings
+from core.gemini import astream_response, is_available
+from core.exceptions import AuthenticationException, NotFoundException
+from core.logging import log_error, log_info, request_id_var
+from core.security import verify_session_token
+from core import metrics
+from typing import Optional
+import anyio #type: ignore
+import json
+import time
+import uuid
+
+router = APIRouter()
+
+# Application close codes (4000-4999 are reserved for applications)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+
+async def _authenticate(websocket: WebSocket) -> str:
+    """User id from the Authorization header, or else from a first {"type": "auth", "token": ...} frame
+
+    Browsers cannot set headers on WebSockets, and a token in the URL would
+    end up in access logs, proxies and browser history, so it comes as the
+    first frame instead, within WS_AUTH_TIMEOUT seconds.
+    """
+    if "token" in websocket.query_params:
+        raise AuthenticationException("Send the session token in an auth frame, not the URL")
+    authorization = websocket.headers.get("authorization")
+    if authorization and authorization.startswith("Bearer "):
+        return verify_session_token(authorization[len("Bearer "):])
+    try:
+        with anyio.fail_after(settings.WS_AUTH_TIMEOUT):
+            frame = json.loads(await websocket.receive_text())
+    except (TimeoutError, ValueError):
+        frame = None
+    if not isinstance(frame, dict) or frame.get("type") != "auth" or not isinstance(frame.get("token"), str):
+        raise AuthenticationException("Session token required")
+    return verify_session_token(frame["token"])
+
+def _parse(text: str) -> dict:
+    """Validate a client frame; returns the queue item for it"""
+    try:
+        frame = json.loads(text)
+    except ValueError:
+        return {"error": "Invalid JSON"}
+    if not isinstance(frame, dict) or frame.get("type", "message") != "message":
+        return {"id": frame.get("id") if isinstance(frame, dict) else None, "error": "Unsupported frame type"}
+    message = frame.get("message")
+    if not isinstance(message, str) or len(message.strip()) == 0:
+        return {"id": frame.get("id"), "error": "Message cannot be empty"}
+    return {"id": frame.get("id"), "message": message, "use_cache": not frame.get("bypass_cache", False)}
+
+async def _receive(websocket: WebSocket, send_stream):
+    """Read frames into the bounded queue
+
+    Once WS_MAX_PENDING_MESSAGES are waiting, send() blocks, so the socket
+    stops being read and TCP flow control pushes back on the client.
+    """
+    try:
+        while True:
+            await send_stream.send(_parse(await websocket.receive_text()))
+    except WebSocketDisconnect:
+        pass
+
+async def _reply(websocket: WebSocket, session: ChatSession, item: dict):
+    """Stream the reply to one message and record the exchange"""
+    msg_id, message = item["id"], item["message"]
+    if not is_available():
+        await websocket.send_json({"type": "error", "id": msg_id, "detail": "AI service unavailable"})
+        return "unavailable"
+
+    prompt = await session.prompt_for(message)
+    parts = []
+    try:
+        async for chunk in astream_response(prompt, use_cache=item["use_cache"]):
+            parts.append(chunk)
+            await websocket.send_json({"type": "chunk", "id": msg_id, "chunk": chunk})
+        await websocket.send_json({"type": "done", "id": msg_id, "response": "".join(parts)})
+        return "ok"
+    except WebSocketDisconnect:
+        raise
+    except Exception as e:
+        log_error(e, "ws_stream_response")
+        await websocket.send_json({"type": "error", "id": msg_id, "detail": "AI service unavailable"})
+        return "error"
+    finally:
+        # Also runs when the client goes away mid-reply; keep whatever was streamed
+        if parts:
+            with anyio.CancelScope(shield=True):
+                try:
+                    await session.record(message, "".join(parts))
+                except Exception as e:
+                    log_error(e, "ws_store_message")
+
+async def _process(websocket: WebSocket, session: ChatSession, receive_stream, admission: Optional[AdmissionController]):
+    """Answer queued messages one at a time, in the order they arrived
+
+    Each message is admitted like a request to the REST routes: it takes a
+    token from the user's rate limit and a slot, or gets an error frame
+    with retry_after.
+    """
+    async for item in receive_stream:
+        if "error" in item:
+            await websocket.send_json({"type": "error", "id": item.get("id"), "detail": item["error"]})
+            continue
+        if admission is not None:
+            try:
+                await admission.acquire(session.user_id)
+            except RateLimitedException as e:
+                await websocket.send_json({"type": "error", "id": item["id"], "detail": e.message, "retry_after": e.retry_seconds})
+                continue
+        start_time = time.perf_counter()
+        outcome = "error"
+        try:
+            outcome = await _reply(websocket, session, item)
+        except NotFoundException:
+            # Deleted while the connection was open
+            outcome = "not_found"
+            await websocket.close(code=CLOSE_NOT_FOUND, reason="Chat not found")
+            return
+        finally:
+            if admission is not None:
+                admission.release(time.perf_counter() - start_time)
+            metrics.websocket_message_duration.observe(time.perf_counter() - start_time, outcome=outcome)
+
+@router.websocket("/ws/chat/{chat_id}")
+async def chat_socket(websocket: WebSocket, chat_id: str):
+    """Long-lived chat connection: send messages, receive streamed replies
+
+    Client frames: {"type": "auth", "token": "..."} first (unless sent as
+    an Authorization header), then {"type": "message", "id": ..., "message":
+    "...", "bypass_cache": false}. Server frames: "ready" once, then "chunk"* and "done" (or "error") per
+    message, echoing its id. Messages are answered in order; several may be
+    sent without waiting for replies.
+    """
+    request_id_var.set(uuid.uuid4().hex[:16])
+    await websocket.accept()
+
+    try:
+        user_id = await _authenticate(websocket)
+        session = await ChatSession.open(user_id, chat_id)
+    except WebSocketDisconnect:
+        return
+    except AuthenticationException as e:
+        await websocket.close(code=CLOSE_UNAUTHORIZED, reason=e.message)
+        return
+    except NotFoundException as e:
+        await websocket.close(code=CLOSE_NOT_FOUND, reason=e.message)
+        return
+
+    metrics.websocket_connections.inc()
+    log_info("WebSocket opened for user %s, chat %s", user_id, chat_id)
+    try:
+        await websocket.send_json({"type": "ready", "chat_id": chat_id, "message_count": session.message_count})
+        send_stream, receive_stream = anyio.create_memory_object_stream(settings.WS_MAX_PENDING_MESSAGES)
+        async with anyio.create_task_group() as task_group:
+            async def process():
+                try:
+                    await _process(websocket, session, receive_stream, websocket.app.state.admission)
+                except WebSocketDisconnect:
+                    pass
+                # The chat was deleted or the client left mid-reply; stop reading too
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(process)
+            await _receive(websocket, send_stream)
+            # The client is gone: anything still queued has nobody to answer to
+            task_group.cancel_scope.cancel()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log_error(e, "chat_socket")
+    finally:
+        metrics.websocket_connections.dec()
+        log_info("WebSocket closed for user %s, chat %s", user_id, chat_id)
@@ -0,0 +1,112 @@
+"""Circuit breaker recovery checks: every half-open trial settles the breaker
+
+Opens a breaker, waits for it to go half-open and ends the trial call in
+each way a call can end, through acall, astream and the blocking call():
+
+- a retryable error (503): the circuit opens again
+- a non-retryable error (400, safety block): the upstream answered, so it closes
+- cancellation (client disconnect): no verdict, the next call is the trial
+- success: it closes
+
+A trial that is never settled leaves the circuit half-open and rejects
+every later call with 503.
+
+    python -m bench.circuit_breaker
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.exceptions import ServiceUnavailableException
+from core.fake_gemini import FakeGeminiError
+from core.resilience import CircuitBreaker, ResiliencePolicy
+
+RESET_TIMEOUT = 0.05
+
+def half_open_policy() -> ResiliencePolicy:
+    """A policy whose breaker lets the next call through as the half-open trial"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    breaker.record_failure()
+    time.sleep(RESET_TIMEOUT)
+    return ResiliencePolicy(max_concurrency=4, timeout=5.0, max_attempts=1, max_backoff=0.01, hedge_delay=0.0, breaker=breaker)
+
+async def reply(text: str = "ok"):
+    return text
+
+async def fail(code: int):
+    raise FakeGeminiError(code)
+
+async def stall():
+    await asyncio.sleep(60)
+    return "late"
+
+async def stream_of(first):
+    """An upstream stream that fails with `first` (an error code) or yields it"""
+    if isinstance(first, int):
+        raise FakeGeminiError(first)
+    await asyncio.sleep(60 if first is None else 0)
+    yield first or "late"
+
+async def consume(policy: ResiliencePolicy, first) -> str:
+    return "".join([chunk async for chunk in policy.astream(lambda: stream_of(first))])
+
+async def trial(path: str, outcome: str) -> ResiliencePolicy:
+    """End a half-open trial on `path` with `outcome`, returning the policy"""
+    policy = half_open_policy()
+    if outcome == "cancelled":
+        call = policy.acall(stall) if path == "acall" else consume(policy, None)
+        task = asyncio.ensure_future(call)
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return policy
+
+    code = {"retryable": 503, "non_retryable": 400}.get(outcome)
+    try:
+        if path == "acall":
+            await policy.acall(lambda: reply() if code is None else fail(code))
+        elif path == "astream":
+            await consume(policy, "ok" if code is None else code)
+        else:
+            def blocking():
+                if code is not None:
+                    raise FakeGeminiError(code)
+                return "ok"
+            policy.call(blocking)
+    except FakeGeminiError:
+        pass
+    return policy
+
+async def next_call(policy: ResiliencePolicy) -> str:
+    try:
+        return await policy.acall(reply)
+    except ServiceUnavailableException:
+        return "rejected"
+
+async def main():
+    # outcome -> (state right after the trial, result of the next call)
+    expected = {
+        "retryable": (CircuitBreaker.OPEN, "rejected"),
+        "non_retryable": (CircuitBreaker.CLOSED, "ok"),
+        "cancelled": (CircuitBreaker.HALF_OPEN, "ok"),
+        "ok": (CircuitBreaker.CLOSED, "ok"),
+    }
+    failed = 0
+    for path in ("acall", "astream", "call"):
+        for outcome, (state, after) in expected.items():
+            if path == "call" and outcome == "cancelled":
+                continue
+            policy = await trial(path, outcome)
+            got = (policy.breaker.state, await next_call(policy))
+            ok = got == (state, after)
+            failed += not ok
+            print(f"{path:<8}{outcome:<15}state {got[0]:<10}next call {got[1]:<9}{'ok' if ok else 'FAIL, expected ' + str((state, after))}")
+    if failed:
+        raise SystemExit(f"{failed} check(s) failed")
+    print("circuit breaker: ok")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""Concurrent-request scaling of the sync vs async Gemini request path
+
+Runs entirely in-process against a fake model with injected latency, so no
+Gemini key or MongoDB is required:
+
+    python -m bench.concurrency --latency 0.2 --levels 10 50 100 200 400
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx #type: ignore
+from fastapi import FastAPI #type: ignore
+from core import gemini
+from core.fake_gemini import FakeGeminiModel
+
+def build_app() -> FastAPI:
+    """Mini app exposing the old (threadpool) and new (coroutine) call styles"""
+    app = FastAPI()
+
+    @app.post("/sync")
+    def sync_reply(payload: dict):
+        return {"response": gemini.generate_response(payload["message"])}
+
+    @app.post("/async")
+    async def async_reply(payload: dict):
+        return {"response": await gemini.agenerate_response(payload["message"])}
+
+    return app
+
+async def run_level(client: httpx.AsyncClient, path: str, concurrency: int) -> float:
+    start = time.perf_counter()
+    responses = await asyncio.gather(*[
+        client.post(path, json={"message": f"User: hello {i}\nBot:"})
+        for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses)
+    return elapsed
+
+async def main(latency: float, levels: list):
+    gemini.set_model(FakeGeminiModel(first_chunk_delay=latency))
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'mode':<6} {'concurrency':>11} {'wall (s)':>9} {'req/s':>8}")
+        for path in ("/sync", "/async"):
+            for concurrency in levels:
+                elapsed = await run_level(client, path, concurrency)
+                print(f"{path[1:]:<6} {concurrency:>11} {elapsed:>9.2f} {concurrency / elapsed:>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model latency in seconds")
+    parser.add_argument("--levels", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.levels))
@@ -0,0 +1,120 @@
+"""Bytes on the wire and server CPU per read: full, compressed and conditional
+
+Fills a chat with code-heavy replies (SQLite in a temporary directory),
+then calls the app's ASGI interface directly, so no HTTP client runs in
+the measured CPU time, and reads the chat list and the newest history
+page repeatedly:
+
+- identity: full JSON, no Accept-Encoding
+- gzip / br: full JSON, compressed
+- 304: If-None-Match with the current ETag
+
+    python -m bench.conditional_get --messages 100 --reply-kb 4 --requests 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ["GEMINI_FAKE"] = "1"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CODE = '''def handler(request):
+    """Validate the payload and store it"""
+    payload = request.json()
+    if not payload.get("items"):
+        raise ValueError("items required")
+    for item in payload["items"]:
+        db.insert(item["id"], {"name": item["name"], "tags": sorted(item.get("tags", []))})
+    return {"status": "ok", "count": len(payload["items"])}
+'''
+
+async def call(app, path: str, headers: dict) -> tuple:
+    """Run one GET through the ASGI app, returning (status, headers, body)"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, body
+
+async def fill(user_id: str, chat_id: str, messages: int, reply_kb: int):
+    from services import chat_store
+    rng = random.Random(0)
+    names = ["item", "payload", "request", "db", "tags", "name", "count"]
+    for i in range(0, messages, 2):
+        # Renamed identifiers per block, so replies are not byte-for-byte repeats
+        blocks = []
+        for _ in range(max(1, reply_kb * 1024 // len(CODE))):
+            block = CODE
+            for word in names:
+                block = block.replace(word, f"{word}_{rng.randrange(10000)}")
+            blocks.append(block)
+        reply = "Here is a version that validates its input:\n\n```python\n" + "".join(blocks) + "```\n"
+        await chat_store.append_messages(user_id, chat_id, [
+            {"sender": "user", "message": f"Can you improve this handler? Attempt {i // 2}", "timestamp": "2025-01-01T00:00:00"},
+            {"sender": "bot", "message": reply, "timestamp": "2025-01-01T00:00:01"},
+        ])
+
+async def main(args):
+    from core.config import settings
+    settings.STORAGE_BACKEND = "sqlite"
+    settings.SQLITE_PATH = os.path.join(tempfile.mkdtemp(prefix="conditional_get"), "chatbot.db")
+    settings.ADMISSION_ENABLED = False
+    from core.security import create_session_token
+    from server import app
+    from services import chat_store
+
+    async with app.router.lifespan_context(app):
+        user_id = "bench-user"
+        auth = {"Authorization": f"Bearer {create_session_token(user_id, 'bench')}"}
+        for i in range(args.chats):
+            chat = await chat_store.create_chat(user_id, f"Refactoring session {i}")
+        await fill(user_id, chat["chat_id"], args.messages, args.reply_kb)
+        # Whole history on one page, as the frontend loads it
+        routes = {
+            "get_chats": f"/api/get_chats/{user_id}",
+            "history": f"/api/chat/{user_id}/{chat['chat_id']}",
+        }
+
+        print(f"{'route':<10}{'mode':<10}{'status':>7}{'bytes':>10}{'saved':>8}{'cpu us/req':>12}")
+        for name, path in routes.items():
+            _, headers, full = await call(app, path, auth)
+            modes = {
+                "identity": {},
+                "gzip": {"Accept-Encoding": "gzip"},
+                "br": {"Accept-Encoding": "br"},
+                "304": {"If-None-Match": headers["etag"], "Accept-Encoding": "br, gzip"},
+            }
+            for mode, extra in modes.items():
+                status, _, body = await call(app, path, {**auth, **extra})
+                start = time.process_time()
+                for _ in range(args.requests):
+                    await call(app, path, {**auth, **extra})
+                cpu_us = (time.process_time() - start) / args.requests * 1e6
+                saved = 100 * (1 - len(body) / len(full))
+                print(f"{name:<10}{mode:<10}{status:>7}{len(body):>10}{saved:>7.1f}%{cpu_us:>12.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=20, help="chats in the user's list")
+    parser.add_argument("--messages", type=int, default=50, help="messages in the measured chat (one page holds up to 50)")
+    parser.add_argument("--reply-kb", type=int, default=4, help="approximate size of each bot reply")
+    parser.add_argument("--requests", type=int, default=300, help="timed requests per mode")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""Payload size and latency of chat listing and history reads as a chat grows
+
+Seeds a throwaway chat in the configured storage backend (STORAGE_BACKEND),
+growing it to each requested size, and times the first history page, a deep
+page and the chat listing. Both should stay flat; the seeded chat is deleted
+at exit.
+
+    STORAGE_BACKEND=sqlite python -m bench.history_pagination --sizes 100 1000 10000 --repeat 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx #type: ignore
+from server import app
+from services import chat_store
+from core.security import create_session_token
+from core.storage import get_storage
+
+async def grow_chat(user_id: str, chat_id: str, current: int, target: int):
+    """Append filler messages until the chat holds `target` messages"""
+    while current < target:
+        batch = min(1000, target - current)
+        await chat_store.append_messages(user_id, chat_id, [
+            {"sender": "user" if (current + i) % 2 == 0 else "bot",
+             "message": f"message {current + i} " + "lorem ipsum " * 20,
+             "timestamp": "2025-01-01T00:00:00"}
+            for i in range(batch)
+        ])
+        current += batch
+    return current
+
+async def timed_get(client: httpx.AsyncClient, url: str, repeat: int):
+    timings, size = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+        size = len(response.content)
+    return statistics.median(timings), size
+
+async def main(sizes: list, repeat: int):
+    storage = get_storage()
+    await storage.ensure_schema()
+    user_id = f"bench-{uuid4()}"
+    chat = await chat_store.create_chat(user_id, "pagination bench")
+    chat_id, count = chat["chat_id"], 0
+    transport = httpx.ASGITransport(app=app)
+    try:
+        headers = {"Authorization": f"Bearer {create_session_token(user_id, 'bench')}"}
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+            print(f"{'messages':>9} {'endpoint':<12} {'p50 (ms)':>9} {'bytes':>8}")
+            for size in sizes:
+                count = await grow_chat(user_id, chat_id, count, size)
+                targets = {
+                    "first page": f"/api/chat/{user_id}/{chat_id}",
+                    "deep page": f"/api/chat/{user_id}/{chat_id}?before={max(count // 2, 1)}",
+                    "chat list": f"/api/get_chats/{user_id}",
+                }
+                for name, url in targets.items():
+                    latency, payload = await timed_get(client, url, repeat)
+                    print(f"{count:>9} {name:<12} {latency:>9.2f} {payload:>8}")
+    finally:
+        await storage.delete_chat(user_id, chat_id)
+        await storage.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat))
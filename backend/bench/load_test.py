@@ -0,0 +1,277 @@
+"""Reproducible load test of the API against a fake model and an in-memory or local MongoDB
+
+Drives the FastAPI app in-process over httpx with a weighted mix of
+operations from concurrent virtual users, after a setup phase that signs up
+users, logs them in and creates a few chats each. Reports throughput and
+p50/p95/p99 latency per operation plus peak RSS, and writes everything to a
+JSON file. Pass --compare with an earlier file to print the change.
+
+    pip install -r bench/requirements.txt
+    python -m bench.load_test --duration 30 --concurrency 32 --output results.json
+    python -m bench.load_test --mongo-uri mongodb://localhost:27017 --compare results.json
+    python -m bench.load_test --storage sqlite
+
+The mix is given as name=weight pairs over send_message, get_chats,
+get_chat, login and signup.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ["GEMINI_FAKE"] = "1"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx #type: ignore
+
+DEFAULT_MIX = "send_message=40,get_chats=25,get_chat=25,login=8,signup=2"
+PASSWORD = "bench-password"
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+class VirtualUser:
+    def __init__(self, username: str):
+        self.username = username
+        self.user_id = None
+        self.token = None
+        self.chat_ids = []
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+async def signup(client, user: VirtualUser, rng: random.Random):
+    username = f"{user.username}-{rng.getrandbits(48):x}"
+    return await client.post("/api/signup", json={"username": username, "password": PASSWORD})
+
+async def login(client, user: VirtualUser, rng: random.Random):
+    response = await client.post("/api/login", json={"username": user.username, "password": PASSWORD})
+    if response.status_code == 200:
+        user.token = response.json()["token"]
+    return response
+
+async def send_message(client, user: VirtualUser, rng: random.Random):
+    # A small vocabulary makes some prompts repeat, as real traffic does
+    message = f"question {rng.randint(0, 200)} about topic {rng.randint(0, 20)}"
+    return await client.post("/api/send_message", headers=user.headers, json={
+        "user_id": user.user_id, "chat_id": rng.choice(user.chat_ids), "message": message
+    })
+
+async def get_chats(client, user: VirtualUser, rng: random.Random):
+    return await client.get(f"/api/get_chats/{user.user_id}", headers=user.headers)
+
+async def get_chat(client, user: VirtualUser, rng: random.Random):
+    return await client.get(f"/api/chat/{user.user_id}/{rng.choice(user.chat_ids)}", headers=user.headers)
+
+OPERATIONS = {
+    "send_message": send_message,
+    "get_chats": get_chats,
+    "get_chat": get_chat,
+    "login": login,
+    "signup": signup,
+}
+
+async def setup_users(client, count: int, chats_per_user: int, messages_per_chat: int, run_id: str) -> list:
+    users = [VirtualUser(f"bench-{run_id}-{i}") for i in range(count)]
+
+    async def prepare(user: VirtualUser):
+        response = await client.post("/api/signup", json={"username": user.username, "password": PASSWORD})
+        response.raise_for_status()
+        user.user_id = response.json()["user_id"]
+        (await login(client, user, None)).raise_for_status()
+        for _ in range(chats_per_user):
+            response = await client.post("/api/new_chat", headers=user.headers, json={"user_id": user.user_id})
+            response.raise_for_status()
+            user.chat_ids.append(response.json()["chat_id"])
+        for chat_id in user.chat_ids:
+            for i in range(messages_per_chat):
+                await client.post("/api/send_message", headers=user.headers, json={
+                    "user_id": user.user_id, "chat_id": chat_id, "message": f"warmup {i}"
+                })
+
+    await asyncio.gather(*(prepare(user) for user in users))
+    return users
+
+async def drive(client, users: list, mix: dict, concurrency: int, duration: float, seed: int) -> dict:
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int):
+        rng = random.Random(seed * 1000 + index)
+        user = users[index % len(users)]
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await OPERATIONS[name](client, user, rng)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            samples[name].append((time.perf_counter() - start) * 1000)
+            if failed:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    for name in names:
+        if not samples[name]:
+            continue
+        results[name] = {
+            "requests": len(samples[name]),
+            "errors": errors[name],
+            "throughput_rps": round(len(samples[name]) / elapsed, 2),
+            "mean_ms": round(statistics.mean(samples[name]), 2),
+            "p50_ms": round(percentile(samples[name], 0.50), 2),
+            "p95_ms": round(percentile(samples[name], 0.95), 2),
+            "p99_ms": round(percentile(samples[name], 0.99), 2),
+        }
+    every = [sample for name in names for sample in samples[name]]
+    results["all"] = {
+        "requests": len(every),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(every) / elapsed, 2),
+        "mean_ms": round(statistics.mean(every), 2) if every else 0.0,
+        "p50_ms": round(percentile(every, 0.50), 2) if every else 0.0,
+        "p95_ms": round(percentile(every, 0.95), 2) if every else 0.0,
+        "p99_ms": round(percentile(every, 0.99), 2) if every else 0.0,
+    }
+    return results
+
+async def run(args) -> dict:
+    from core import gemini, mongo
+    from core.config import settings
+    from core.fake_gemini import FakeGeminiModel
+
+    # Measures capacity, so per-user rate limits would only cap the result
+    settings.ADMISSION_ENABLED = args.admission
+    if args.storage == "sqlite":
+        settings.STORAGE_BACKEND = "sqlite"
+        settings.SQLITE_PATH = os.path.join(tempfile.mkdtemp(prefix="load_test"), "chatbot.db")
+    elif args.mongo_uri:
+        settings.MONGODB_URI = args.mongo_uri
+    else:
+        from bench.memory_mongo import MemoryDatabase
+        memory = MemoryDatabase()
+        mongo.set_db(database=memory.sync(), async_database=memory)
+    gemini.set_model(FakeGeminiModel(
+        first_chunk_delay=args.model_latency / 1000,
+        chunk_delay=args.chunk_latency / 1000,
+        failure_rate=args.failure_rate,
+        seed=args.seed
+    ))
+
+    from server import app
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            run_id = f"{args.seed}-{int(time.time())}"
+            users = await setup_users(client, args.users, args.chats_per_user, args.messages_per_chat, run_id)
+            rss_before = peak_rss_mb()
+            results = await drive(client, users, parse_mix(args.mix), args.concurrency, args.duration, args.seed)
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "storage": "sqlite" if args.storage == "sqlite" else ("mongo" if args.mongo_uri else "mongo-memory"),
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "chats_per_user": args.chats_per_user,
+            "messages_per_chat": args.messages_per_chat,
+            "mix": args.mix,
+            "model_latency_ms": args.model_latency,
+            "chunk_latency_ms": args.chunk_latency,
+            "failure_rate": args.failure_rate,
+            "seed": args.seed,
+            "admission": args.admission,
+        },
+        "operations": results,
+        "memory": {"peak_rss_mb_after_setup": round(rss_before, 1), "peak_rss_mb": round(peak_rss_mb(), 1)},
+    }
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"{'operation':<14}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report["operations"].items():
+        line = f"{name:<14}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>10.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+        previous = (baseline or {}).get("operations", {}).get(name)
+        if previous:
+            changes = []
+            for key in ("throughput_rps", "p99_ms"):
+                if previous[key]:
+                    changes.append(f"{key} {100 * (row[key] - previous[key]) / previous[key]:+.0f}%")
+            line += "   vs baseline: " + ", ".join(changes)
+        print(line)
+    print(f"peak RSS {report['memory']['peak_rss_mb']} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=20, help="seconds of measured load")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--chats-per-user", type=int, default=3)
+    parser.add_argument("--messages-per-chat", type=int, default=10)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--model-latency", type=float, default=200, help="fake model time to first chunk, ms")
+    parser.add_argument("--chunk-latency", type=float, default=5, help="fake model delay between chunks, ms")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--storage", choices=["mongo", "sqlite"], default="mongo")
+    parser.add_argument("--mongo-uri", help="use a real MongoDB (e.g. a local mongod) instead of the in-memory stand-in")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--admission", action="store_true", help="keep admission control (rate limits) enabled")
+    parser.add_argument("--output", default="load_test_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Per-request logging overhead: the old synchronous handlers vs the queue pipeline
+
+Replays the log calls one request makes (middleware start and completion
+lines plus one route-level line) against each setup and reports the time
+spent on the calling thread. Output goes to a temporary directory, and
+console output is sent to /dev/null so the terminal does not dominate.
+
+    python -m bench.logging_overhead --requests 20000 --sample-rate 0.1
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import logging as app_logging
+from core.config import settings
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.close()
+    root.handlers = []
+
+def setup_sync(log_dir: str):
+    """The previous configuration: blocking file and console handlers, f-strings"""
+    reset_root()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(os.path.join(log_dir, "sync.log")),
+            logging.StreamHandler(open(os.devnull, "w"))
+        ]
+    )
+    logger = logging.getLogger('llm_chatbot')
+
+    def one_request(i: int):
+        method, path, duration = "POST", "/api/send_message", 0.0123
+        logger.info(f"Request started: {method} {path}")
+        logger.info(f"Message sent successfully for user user{i}, chat chat{i}")
+        logger.info(f"Request: {method} {path} - Status: 200 - Duration: {duration:.3f}s")
+    return one_request
+
+def setup_queued(log_dir: str, sample_rate: float):
+    reset_root()
+    settings.LOG_FILE = os.path.join(log_dir, "queued.log")
+    settings.LOG_REQUEST_SAMPLE_RATE = sample_rate
+    sys.stderr, stderr = open(os.devnull, "w"), sys.stderr
+    try:
+        logger = app_logging.setup_logging()
+    finally:
+        sys.stderr = stderr
+
+    def one_request(i: int):
+        token = app_logging.request_id_var.set(f"req{i}")
+        logger.debug("Request started: %s %s", "POST", "/api/send_message")
+        app_logging.log_info("Message sent successfully for user %s, chat %s", f"user{i}", f"chat{i}")
+        app_logging.log_request("POST", "/api/send_message", 200, 0.0123)
+        app_logging.request_id_var.reset(token)
+    return one_request
+
+def measure(one_request, requests: int) -> list:
+    samples = []
+    for i in range(requests):
+        start = time.perf_counter()
+        one_request(i)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+def report(name: str, samples: list, drain: float = 0.0):
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    line = f"{name:<22} mean {statistics.mean(samples):7.1f} us   p50 {statistics.median(samples):7.1f} us   p99 {p99:7.1f} us"
+    if drain:
+        line += f"   (listener drain {drain * 1000:.0f} ms)"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        report("sync handlers", measure(setup_sync(log_dir), args.requests))
+
+        samples = measure(setup_queued(log_dir, 1.0), args.requests)
+        start = time.perf_counter()
+        app_logging.shutdown_logging()
+        report("queue, no sampling", samples, time.perf_counter() - start)
+
+        if args.sample_rate < 1.0:
+            samples = measure(setup_queued(log_dir, args.sample_rate), args.requests)
+            start = time.perf_counter()
+            app_logging.shutdown_logging()
+            report(f"queue, sample {args.sample_rate:g}", samples, time.perf_counter() - start)
+        reset_root()
+
+if __name__ == "__main__":
+    main()
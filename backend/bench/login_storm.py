@@ -0,0 +1,90 @@
+"""Chat latency during a login storm: inline bcrypt vs the process pool
+
+Two in-process mini apps share the same shape: a login route doing one
+bcrypt check and a chat route awaiting a latency-injecting fake model. A
+steady stream of chat requests is measured while a burst of logins runs.
+With bcrypt inline the logins saturate the threadpool and hold the GIL;
+with the pool, chat p99 should stay close to the model latency.
+
+    python -m bench.login_storm --logins 64 --chats 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt #type: ignore
+import httpx #type: ignore
+from fastapi import FastAPI #type: ignore
+from core import gemini, security
+from core.fake_gemini import FakeGeminiModel
+
+HASHED = bcrypt.hashpw(b"correct horse", bcrypt.gensalt())
+
+def build_app(pooled: bool) -> FastAPI:
+    app = FastAPI()
+
+    if pooled:
+        @app.post("/login")
+        async def login():
+            return {"ok": await security.verify_password("correct horse", HASHED)}
+    else:
+        @app.post("/login")
+        def login():
+            return {"ok": bcrypt.checkpw(b"correct horse", HASHED)}
+
+    @app.post("/chat")
+    async def chat(payload: dict):
+        return {"response": await gemini.agenerate_response(payload["message"], use_cache=False)}
+
+    return app
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+async def run(pooled: bool, logins: int, chats: int, interval: float):
+    transport = httpx.ASGITransport(app=build_app(pooled))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one_chat(i: int) -> float:
+            start = time.perf_counter()
+            await client.post("/chat", json={"message": f"User: hello {i}\nBot:"})
+            return (time.perf_counter() - start) * 1000
+
+        async def chat_stream() -> list:
+            tasks = []
+            for i in range(chats):
+                tasks.append(asyncio.create_task(one_chat(i)))
+                await asyncio.sleep(interval)
+            return await asyncio.gather(*tasks)
+
+        storm = [client.post("/login") for _ in range(logins)]
+        start = time.perf_counter()
+        results = await asyncio.gather(chat_stream(), *storm, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+    latencies = results[0]
+    shed = sum(1 for r in results[1:] if not isinstance(r, Exception) and r.status_code == 503)
+    label = "pool" if pooled else "inline"
+    print(f"{label:<7} chat p50 {statistics.median(latencies):7.1f} ms  p99 {percentile(latencies, 0.99):7.1f} ms  "
+          f"wall {elapsed:5.2f} s  logins shed {shed}")
+
+async def main(logins: int, chats: int, interval: float, latency: float):
+    gemini.set_model(FakeGeminiModel(first_chunk_delay=latency))
+    await run(False, logins, chats, interval)
+    await run(True, logins, chats, interval)
+    security.shutdown_password_pool()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between chat requests")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.chats, args.interval, args.latency))
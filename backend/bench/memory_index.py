@@ -0,0 +1,77 @@
+"""Build time, memory and query latency of the per-user memory index
+
+Fills a VectorIndex with synthetic unit vectors and reports, per size:
+build time, bytes held (the matrix alone and everything tracemalloc sees,
+payloads included), and the latency of single and batched top-k queries.
+Also times the hashing embedder, which is what GEMINI_FAKE runs use.
+
+    python -m bench.memory_index --sizes 1000 10000 100000 --dim 256
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np #type: ignore
+from core.embeddings import HashingEmbedder, normalize
+from core.vector_index import VectorIndex
+
+def median_us(call, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+def bench_index(size: int, dim: int, k: int, batch: int, repeats: int):
+    rng = np.random.default_rng(0)
+    vectors = normalize(rng.standard_normal((size, dim), dtype=np.float32))
+    payloads = [("user", f"message {i} " + "some chat text " * 4) for i in range(size)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = VectorIndex(dim)
+    # Added in chunks like remember() does, so growth is part of the cost
+    for i in range(0, size, 100):
+        index.add(vectors[i:i + 100], payloads[i:i + 100])
+    build_ms = (time.perf_counter() - start) * 1e3
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    queries = normalize(rng.standard_normal((batch, dim), dtype=np.float32))
+    single = median_us(lambda: index.search(queries[:1], k), repeats)
+    batched = median_us(lambda: index.search(queries, k), repeats)
+    print(f"{size:>8} {build_ms:>10.1f} {index.nbytes / 2**20:>11.1f} {traced / 2**20:>11.1f} "
+          f"{single:>11.1f} {batched / batch:>13.1f}")
+
+def bench_embedder(dim: int, count: int):
+    embedder = HashingEmbedder(dim)
+    texts = [f"message {i} about a trip to Japan and rail passes in spring" for i in range(count)]
+    start = time.perf_counter()
+    embedder.embed(texts)
+    elapsed = time.perf_counter() - start
+    print(f"hashing embedder: {count / elapsed:,.0f} texts/s ({dim} dims)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=32, help="queries per batched search")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'vectors':>8} {'build (ms)':>10} {'matrix (MB)':>11} {'traced (MB)':>11} "
+          f"{'query (us)':>11} {'batched/q (us)':>13}")
+    for size in args.sizes:
+        bench_index(size, args.dim, args.k, args.batch, args.repeats)
+    bench_embedder(args.dim, 2000)
+
+if __name__ == "__main__":
+    main()
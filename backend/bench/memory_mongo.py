@@ -0,0 +1,117 @@
+"""In-memory stand-in for the async MongoDB database, for benchmarks only
+
+Wraps mongomock (pip install -r bench/requirements.txt) in the async
+interface of pymongo's AsyncDatabase/AsyncCollection, covering the calls the
+app makes. Every call completes synchronously, so results measure the app's
+own overhead rather than database latency.
+"""
+from pymongo import ReturnDocument #type: ignore
+from pymongo.errors import BulkWriteError, DuplicateKeyError #type: ignore
+
+try:
+    import mongomock #type: ignore
+except ImportError:  # pragma: no cover
+    mongomock = None
+
+class MemoryCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, count: int):
+        self._cursor = self._cursor.limit(count)
+        return self
+
+    def skip(self, count: int):
+        self._cursor = self._cursor.skip(count)
+        return self
+
+    async def to_list(self, length=None):
+        docs = list(self._cursor)
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._cursor:
+            yield doc
+
+class MemoryCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return MemoryCursor(self._collection.find(*args, **kwargs))
+
+    async def find_one_and_update(self, filter, update, projection=None, return_document=ReturnDocument.BEFORE, **kwargs):
+        if return_document != ReturnDocument.AFTER or kwargs.get("upsert"):
+            return self._collection.find_one_and_update(filter, update, projection, return_document=return_document, **kwargs)
+        # mongomock looks the updated document up by `filter` again, which
+        # misses when the update changed a filtered field; MongoDB does not
+        before = self._collection.find_one_and_update(filter, update, {"_id": 1}, **kwargs)
+        return None if before is None else self._collection.find_one({"_id": before["_id"]}, projection)
+
+    async def aggregate(self, *args, **kwargs):
+        return MemoryCursor(self._collection.aggregate(*args, **kwargs))
+
+    async def bulk_write(self, requests, ordered: bool = True, **kwargs):
+        # mongomock cannot execute pymongo's operation objects, so replay them one by one
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                self._apply(request)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(requests) - len(errors)})
+
+    def _apply(self, request):
+        kind = type(request).__name__
+        if kind == "InsertOne":
+            self._collection.insert_one(request._doc)
+        elif kind == "UpdateOne":
+            self._collection.update_one(request._filter, request._doc, upsert=request._upsert)
+        elif kind == "UpdateMany":
+            self._collection.update_many(request._filter, request._doc, upsert=request._upsert)
+        elif kind == "ReplaceOne":
+            self._collection.replace_one(request._filter, request._doc, upsert=request._upsert)
+        elif kind == "DeleteOne":
+            self._collection.delete_one(request._filter)
+        elif kind == "DeleteMany":
+            self._collection.delete_many(request._filter)
+        else:
+            raise NotImplementedError(kind)
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+class MemoryDatabase:
+    def __init__(self, name: str = "bench"):
+        if mongomock is None:
+            raise RuntimeError("The in-memory database needs mongomock: pip install -r bench/requirements.txt")
+        self._db = mongomock.MongoClient()[name]
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self._db[name])
+        return self._collections[name]
+
+    async def command(self, command, *args, **kwargs):
+        if command != "ping":
+            raise NotImplementedError(command)
+        return {"ok": 1.0}
+
+    def sync(self):
+        """The underlying mongomock database, for sync callers"""
+        return self._db
@@ -0,0 +1,126 @@
+"""Latency seen by quiet users while one user floods send_message
+
+Runs the app in-process (SQLite in a temporary directory, fake model with
+fixed latency and a small Gemini concurrency cap standing in for a shared
+quota) twice, with admission control off and on. In each run one noisy
+user keeps `--noisy-concurrency` requests in flight, retrying refused ones
+almost immediately, while each quiet user sends a message every
+`--quiet-interval` seconds. Reports quiet-user latency and how many
+requests each side got through or had refused.
+
+    python -m bench.noisy_neighbour --duration 10 --noisy-concurrency 32 --quiet-users 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ["GEMINI_FAKE"] = "1"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx #type: ignore
+
+PASSWORD = "bench-password"
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+async def login(client, username: str) -> tuple:
+    await client.post("/api/signup", json={"username": username, "password": PASSWORD})
+    user = (await client.post("/api/login", json={"username": username, "password": PASSWORD})).json()
+    headers = {"Authorization": f"Bearer {user['token']}"}
+    chat = (await client.post("/api/new_chat", json={"user_id": user["user_id"]}, headers=headers)).json()
+    return user["user_id"], chat["chat_id"], headers
+
+async def send(client, user: tuple, text: str) -> int:
+    user_id, chat_id, headers = user
+    response = await client.post("/api/send_message", headers=headers, json={
+        "user_id": user_id, "chat_id": chat_id, "message": text, "bypass_cache": True
+    })
+    return response.status_code
+
+async def run(args, admission: bool) -> dict:
+    from core.config import settings
+    from core.storage import set_storage
+    import server
+
+    settings.ADMISSION_ENABLED = admission
+    settings.SQLITE_PATH = os.path.join(tempfile.mkdtemp(prefix="noisy_neighbour"), "chatbot.db")
+    set_storage(None)  # the previous run closed it
+    app = server.create_app()
+    stats = {"quiet_ms": [], "quiet_refused": 0, "noisy_ok": 0, "noisy_refused": 0}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            noisy = await login(client, f"noisy-{admission}")
+            quiet = [await login(client, f"quiet-{admission}-{i}") for i in range(args.quiet_users)]
+            deadline = time.perf_counter() + args.duration
+
+            async def flood(worker: int):
+                turn = 0
+                while time.perf_counter() < deadline:
+                    turn += 1
+                    if await send(client, noisy, f"flood {worker} {turn}") == 200:
+                        stats["noisy_ok"] += 1
+                    else:
+                        stats["noisy_refused"] += 1
+                        await asyncio.sleep(0.005)
+
+            async def chat(user: tuple, index: int):
+                turn = 0
+                # Staggered so the quiet users don't arrive in lockstep
+                await asyncio.sleep(index * args.quiet_interval / len(quiet))
+                while time.perf_counter() < deadline:
+                    turn += 1
+                    start = time.perf_counter()
+                    status = await send(client, user, f"question {index} {turn}")
+                    if status == 200:
+                        stats["quiet_ms"].append((time.perf_counter() - start) * 1000)
+                    else:
+                        stats["quiet_refused"] += 1
+                    await asyncio.sleep(max(0.0, args.quiet_interval - (time.perf_counter() - start)))
+
+            await asyncio.gather(
+                *(flood(i) for i in range(args.noisy_concurrency)),
+                *(chat(user, i) for i, user in enumerate(quiet))
+            )
+    return stats
+
+async def compare(args):
+    from core import gemini
+    from core.config import settings
+    from core.fake_gemini import FakeGeminiModel
+
+    settings.STORAGE_BACKEND = "sqlite"
+    settings.ADMISSION_MAX_CONCURRENCY = args.gemini_concurrency
+    gemini.set_model(FakeGeminiModel(first_chunk_delay=args.model_latency / 1000))
+    print(f"{'admission':<10}{'quiet p50 ms':>13}{'p95 ms':>9}{'p99 ms':>9}{'quiet ok':>10}{'quiet 429':>10}{'noisy ok':>10}{'noisy 429':>10}")
+    for admission in (False, True):
+        stats = await run(args, admission)
+        quiet = stats["quiet_ms"] or [0.0]
+        print(f"{'on' if admission else 'off':<10}{statistics.median(quiet):>13.0f}{percentile(quiet, 0.95):>9.0f}"
+              f"{percentile(quiet, 0.99):>9.0f}{len(stats['quiet_ms']):>10}{stats['quiet_refused']:>10}"
+              f"{stats['noisy_ok']:>10}{stats['noisy_refused']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--noisy-concurrency", type=int, default=32)
+    parser.add_argument("--quiet-users", type=int, default=4)
+    parser.add_argument("--quiet-interval", type=float, default=1.0, help="seconds between a quiet user's messages")
+    parser.add_argument("--model-latency", type=float, default=200, help="fake model latency, ms")
+    parser.add_argument("--gemini-concurrency", type=int, default=8, help="concurrent model calls allowed")
+    args = parser.parse_args()
+
+    # Read when core.gemini builds its policy
+    os.environ["GEMINI_MAX_CONCURRENCY"] = str(args.gemini_concurrency)
+    asyncio.run(compare(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Per-turn prompt assembly cost against chat length
+
+Simulates a conversation and times the prompt work of one more turn at
+several chat lengths:
+
+- concat: the original approach, `history += ...` over every message
+- window: build_prompt over the recent window, re-rendered every turn
+- prefix: PromptPrefix, extended with the new exchange and reused
+
+First checks that no message is lost between the rolling summary and the
+verbatim turns while the summary lags behind, as it does between refreshes,
+and that a chat's cached prefix (in a temporary SQLite database) keeps up
+across seq gaps.
+
+    python -m bench.prompt_prefix --lengths 10 100 1000 10000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import settings
+from core.storage import get_storage
+from services import chat_store
+from services.prompt_builder import PromptPrefix, build_prompt, chat_prompt_prefix, summary_is_stale
+
+SUMMARY = "The user is planning a trip to Japan in spring and asked about rail passes. " * 3
+
+def concat_prompt(history: list, message: str) -> str:
+    prompt = ""
+    for msg in history:
+        prompt += f"{msg['sender'].capitalize()}: {msg['message']}\n"
+    return f"{prompt}User: {message}\nBot:"
+
+def make_history(length: int) -> list:
+    return [
+        {"sender": "user" if i % 2 == 0 else "bot", "message": f"turn {i} " + "some chat text " * 12}
+        for i in range(length)
+    ]
+
+def per_turn_us(step, turns: int) -> float:
+    """Median microseconds of `step(turn)` over `turns` turns"""
+    samples = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        step(turn)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+def check_coverage(turns: int = 200):
+    """Every message is either folded into the summary or sent verbatim, at every turn
+
+    Summary refreshes are triggered as the routes trigger them and land
+    SUMMARY_REFRESH_TURNS turns later, the slowest refresh the prompt window
+    allows for.
+    """
+    budget, settings.PROMPT_TOKEN_BUDGET = settings.PROMPT_TOKEN_BUDGET, 10 ** 9
+    try:
+        prefix, history = PromptPrefix(), []
+        summary_upto, pending = 0, None
+        for turn in range(turns):
+            if pending is not None and turn >= pending[0]:
+                summary_upto, pending = pending[1], None
+            chat = {"message_count": len(history), "summary_upto": summary_upto}
+            for prompt in (
+                prefix.build("next", "summary", summary_upto=summary_upto),
+                build_prompt(history, "next", "summary", summary_upto=summary_upto),
+            ):
+                missing = [seq for seq in range(summary_upto, len(history)) if f"[seq {seq}]" not in prompt]
+                assert not missing, f"turn {turn}: messages {missing} are neither summarized nor in the prompt"
+            exchange = [{"sender": "user", "message": f"[seq {len(history)}]"}, {"sender": "bot", "message": f"[seq {len(history) + 1}]"}]
+            history += exchange
+            prefix.extend(exchange)
+            if pending is None and summary_is_stale({**chat, "message_count": len(history)}):
+                pending = (turn + settings.SUMMARY_REFRESH_TURNS, len(history) - settings.PROMPT_RECENT_TURNS * 2)
+    finally:
+        settings.PROMPT_TOKEN_BUDGET = budget
+    print(f"coverage: ok ({turns} turns, no message dropped between summary and verbatim turns)")
+
+def exchange(first_seq: int) -> list:
+    """A user/bot pair whose texts name the seqs they are stored at"""
+    return [{"sender": sender, "message": f"[seq {first_seq + i}]", "timestamp": "2025-01-01T00:00:00"}
+            for i, sender in enumerate(("user", "bot"))]
+
+async def expect_in_prompt(chat_id: str, seqs: list):
+    prompt = (await chat_prompt_prefix(chat_id)).build("next")
+    missing = [seq for seq in seqs if f"[seq {seq}]" not in prompt]
+    assert not missing, f"messages {missing} are stored but missing from the prompt"
+
+async def check_gaps():
+    """Messages after a seq gap reach the cached prefix, and so does one that lands in the gap later
+
+    A gap is a reservation whose messages are not stored, or not yet: a
+    slower concurrent writer.
+    """
+    settings.STORAGE_BACKEND = "sqlite"
+    settings.SQLITE_PATH = os.path.join(tempfile.mkdtemp(prefix="prompt_prefix"), "chatbot.db")
+    storage = get_storage()
+    await storage.ensure_schema()
+    try:
+        user_id = "bench-user"
+        chat_id = (await chat_store.create_chat(user_id, "gaps"))["chat_id"]
+        await chat_store.append_messages(user_id, chat_id, exchange(0))
+        await chat_prompt_prefix(chat_id)
+        gap = await chat_store.reserve_seqs(chat_id, 2)
+        await chat_store.append_messages(user_id, chat_id, exchange(4))
+        await expect_in_prompt(chat_id, [0, 1, 4, 5])
+        # The slow writer stores its exchange
+        await chat_store.insert_messages_bulk([{"chat_id": chat_id, "seq": gap + i, **msg} for i, msg in enumerate(exchange(gap))])
+        await expect_in_prompt(chat_id, [0, 1, 2, 3, 4, 5])
+    finally:
+        await storage.close()
+    print("gaps: ok (messages after and inside a seq gap reach the prompt)")
+
+def main(lengths: list, turns: int):
+    check_coverage()
+    asyncio.run(check_gaps())
+    window = settings.PROMPT_RECENT_TURNS * 2
+    print(f"{'messages':>9} {'concat (us)':>12} {'window (us)':>12} {'prefix (us)':>12}")
+    for length in lengths:
+        history = make_history(length)
+        exchange = make_history(2)
+
+        def concat(turn):
+            concat_prompt(history, f"question {turn}")
+
+        def windowed(turn):
+            build_prompt(history[-window:], f"question {turn}", SUMMARY)
+
+        prefix = PromptPrefix()
+        prefix.extend(history)
+
+        def incremental(turn):
+            prefix.extend(exchange)
+            prefix.build(f"question {turn}", SUMMARY)
+
+        print(f"{length:>9} {per_turn_us(concat, turns):>12.1f} {per_turn_us(windowed, turns):>12.1f} {per_turn_us(incremental, turns):>12.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--turns", type=int, default=200, help="turns timed per length")
+    args = parser.parse_args()
+    main(args.lengths, args.turns)
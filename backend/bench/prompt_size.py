@@ -0,0 +1,43 @@
+"""Prompt size against chat length: unbounded history vs the budgeted builder
+
+    python -m bench.prompt_size --lengths 10 100 1000 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.prompt_builder import build_prompt, estimate_tokens
+
+SUMMARY = "The user is planning a trip to Japan in spring and asked about rail passes. " * 3
+
+def unbounded_prompt(history: list, message: str) -> str:
+    """The previous behaviour: every message, verbatim"""
+    prompt = ""
+    for msg in history:
+        prompt += f"{msg['sender'].capitalize()}: {msg['message']}\n"
+    return f"{prompt}User: {message}\nBot:"
+
+def make_history(length: int) -> list:
+    return [
+        {"sender": "user" if i % 2 == 0 else "bot", "message": f"turn {i} " + "some chat text " * 12}
+        for i in range(length)
+    ]
+
+def main(lengths: list):
+    print(f"{'messages':>9} {'unbounded tok':>14} {'budgeted tok':>13} {'build (ms)':>11}")
+    for length in lengths:
+        history = make_history(length)
+        before = unbounded_prompt(history, "next question")
+        start = time.perf_counter()
+        after = build_prompt(history, "next question", SUMMARY if length > 20 else None)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{length:>9} {estimate_tokens(before):>14} {estimate_tokens(after):>13} {elapsed:>11.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    main(parser.parse_args().lengths)
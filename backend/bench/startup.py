@@ -0,0 +1,79 @@
+"""Worker startup time: module import, app factory and lifespan, each in a fresh interpreter
+
+Every run spawns a new Python process that imports `server`, builds an app
+with create_app() and runs its lifespan startup, timing each step. The
+google-genai SDK import is timed separately, because it is what the lazy
+import keeps off the startup path. The in-memory database is used unless
+--mongo-uri is given (then --warmup also measures the first round trip).
+
+    python -m bench.startup --runs 5 [--warmup] [--mongo-uri mongodb://localhost:27017]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+from core import mongo
+if not MONGO_URI:
+    from bench.memory_mongo import MemoryDatabase
+    memory = MemoryDatabase()
+    mongo.set_db(database=memory.sync(), async_database=memory)
+app = server.create_app()
+built = time.perf_counter()
+
+async def main():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        print(json.dumps({
+            "import_ms": (imported - start) * 1000,
+            "create_app_ms": (built - imported) * 1000,
+            "lifespan_ms": (ready - built) * 1000,
+            "total_ms": (ready - start) * 1000,
+            "genai_loaded": "google.genai" in sys.modules,
+        }))
+asyncio.run(main())
+"""
+
+GENAI_PROBE = r"""
+import json, time
+start = time.perf_counter()
+from google import genai
+print(json.dumps({"genai_import_ms": (time.perf_counter() - start) * 1000}))
+"""
+
+def probe(code: str, env: dict) -> dict:
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=BACKEND, env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="enable STARTUP_WARMUP")
+    parser.add_argument("--mongo-uri", default="")
+    args = parser.parse_args()
+
+    env = dict(os.environ, GEMINI_FAKE="1", LOG_LEVEL="WARNING", STARTUP_WARMUP="1" if args.warmup else "0")
+    if args.mongo_uri:
+        env["MONGO_API_KEY"] = args.mongo_uri
+    code = f"MONGO_URI = {args.mongo_uri!r}\n" + PROBE
+
+    runs = [probe(code, env) for _ in range(args.runs)]
+    for key in ("import_ms", "create_app_ms", "lifespan_ms", "total_ms"):
+        values = [run[key] for run in runs]
+        print(f"{key:<15} median {statistics.median(values):8.1f}   min {min(values):8.1f}   max {max(values):8.1f}")
+    print(f"google.genai imported at startup: {any(run['genai_loaded'] for run in runs)}")
+
+    genai = [probe(GENAI_PROBE, env)["genai_import_ms"] for _ in range(args.runs)]
+    print(f"google.genai import on its own: median {statistics.median(genai):.1f} ms (deferred to first real model use)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Conformance checks and a micro-benchmark shared by every storage backend
+
+Runs the same scenario against each selected backend: first a set of
+behavioural checks (ownership, sequencing, idempotent inserts, summary
+compare-and-set, pagination, deletes), then timings of the calls on the
+request path. A backend that fails a check is reported and skipped.
+
+    python -m bench.storage_suite --backends sqlite mongo-memory [--mongo-uri mongodb://localhost:27017]
+
+mongo-memory needs `pip install -r bench/requirements.txt`; sqlite uses a
+temporary file.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import mongo
+from core.config import settings
+from core.mongo_storage import MongoStorage
+from core.sqlite_storage import SQLiteStorage
+
+def message(seq: int, chat_id: str) -> dict:
+    return {"chat_id": chat_id, "seq": seq, "sender": "user" if seq % 2 == 0 else "bot",
+            "message": f"message {seq}", "timestamp": "2025-01-01T00:00:00"}
+
+def new_chat(user_id: str) -> dict:
+    return {"chat_id": str(uuid4()), "user_id": user_id, "title": "New Chat",
+            "created_at": datetime.utcnow().isoformat(), "message_count": 0}
+
+def check(condition: bool, description: str):
+    if not condition:
+        raise AssertionError(description)
+
+async def conformance(storage):
+    """Raise AssertionError on the first behaviour that differs from the contract"""
+    await storage.ensure_schema()
+    await storage.ensure_schema()  # idempotent
+
+    # Users
+    username = f"user-{uuid4().hex[:8]}"
+    user_id = await storage.create_user(username, b"hash")
+    found = await storage.find_user(username)
+    check(found == {"user_id": user_id, "username": username, "password": b"hash"}, "find_user returns the stored user")
+    check(await storage.find_user("missing-" + username) is None, "find_user returns None for unknown users")
+
+    # Chats
+    first, second = new_chat(user_id), new_chat(user_id)
+    second["created_at"] = first["created_at"] + "1"
+    await storage.insert_chat(first)
+    await storage.insert_chat(second)
+    listed = await storage.list_chats(user_id)
+    check([c["chat_id"] for c in listed] == [first["chat_id"], second["chat_id"]], "list_chats is oldest first")
+    check(set(listed[0]) == {"chat_id", "title", "created_at"}, "list_chats returns summaries only")
+    chat = await storage.get_chat(first["chat_id"])
+    check(chat["user_id"] == user_id and chat["message_count"] == 0 and chat.get("version", 0) == 0, "get_chat returns metadata")
+    check("summary" not in chat and "summary_upto" not in chat, "chats without a summary have no summary fields")
+    check(await storage.get_chat(str(uuid4())) is None, "get_chat returns None for unknown chats")
+
+    # Sequencing
+    chat_id = first["chat_id"]
+    check(await storage.reserve_seqs(chat_id, 2) == 0, "first reservation starts at 0")
+    check(await storage.reserve_seqs(chat_id, 3, user_id) == 2, "reservations are consecutive")
+    check(await storage.reserve_seqs(chat_id, 1, "someone-else") is None, "reserve_seqs checks the owner")
+    check(await storage.reserve_seqs(str(uuid4()), 1) is None, "reserve_seqs returns None for unknown chats")
+    check((await storage.get_chat(chat_id))["message_count"] == 5, "message_count tracks reservations")
+
+    # Messages
+    docs = [message(seq, chat_id) for seq in range(5)]
+    version = lambda chat: chat.get("version", 0)
+    before = version(await storage.get_chat(chat_id))
+    await storage.insert_messages(docs[:3])
+    after = version(await storage.get_chat(chat_id))
+    check(after > before, "inserting messages bumps the chat version")
+    check(await storage.chat_version(chat_id) == after, "chat_version matches get_chat")
+    check(await storage.chat_version(str(uuid4())) is None, "chat_version returns None for unknown chats")
+    check(version(await storage.get_chat(second["chat_id"])) == 0, "other chats keep their version")
+    await storage.insert_messages(docs)  # retried batch: the first three are duplicates
+    recent = await storage.recent_messages(chat_id, 2)
+    check([m["seq"] for m in recent] == [3, 4], "recent_messages returns the newest, oldest first")
+    check(set(recent[0]) == {"seq", "sender", "message", "timestamp"}, "messages carry seq and content only")
+    check([m["seq"] for m in await storage.messages_before(chat_id, 3, 2)] == [1, 2], "messages_before pages backwards")
+    check([m["seq"] for m in await storage.message_range(chat_id, 1, 4)] == [1, 2, 3], "message_range is half-open")
+    check(await storage.recent_messages(second["chat_id"], 5) == [], "other chats are unaffected")
+
+    # Giving back seqs after a failed insert
+    check(await storage.release_seqs(chat_id, await storage.reserve_seqs(chat_id, 2), 2), "an unused latest reservation is released")
+    check((await storage.get_chat(chat_id))["message_count"] == 5, "release resets message_count")
+    check(not await storage.release_seqs(chat_id, 5, 2), "a reservation is released once")
+    await storage.reserve_seqs(chat_id, 2)
+    await storage.reserve_seqs(chat_id, 1)
+    check(not await storage.release_seqs(chat_id, 5, 2), "a reservation followed by another is kept")
+    check(await storage.release_seqs(chat_id, 7, 1) and await storage.release_seqs(chat_id, 5, 2), "releases unwind newest first")
+    await storage.insert_messages([message(await storage.reserve_seqs(chat_id, 2), chat_id)])
+    check(not await storage.release_seqs(chat_id, 5, 2), "a reservation with a stored message is kept")
+    check((await storage.get_chat(chat_id))["message_count"] == 7, "a refused release changes nothing")
+
+    # Summary compare-and-set
+    check(await storage.update_summary(chat_id, "s1", 2, 0), "first summary applies")
+    check(not await storage.update_summary(chat_id, "stale", 4, 0), "stale expected_upto is rejected")
+    check(await storage.update_summary(chat_id, "s2", 4, 2), "summary advances from the expected point")
+    chat = await storage.get_chat(chat_id)
+    check((chat["summary"], chat["summary_upto"]) == ("s2", 4), "summary is stored")
+
+    # Rename and delete
+    before = version(await storage.get_chat(chat_id))
+    check(await storage.rename_chat(user_id, chat_id, "Renamed"), "rename applies")
+    after = version(await storage.get_chat(chat_id))
+    check(after > before, "rename bumps the chat version")
+    check(not await storage.rename_chat(user_id, chat_id, "Renamed"), "renaming to the same title changes nothing")
+    check(version(await storage.get_chat(chat_id)) == after, "a no-op rename keeps the version")
+    check(await storage.chat_version(chat_id) == after, "chat_version follows renames")
+    check(not await storage.rename_chat("someone-else", chat_id, "Nope"), "rename checks the owner")
+    check(not await storage.delete_chat("someone-else", chat_id), "delete checks the owner")
+    check(await storage.delete_chat(user_id, chat_id), "delete applies")
+    check(await storage.get_chat(chat_id) is None and await storage.recent_messages(chat_id, 5) == [], "delete removes messages")
+    check(not await storage.delete_chat(user_id, chat_id), "deleting twice reports False")
+
+    # Flat records
+    records = [{"user_id": user_id, "user_input": f"q{i}", "bot_reply": f"a{i}"} for i in range(3)]
+    await storage.insert_flat_records(records[:2])
+    await storage.insert_flat_records(records)  # retry with the same dicts
+    flat = await storage.recent_flat_records(user_id, 2)
+    check([r["user_input"] for r in flat] == ["q1", "q2"], "recent_flat_records returns the newest, oldest first, once each")
+
+    # Memories
+    remembered = new_chat(user_id)
+    await storage.insert_chat(remembered)
+    memories = [
+        {"memory_id": uuid4().hex, "user_id": user_id, "chat_id": remembered["chat_id"], "sender": "user", "message": "m0", "vector": b"\x00" * 8},
+        {"memory_id": uuid4().hex, "user_id": user_id, "sender": "bot", "message": "m1", "vector": b"\x01" * 8},
+        {"memory_id": uuid4().hex, "user_id": user_id, "chat_id": remembered["chat_id"], "sender": "bot", "message": "m2", "vector": b"\x02" * 8},
+    ]
+    await storage.insert_memories(memories[:2])
+    await storage.insert_memories(memories)  # retried batch
+    loaded = await storage.load_memories(user_id, 10)
+    check([m["message"] for m in loaded] == ["m0", "m1", "m2"], "load_memories returns each record once, oldest first")
+    check(loaded[1] == memories[1] and loaded[0]["vector"] == b"\x00" * 8, "memories round-trip, without chat_id when unset")
+    check([m["message"] for m in await storage.load_memories(user_id, 2)] == ["m1", "m2"], "load_memories keeps the newest")
+    await storage.delete_chat(user_id, remembered["chat_id"])
+    check([m["message"] for m in await storage.load_memories(user_id, 10)] == ["m1"], "deleting a chat deletes its memories")
+
+    # Batch results
+    batch_id = uuid4().hex
+    await storage.save_batch_results(user_id, batch_id, [{"item_id": "a", "response": "r1", "chat_id": "c"}], 60)
+    await storage.save_batch_results(user_id, batch_id, [{"item_id": "a", "response": "changed"}, {"item_id": "b", "response": "r2"}], 60)
+    saved = await storage.get_batch_results(user_id, batch_id)
+    check(saved == {"a": {"item_id": "a", "response": "r1", "chat_id": "c"}, "b": {"item_id": "b", "response": "r2"}},
+          "batch results are stored once, first write wins")
+    check(await storage.get_batch_results("someone-else", batch_id) == {}, "batch results are per user")
+    await storage.save_batch_results(user_id, "expired", [{"item_id": "a", "response": "r"}], -1)
+    check(await storage.get_batch_results(user_id, "expired") == {}, "expired batch results are not returned")
+
+    # Jobs
+    kind, now = f"kind-{uuid4().hex[:8]}", time.time()
+    job = lambda run_at, **extra: {"job_id": uuid4().hex, "kind": kind, "user_id": user_id, "run_at": run_at, **extra}
+    first_job = job(now - 2, chat_id="c1", payload={"n": 1})
+    check(await storage.enqueue_job(first_job, "title:c1"), "enqueue_job inserts")
+    check(not await storage.enqueue_job(job(now), "title:c1"), "an active dedupe key is not enqueued twice")
+    second_job, later_job = job(now - 1), job(now + 3600)
+    await storage.enqueue_job(second_job)
+    await storage.enqueue_job(later_job)
+    claimed = await storage.claim_jobs(kind, 10, 60)
+    check([j["job_id"] for j in claimed] == [first_job["job_id"], second_job["job_id"]], "claim_jobs returns due jobs, oldest first")
+    check(claimed[0]["payload"] == {"n": 1} and claimed[0]["chat_id"] == "c1" and claimed[0]["attempts"] == 1
+          and claimed[0]["status"] == "running", "claimed jobs carry their payload and count the attempt")
+    check(await storage.claim_jobs(kind, 10, 60) == [], "leased jobs are not claimed again")
+    check(await storage.claim_jobs(f"other-{kind}", 10, 60) == [], "claim_jobs filters by kind")
+    stats = await storage.job_stats()
+    check((stats["queued"], stats["running"]) == (1, 2) and stats["oldest_due"] is None, "job_stats counts by status")
+
+    await storage.finish_job(first_job["job_id"])
+    check(await storage.enqueue_job(job(now + 3600), "title:c1"), "finishing a job releases its dedupe key")
+    await storage.retry_job(second_job["job_id"], now - 1, "boom")
+    check((await storage.job_stats())["oldest_due"] == now - 1, "job_stats reports the oldest due job")
+    retried = await storage.claim_jobs(kind, 10, -1)  # lease already expired
+    check([(j["job_id"], j["attempts"], j["error"]) for j in retried] == [(second_job["job_id"], 2, "boom")], "retried jobs are claimed again")
+    check([j["attempts"] for j in await storage.claim_jobs(kind, 10, 60)] == [3], "jobs with an expired lease are reclaimed")
+    await storage.finish_job(second_job["job_id"], "gave up")
+    stats = await storage.job_stats()
+    check((stats["queued"], stats["running"], stats["done"], stats["failed"]) == (2, 0, 1, 1), "finished jobs are done or failed")
+    check(await storage.purge_jobs(time.time() + 1) == 2 and (await storage.job_stats())["queued"] == 2, "purge_jobs removes finished jobs only")
+
+async def timed(samples: dict, name: str, call):
+    start = time.perf_counter()
+    result = await call
+    samples.setdefault(name, []).append((time.perf_counter() - start) * 1e6)
+    return result
+
+async def benchmark(storage, chats: int, messages: int) -> dict:
+    samples = {}
+    user_id = await storage.create_user(f"bench-{uuid4().hex[:8]}", b"hash")
+    chat_ids = []
+    for _ in range(chats):
+        chat = new_chat(user_id)
+        await timed(samples, "insert_chat", storage.insert_chat(chat))
+        chat_ids.append(chat["chat_id"])
+
+    for i in range(0, messages, 2):
+        for chat_id in chat_ids:
+            first = await timed(samples, "reserve_seqs", storage.reserve_seqs(chat_id, 2, user_id))
+            await timed(samples, "insert_messages", storage.insert_messages([message(first, chat_id), message(first + 1, chat_id)]))
+
+    for chat_id in chat_ids:
+        for _ in range(20):
+            await timed(samples, "get_chat", storage.get_chat(chat_id))
+            await timed(samples, "recent_messages(20)", storage.recent_messages(chat_id, 20))
+            await timed(samples, "messages_before(50)", storage.messages_before(chat_id, messages // 2, 50))
+    for _ in range(50):
+        await timed(samples, "list_chats", storage.list_chats(user_id))
+    return samples
+
+def build(name: str, args, workdir: str):
+    if name == "sqlite":
+        return SQLiteStorage(os.path.join(workdir, "suite.db"))
+    if name == "mongo-memory":
+        from bench.memory_mongo import MemoryDatabase
+        memory = MemoryDatabase()
+        mongo.set_db(database=memory.sync(), async_database=memory)
+        return MongoStorage()
+    if name == "mongo":
+        # A throwaway database, dropped again at the end
+        settings.MONGODB_URI = args.mongo_uri
+        settings.MONGO_DATABASE = f"storage_suite_{uuid4().hex[:8]}"
+        return MongoStorage()
+    raise SystemExit(f"Unknown backend {name}")
+
+async def run_backend(name: str, args, workdir: str):
+    storage = build(name, args, workdir)
+    try:
+        await conformance(storage)
+        print(f"[{name}] conformance: ok")
+    except AssertionError as e:
+        print(f"[{name}] conformance FAILED: {e}")
+        await storage.close()
+        return
+    samples = await benchmark(storage, args.chats, args.messages)
+    for op, values in samples.items():
+        ordered = sorted(values)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        print(f"[{name}] {op:<22} n={len(values):<6} p50 {statistics.median(values):8.1f} us   p99 {p99:8.1f} us")
+    if name == "mongo":
+        database = mongo.get_async_db()
+        await database.client.drop_database(database.name)
+    await storage.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["sqlite", "mongo-memory"],
+                        choices=["sqlite", "mongo-memory", "mongo"])
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=200, help="messages per chat")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.backends:
+            asyncio.run(run_backend(name, args, workdir))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Per-message latency over one long-lived WebSocket versus the REST routes
+
+Starts the app under uvicorn on a local port (SQLite storage in a temporary
+directory, fake model with configurable latency), then sends the same
+number of messages to one chat through each path in turn:
+
+- rest: POST /api/send_message on a keep-alive connection
+- rest-stream: POST /api/send_message/stream, time to first chunk and to done
+- ws: /ws/chat/{chat_id}, one message at a time
+- ws-pipelined: all messages sent up front, each timed from its send to its done
+
+    python -m bench.ws_latency --messages 200 --model-latency 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+os.environ["GEMINI_FAKE"] = "1"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx #type: ignore
+import uvicorn #type: ignore
+from websockets.asyncio.client import connect #type: ignore
+
+PASSWORD = "bench-password"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def start_server(args, port: int) -> uvicorn.Server:
+    from core import gemini
+    from core.config import settings
+    from core.fake_gemini import FakeGeminiModel
+
+    settings.STORAGE_BACKEND = "sqlite"
+    settings.ADMISSION_ENABLED = False  # one user sends every message
+    settings.SQLITE_PATH = os.path.join(tempfile.mkdtemp(prefix="ws_latency"), "chatbot.db")
+    gemini.set_model(FakeGeminiModel(first_chunk_delay=args.model_latency / 1000, chunk_delay=args.chunk_latency / 1000))
+
+    from server import app
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws="websockets"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+async def setup(client: httpx.AsyncClient):
+    username = f"ws-bench-{os.getpid()}-{time.time_ns()}"
+    (await client.post("/api/signup", json={"username": username, "password": PASSWORD})).raise_for_status()
+    response = await client.post("/api/login", json={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    user_id, token = response.json()["user_id"], response.json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.post("/api/new_chat", headers=headers, json={"user_id": user_id})
+    return user_id, token, headers, response.json()["chat_id"]
+
+async def bench_rest(client, user_id, headers, chat_id, count) -> dict:
+    done = []
+    for i in range(count):
+        start = time.perf_counter()
+        response = await client.post("/api/send_message", headers=headers, json={
+            "user_id": user_id, "chat_id": chat_id, "message": f"rest {i}", "bypass_cache": True
+        })
+        response.raise_for_status()
+        done.append((time.perf_counter() - start) * 1000)
+    return {"done": done}
+
+async def bench_rest_stream(client, user_id, headers, chat_id, count) -> dict:
+    first, done = [], []
+    for i in range(count):
+        start = time.perf_counter()
+        async with client.stream("POST", "/api/send_message/stream", headers=headers, json={
+            "user_id": user_id, "chat_id": chat_id, "message": f"sse {i}", "bypass_cache": True
+        }) as response:
+            got_first = False
+            async for line in response.aiter_lines():
+                if not got_first and line.startswith("data:"):
+                    first.append((time.perf_counter() - start) * 1000)
+                    got_first = True
+        done.append((time.perf_counter() - start) * 1000)
+    return {"first_chunk": first, "done": done}
+
+async def bench_ws(url, token, count) -> dict:
+    first, done = [], []
+    async with connect(url) as ws:
+        await ws.send(json.dumps({"type": "auth", "token": token}))
+        json.loads(await ws.recv())  # ready
+        for i in range(count):
+            start = time.perf_counter()
+            await ws.send(json.dumps({"id": i, "message": f"ws {i}", "bypass_cache": True}))
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame["type"] == "chunk" and len(first) == i:
+                    first.append((time.perf_counter() - start) * 1000)
+                elif frame["type"] in ("done", "error"):
+                    done.append((time.perf_counter() - start) * 1000)
+                    break
+    return {"first_chunk": first, "done": done}
+
+async def bench_ws_pipelined(url, token, count) -> dict:
+    sent, done = {}, []
+    async with connect(url) as ws:
+        await ws.send(json.dumps({"type": "auth", "token": token}))
+        json.loads(await ws.recv())
+
+        async def send_all():
+            for i in range(count):
+                sent[i] = time.perf_counter()
+                await ws.send(json.dumps({"id": i, "message": f"pipelined {i}", "bypass_cache": True}))
+
+        sender = asyncio.create_task(send_all())
+        start = time.perf_counter()
+        while len(done) < count:
+            frame = json.loads(await ws.recv())
+            if frame["type"] in ("done", "error"):
+                done.append((time.perf_counter() - sent[frame["id"]]) * 1000)
+        elapsed = time.perf_counter() - start
+        await sender
+    return {"done": done, "throughput_per_s": [count / elapsed]}
+
+def report(name: str, results: dict):
+    for metric, samples in results.items():
+        if metric == "throughput_per_s":
+            print(f"{name:<13} {'throughput':<12} {samples[0]:8.1f} msg/s")
+            continue
+        print(f"{name:<13} {metric:<12} mean {statistics.mean(samples):7.2f} ms   p50 {percentile(samples, 0.5):7.2f} ms"
+              f"   p95 {percentile(samples, 0.95):7.2f} ms   p99 {percentile(samples, 0.99):7.2f} ms")
+
+async def run(args, port: int):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+        user_id, token, headers, chat_id = await setup(client)
+        url = f"ws://127.0.0.1:{port}/ws/chat/{chat_id}"
+        # One unmeasured round per path so connection setup and first-use costs are excluded
+        await bench_rest(client, user_id, headers, chat_id, 1)
+        await bench_ws(url, token, 1)
+
+        report("rest", await bench_rest(client, user_id, headers, chat_id, args.messages))
+        report("rest-stream", await bench_rest_stream(client, user_id, headers, chat_id, args.messages))
+        report("ws", await bench_ws(url, token, args.messages))
+        report("ws-pipelined", await bench_ws_pipelined(url, token, args.messages))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="fake model time to first chunk, ms")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="fake model delay between chunks, ms")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(args, port)
+    try:
+        asyncio.run(run(args, port))
+    finally:
+        server.should_exit = True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+from cachetools import TTLCache #type: ignore
+from collections import OrderedDict, deque
+from core import metrics
+from core.config import settings
+from core.exceptions import APIException, AuthenticationException
+from core.security import verify_session_token
+from starlette.responses import JSONResponse #type: ignore
+from typing import Deque, Optional
+import asyncio
+import math
+import time
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; a rate of 0 or less never limits"""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token, or return the seconds until one is available without taking it"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimitedException(APIException):
+    """Request refused by admission control; `retry_after` is in seconds"""
+    def __init__(self, message: str, reason: str, retry_after: float):
+        super().__init__(message, 429)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_seconds(self) -> int:
+        """retry_after rounded up to whole seconds, as Retry-After wants"""
+        return max(1, math.ceil(self.retry_after))
+
+class AdmissionController:
+    """Rate limits and a fair wait queue in front of a fixed number of request slots
+
+    Each user has a token bucket; running out is an immediate 429. Requests
+    within their rate take one of `max_concurrency` slots (and a token from
+    the global bucket), or wait. Waiting requests are queued per user and
+    served round-robin across users, so one user's backlog only delays
+    their own requests. A request whose expected wait is over `queue_slo`
+    is refused on arrival rather than after waiting it out, and one that
+    still waits that long is refused then. Work an admitted request fans
+    out (batch items) is paced with charge().
+
+    State is per process: with several workers each enforces its own limits.
+    """
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        max_queue_per_user: int,
+        queue_slo: float,
+        user_rate: float,
+        user_burst: float,
+        global_rate: float,
+        global_burst: float,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_slo = queue_slo
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        # An idle bucket is full again after burst / rate seconds, when
+        # dropping it changes nothing
+        self._buckets = TTLCache(maxsize=100_000, ttl=max(1.0, user_burst / user_rate) if user_rate > 0 else 1.0)
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.queued = 0
+        self.in_flight = 0
+        # Moving average of how long a request holds its slot, for wait estimates
+        self.service_time = 0.5
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _user_bucket(self, user: str) -> TokenBucket:
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            bucket = self._buckets[user] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def _expected_wait(self, user: str) -> float:
+        """Seconds a new request from `user` would wait under round-robin service"""
+        position = len(self._queues.get(user, ())) + 1
+        ahead = sum(min(len(queue), position) for other, queue in self._queues.items() if other != user)
+        return (ahead + position) * self.service_time / self.max_concurrency
+
+    def _update_gauges(self):
+        metrics.admission_queue_depth.set(self.queued)
+        metrics.admission_in_flight.set(self.in_flight)
+
+    async def acquire(self, user: str) -> float:
+        """Wait for a slot, returning the seconds waited; raise RateLimitedException if refused
+
+        Every acquire must be paired with a release() once the work is done.
+        """
+        try:
+            waited = await self._acquire(user)
+        except RateLimitedException as e:
+            metrics.admission_rejected.inc(reason=e.reason)
+            raise
+        metrics.admission_wait_duration.observe(waited)
+        return waited
+
+    async def charge(self, user: str):
+        """Take one more rate token for work inside an admitted request, waiting for it if need be
+
+        Waits rather than refusing, so a large batch proceeds at the user's
+        (and the global) rate instead of failing item by item.
+        """
+        for bucket in (self._user_bucket(user), self.global_bucket):
+            wait = bucket.take()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = bucket.take()
+
+    async def _acquire(self, user: str) -> float:
+        wait = self._user_bucket(user).take()
+        if wait > 0:
+            raise RateLimitedException("Too many requests, please slow down", "user_rate", wait)
+        if not self.queued and self.in_flight < self.max_concurrency and self.global_bucket.take() == 0:
+            self.in_flight += 1
+            self._update_gauges()
+            return 0.0
+
+        queue = self._queues.get(user)
+        if self.queued >= self.max_queue or (queue and len(queue) >= self.max_queue_per_user):
+            raise RateLimitedException("Server is busy, please retry shortly", "queue_full", self._expected_wait(user))
+        expected = self._expected_wait(user)
+        if expected > self.queue_slo:
+            raise RateLimitedException("Server is busy, please retry shortly", "slo", expected)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(waiter)
+        self.queued += 1
+        start = time.monotonic()
+        # Admits it now if only the global bucket held it back, else arms the refill timer
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_slo)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done():
+                # Granted just as the wait ended: hand the slot back
+                self.release(0.0)
+            else:
+                waiter.cancel()
+                self._remove(user, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise RateLimitedException("Server is busy, please retry shortly", "slo", self._expected_wait(user))
+            raise
+        return time.monotonic() - start
+
+    def _remove(self, user: str, waiter: asyncio.Future):
+        queue = self._queues.get(user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self._queues[user]
+        self._update_gauges()
+
+    def release(self, held: float):
+        """Free a slot held for `held` seconds and admit the next waiter"""
+        self.in_flight -= 1
+        self.service_time += 0.1 * (held - self.service_time)
+        self._dispatch()
+
+    def _dispatch(self):
+        self._timer = None
+        while self.queued and self.in_flight < self.max_concurrency:
+            wait = self.global_bucket.take()
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                break
+            # Round-robin: serve the first user's oldest request, then move them last
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self.in_flight += 1
+            waiter.set_result(None)
+        self._update_gauges()
+
+def build_controller() -> AdmissionController:
+    """A controller from the ADMISSION_* settings"""
+    return AdmissionController(
+        max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+        max_queue=settings.ADMISSION_MAX_QUEUE,
+        max_queue_per_user=settings.ADMISSION_MAX_QUEUE_PER_USER,
+        queue_slo=settings.ADMISSION_QUEUE_SLO,
+        user_rate=settings.ADMISSION_USER_RATE,
+        user_burst=settings.ADMISSION_USER_BURST,
+        global_rate=settings.ADMISSION_GLOBAL_RATE,
+        global_burst=settings.ADMISSION_GLOBAL_BURST,
+    )
+
+def _caller(scope: dict) -> str:
+    """The session's user id, or the client address for requests without a valid token"""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization" and value.startswith(b"Bearer "):
+            try:
+                return verify_session_token(value[len(b"Bearer "):].decode("latin-1"))
+            except AuthenticationException:
+                break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to the model-backed routes
+
+    Other routes (health, metrics, chat lists and history, auth) pass
+    straight through. A slot is held until the response has been sent in
+    full, so streamed replies count for as long as they stream. WebSocket
+    connections pass through too: api/ws.py admits each message itself.
+    """
+    def __init__(self, app, controller: Optional[AdmissionController] = None, paths: Optional[set] = None):
+        self.app = app
+        self.controller = controller or build_controller()
+        self.paths = paths if paths is not None else set(settings.ADMISSION_PATHS)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(_caller(scope))
+        except RateLimitedException as e:
+            response = JSONResponse(
+                status_code=e.status_code,
+                content={"error": e.message},
+                headers={"Retry-After": str(e.retry_seconds)}
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - start)
@@ -0,0 +1,249 @@
+from cachetools import TTLCache #type: ignore
+from datetime import datetime, timedelta
+from typing import List, Optional
+import hashlib
+import threading
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a key"""
+    return " ".join(prompt.split()).casefold()
+
+def cache_key(prompt: str, model_name: str) -> str:
+    normalized = normalize_prompt(prompt)
+    return hashlib.sha256(f"{model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+class SharedCacheBackend:
+    """Interface for a cache shared between worker processes"""
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: int):
+        raise NotImplementedError
+
+class MongoCacheBackend(SharedCacheBackend):
+    """Shared cache stored in MongoDB; expiry is handled by a TTL index on expires_at"""
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, key: str) -> Optional[str]:
+        doc = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.utcnow()}}, {"value": 1}
+        )
+        return doc["value"] if doc else None
+
+    async def set(self, key: str, value: str, ttl: int):
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+
+class ResponseCache:
+    """Size- and TTL-bounded in-process cache of model replies
+
+    An optional shared backend is consulted on local misses (async callers
+    only) and populated on every store, so workers can reuse each other's
+    replies.
+    """
+    def __init__(self, maxsize: int, ttl: int, shared: Optional[SharedCacheBackend] = None):
+        self.ttl = ttl
+        self.shared = shared
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._local.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._local[key] = value
+
+    async def aget(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._local.get(key)
+        if value is None and self.shared is not None:
+            value = await self.shared.get(key)
+            if value is not None:
+                self.set(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    async def aset(self, key: str, value: str):
+        self.set(key, value)
+        if self.shared is not None:
+            await self.shared.set(key, value, self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._local),
+                "maxsize": self._local.maxsize,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+def approx_size(value) -> int:
+    """Rough in-memory footprint of plain JSON-like data, in bytes"""
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(approx_size(v) for v in value)
+    return 28
+
+class _SizedTTLCache(TTLCache):
+    """TTLCache that counts capacity evictions"""
+    evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+class ChatCache:
+    """Memory-bounded LRU/TTL cache of chat metadata, chat lists and recent message windows
+
+    Entries are sized with approx_size and evicted least-recently-used once
+    `max_bytes` is reached. Writes made by this process update the cache
+    directly (see services/chat_store.py). Chat metadata and lists written
+    by other worker processes can lag by up to the TTL.
+
+    Windows hold the newest messages of a chat, with their `seq`, capped
+    at `window` messages. Each is tagged with the chat version it was
+    read at and is only served while storage still has that version, so
+    history is never stale, whichever process wrote it.
+    """
+    def __init__(self, max_bytes: int, ttl: int, window: int):
+        self.window = window
+        self._entries = _SizedTTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=approx_size)
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: tuple):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def _put(self, key: tuple, value):
+        try:
+            self._entries[key] = value
+        except ValueError:
+            # Larger than the whole cache
+            self._entries.pop(key, None)
+
+    def _drop(self, key: tuple):
+        self._entries.pop(key, None)
+
+    # Chat metadata
+    def get_chat(self, chat_id: str) -> Optional[dict]:
+        chat = self._get(("chat", chat_id))
+        return dict(chat) if chat is not None else None
+
+    def put_chat(self, chat: dict):
+        self._put(("chat", chat["chat_id"]), dict(chat))
+
+    def update_chat(self, chat_id: str, **fields):
+        chat = self._entries.get(("chat", chat_id))
+        if chat is not None:
+            self._put(("chat", chat_id), {**chat, **fields})
+
+    def bump_version(self, chat_id: str):
+        """Mirror a storage version bump made by this process in the cached chat and window"""
+        chat = self._entries.get(("chat", chat_id))
+        if chat is not None:
+            self._put(("chat", chat_id), {**chat, "version": chat.get("version", 0) + 1})
+        entry = self._entries.get(("window", chat_id))
+        if entry is not None:
+            self._put(("window", chat_id), (entry[0] + 1, entry[1]))
+
+    # Per-user chat lists
+    def get_chat_list(self, user_id: str) -> Optional[List[dict]]:
+        chats = self._get(("chats", user_id))
+        return [dict(c) for c in chats] if chats is not None else None
+
+    def put_chat_list(self, user_id: str, chats: List[dict]):
+        self._put(("chats", user_id), [dict(c) for c in chats])
+
+    def add_to_chat_list(self, user_id: str, summary: dict):
+        chats = self._entries.get(("chats", user_id))
+        if chats is not None:
+            self._put(("chats", user_id), chats + [dict(summary)])
+
+    def rename_in_chat_list(self, user_id: str, chat_id: str, title: str):
+        chats = self._entries.get(("chats", user_id))
+        if chats is not None:
+            self._put(("chats", user_id), [
+                {**c, "title": title} if c["chat_id"] == chat_id else c for c in chats
+            ])
+
+    # Recent message windows
+    def get_window(self, chat_id: str, version: Optional[int]) -> Optional[List[dict]]:
+        """Cached window, only if it was read at (or kept up to) the chat's stored `version`"""
+        entry = self._entries.get(("window", chat_id))
+        if entry is None or version is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put_window(self, chat_id: str, messages: List[dict], version: int):
+        """Cache messages read after the chat's version was read as `version`"""
+        self._put(("window", chat_id), (version, list(messages[-self.window:])))
+
+    def extend_window(self, chat_id: str, messages: List[dict]):
+        """Append newly stored messages; drop the window if they don't follow on directly
+
+        The caller bumps the version afterwards (see bump_version).
+        """
+        entry = self._entries.get(("window", chat_id))
+        if entry is None or not messages:
+            return
+        version, current = entry
+        expected = current[-1]["seq"] + 1 if current else 0
+        if messages[0]["seq"] != expected:
+            self._drop(("window", chat_id))
+            return
+        self.put_window(chat_id, current + list(messages), version)
+
+    def invalidate_chat(self, chat_id: str, user_id: Optional[str] = None):
+        self._drop(("chat", chat_id))
+        self._drop(("window", chat_id))
+        if user_id is not None:
+            self._drop(("chats", user_id))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._entries.currsize,
+            "max_bytes": self._entries.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self._entries.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
@@ -3,9 +3,156 @@ from dotenv import load_dotenv #type: ignore
 
 load_dotenv()
 
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
 class Settings:
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
+    GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    # Storage backend: "mongo", or "sqlite" for single-node installs (see core/storage.py)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "mongo").lower()
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "data/chatbot.db")
     MONGODB_URI: str = os.getenv("MONGO_API_KEY")
-    SECRET_KEY: str = os.getenv("SECRET_KEY", "supersecret")
+    MONGO_DATABASE: str = os.getenv("MONGO_DATABASE", "Gemini_Chatbot")
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+    # Signs session tokens; required unless GEMINI_FAKE (see core/security.py)
+    SECRET_KEY: str = os.getenv("SECRET_KEY", "")
+    SESSION_TTL_SECONDS: int = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+    # Startup (see server.create_app)
+    # Worker threads for sync routes and run_in_threadpool (anyio's default is 40)
+    THREADPOOL_SIZE: int = int(os.getenv("THREADPOOL_SIZE", "40"))
+    # Connect to MongoDB and build the model before the worker starts serving
+    STARTUP_WARMUP: bool = _env_flag("STARTUP_WARMUP")
+
+    # Logging (see core/logging.py)
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+    LOG_FILE: str = os.getenv("LOG_FILE", "logs/app.log")
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    # Fraction of fast, successful requests to log; errors and slow requests are always logged
+    LOG_REQUEST_SAMPLE_RATE: float = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "1.0"))
+    LOG_SLOW_REQUEST_SECONDS: float = float(os.getenv("LOG_SLOW_REQUEST_SECONDS", "1.0"))
+
+    # bcrypt runs in a process pool so logins don't stall the event loop
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+    # Prompt assembly (see services/prompt_builder.py)
+    PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+    PROMPT_RECENT_TURNS: int = int(os.getenv("PROMPT_RECENT_TURNS", "10"))
+    SUMMARY_REFRESH_TURNS: int = int(os.getenv("SUMMARY_REFRESH_TURNS", "5"))
+    # Chats whose rendered recent turns are kept between messages
+    PROMPT_PREFIX_CACHE_SIZE: int = int(os.getenv("PROMPT_PREFIX_CACHE_SIZE", "4096"))
+
+    # Long-term memory: embed stored messages and add the most similar past
+    # ones to prompts (see services/memory.py). Costs an embedding call per
+    # message stored and per prompt built.
+    MEMORY_ENABLED: bool = _env_flag("MEMORY_ENABLED")
+    MEMORY_TOP_K: int = int(os.getenv("MEMORY_TOP_K", "4"))
+    MEMORY_MIN_SCORE: float = float(os.getenv("MEMORY_MIN_SCORE", "0.3"))
+    MEMORY_MAX_PER_USER: int = int(os.getenv("MEMORY_MAX_PER_USER", "20000"))
+    MEMORY_INDEX_CACHE_SIZE: int = int(os.getenv("MEMORY_INDEX_CACHE_SIZE", "256"))  # users
+    MEMORY_INDEX_TTL: int = int(os.getenv("MEMORY_INDEX_TTL", "300"))
+    # "gemini", or "hashing" for the deterministic local stand-in (always used with GEMINI_FAKE)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "gemini").lower()
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "256"))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+
+    # Exact-match response cache (see core/cache.py)
+    RESPONSE_CACHE_ENABLED: bool = _env_flag("RESPONSE_CACHE_ENABLED", "true")
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    RESPONSE_CACHE_SHARED: bool = _env_flag("RESPONSE_CACHE_SHARED")
+
+    # Hot chat metadata/history cache (see core/cache.py ChatCache)
+    CHAT_CACHE_ENABLED: bool = _env_flag("CHAT_CACHE_ENABLED", "true")
+    CHAT_CACHE_MAX_BYTES: int = int(os.getenv("CHAT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Bounds how long chat metadata and lists written by another worker can be stale
+    CHAT_CACHE_TTL: int = int(os.getenv("CHAT_CACHE_TTL", "10"))
+    CHAT_CACHE_WINDOW: int = int(os.getenv("CHAT_CACHE_WINDOW", "50"))
+
+    # Coalesce identical in-flight model calls (see core/singleflight.py)
+    SINGLE_FLIGHT_ENABLED: bool = _env_flag("SINGLE_FLIGHT_ENABLED", "true")
+
+    # Upstream protection for Gemini calls (see core/resilience.py)
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+    GEMINI_TIMEOUT: float = float(os.getenv("GEMINI_TIMEOUT", "30"))
+    GEMINI_MAX_ATTEMPTS: int = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+    GEMINI_RETRY_MAX_WAIT: float = float(os.getenv("GEMINI_RETRY_MAX_WAIT", "8"))
+    GEMINI_HEDGE_DELAY: float = float(os.getenv("GEMINI_HEDGE_DELAY", "0"))  # ~p95 latency; 0 disables
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_TIMEOUT: float = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+    # "sync" writes each message before replying; "write_behind" batches
+    # writes in-process (see services/write_behind.py). The flush interval is
+    # the durability/latency trade-off: the most a crash can lose.
+    PERSISTENCE_MODE: str = os.getenv("PERSISTENCE_MODE", "sync")
+    WRITE_BEHIND_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.05"))
+    WRITE_BEHIND_MAX_BATCH: int = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+    WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+
+    # WebSocket chat (see api/ws.py): messages a connection may queue before
+    # the server stops reading from it
+    WS_MAX_PENDING_MESSAGES: int = int(os.getenv("WS_MAX_PENDING_MESSAGES", "8"))
+    # Seconds a new connection has to send its auth frame
+    WS_AUTH_TIMEOUT: float = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+
+    # Batch generation (see services/batch_service.py)
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+    # Results are written (and only then reported) every BATCH_WRITE_SIZE items or BATCH_FLUSH_INTERVAL seconds
+    BATCH_WRITE_SIZE: int = int(os.getenv("BATCH_WRITE_SIZE", "200"))
+    BATCH_FLUSH_INTERVAL: float = float(os.getenv("BATCH_FLUSH_INTERVAL", "0.25"))
+    # How long completed items are remembered for resuming a batch
+    BATCH_RESULT_TTL: int = int(os.getenv("BATCH_RESULT_TTL", str(7 * 24 * 3600)))
+
+    # Background jobs (see services/jobs.py), stored through the Storage backend
+    JOBS_ENABLED: bool = _env_flag("JOBS_ENABLED", "true")
+    JOBS_CONCURRENCY: int = int(os.getenv("JOBS_CONCURRENCY", "4"))  # per process
+    JOBS_POLL_INTERVAL: float = float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+    # A claimed job not finished within its lease is assumed lost and run again
+    JOBS_LEASE_SECONDS: float = float(os.getenv("JOBS_LEASE_SECONDS", "120"))
+    JOBS_MAX_ATTEMPTS: int = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+    JOBS_RETRY_BASE: float = float(os.getenv("JOBS_RETRY_BASE", "5"))
+    JOBS_RETRY_MAX: float = float(os.getenv("JOBS_RETRY_MAX", "600"))
+    JOBS_RETENTION: float = float(os.getenv("JOBS_RETENTION", str(24 * 3600)))  # finished jobs
+    # Title new chats from their first exchange (see services/chat_titles.py)
+    CHAT_AUTO_TITLE: bool = _env_flag("CHAT_AUTO_TITLE", "true")
+    JOBS_TITLE_CONCURRENCY: int = int(os.getenv("JOBS_TITLE_CONCURRENCY", "2"))
+
+    # Response compression (see core/compression.py): complete bodies of at least
+    # COMPRESSION_MIN_BYTES, with brotli when installed and accepted, else gzip
+    COMPRESSION_ENABLED: bool = _env_flag("COMPRESSION_ENABLED", "true")
+    COMPRESSION_MIN_BYTES: int = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+    # Admission control for the model-backed routes (see core/admission.py).
+    # Rates are requests per second; a rate of 0 disables that bucket.
+    ADMISSION_ENABLED: bool = _env_flag("ADMISSION_ENABLED", "true")
+    ADMISSION_PATHS: list = os.getenv(
+        "ADMISSION_PATHS", "/api/chat,/api/send_message,/api/send_message/stream,/api/batch"
+    ).split(",")
+    ADMISSION_USER_RATE: float = float(os.getenv("ADMISSION_USER_RATE", "2"))
+    ADMISSION_USER_BURST: float = float(os.getenv("ADMISSION_USER_BURST", "10"))
+    ADMISSION_GLOBAL_RATE: float = float(os.getenv("ADMISSION_GLOBAL_RATE", "0"))  # e.g. the Gemini quota
+    ADMISSION_GLOBAL_BURST: float = float(os.getenv("ADMISSION_GLOBAL_BURST", "50"))
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "512"))
+    ADMISSION_MAX_QUEUE_PER_USER: int = int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "8"))
+    # Longest a request may wait for a slot; requests expected to wait longer are refused on arrival
+    ADMISSION_QUEUE_SLO: float = float(os.getenv("ADMISSION_QUEUE_SLO", "2.0"))
+
+    # Offline fake model (see core/fake_gemini.py)
+    GEMINI_FAKE: bool = _env_flag("GEMINI_FAKE")
+    FAKE_GEMINI_FIRST_CHUNK_DELAY: float = float(os.getenv("FAKE_GEMINI_FIRST_CHUNK_DELAY", "0.0"))
+    FAKE_GEMINI_CHUNK_DELAY: float = float(os.getenv("FAKE_GEMINI_CHUNK_DELAY", "0.0"))
+    FAKE_GEMINI_FAILURE_RATE: float = float(os.getenv("FAKE_GEMINI_FAILURE_RATE", "0.0"))
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,79 @@
+from core.config import settings
+from typing import List
+import hashlib
+import numpy as np #type: ignore
+import re
+
+_TOKEN = re.compile(r"\w+")
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (zero rows stay zero) so dot products are cosines"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+class HashingEmbedder:
+    """Deterministic local embedder: feature-hashed words and word pairs
+
+    Needs no model or network and gives the same vector for the same text
+    in every process. Texts sharing wording score high, which is what tests,
+    benchmarks and offline runs need; it does not capture meaning.
+    """
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                # The top bit picks the sign so collisions tend to cancel out
+                vectors[row, h % self.dim] += 1.0 if h >> 63 else -1.0
+        return normalize(vectors)
+
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        return self.embed(texts)
+
+class GeminiEmbedder:
+    """Embeddings from the Gemini embedding API"""
+    def __init__(self, api_key: str, model_name: str, dim: int):
+        from google import genai #type: ignore
+        from google.genai import types #type: ignore
+
+        self.client = genai.Client(api_key=api_key)
+        self.model_name = model_name
+        self.dim = dim
+        self.config = types.EmbedContentConfig(output_dimensionality=dim)
+
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        response = await self.client.aio.models.embed_content(
+            model=self.model_name, contents=texts, config=self.config
+        )
+        # Truncated outputs (dim below the model's native size) are not unit length
+        return normalize(np.array([e.values for e in response.embeddings], dtype=np.float32))
+
+def _build_embedder():
+    if settings.GEMINI_FAKE or settings.EMBEDDING_BACKEND == "hashing":
+        return HashingEmbedder(settings.EMBEDDING_DIM)
+    if settings.EMBEDDING_BACKEND == "gemini":
+        return GeminiEmbedder(settings.GEMINI_API_KEY, settings.EMBEDDING_MODEL, settings.EMBEDDING_DIM)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {settings.EMBEDDING_BACKEND}")
+
+_embedder = None
+
+def get_embedder():
+    """Active embedder, creating the configured one on first use"""
+    global _embedder
+    if _embedder is None:
+        _embedder = _build_embedder()
+    return _embedder
+
+def set_embedder(embedder):
+    """Swap the embedder (e.g. in benchmarks), returning the previous one"""
+    global _embedder
+    previous, _embedder = _embedder, embedder
+    return previous
@@ -18,4 +18,9 @@ class NotFoundException(APIException):
 class AuthenticationException(APIException):
     """Exception for authentication errors"""
     def __init__(self, message: str):
-        super().__init__(message, 401) 
\ No newline at end of file
+        super().__init__(message, 401)
+
+class ServiceUnavailableException(APIException):
+    """Exception for an upstream dependency that is down or overloaded"""
+    def __init__(self, message: str):
+        super().__init__(message, 503)
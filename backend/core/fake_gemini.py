@@ -0,0 +1,76 @@
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Optional
+
+class FakeGeminiError(Exception):
+    """Injected upstream failure, shaped like the SDK's APIError (has `.code`)"""
+    def __init__(self, code: int = 503):
+        self.code = code
+        super().__init__(f"Fake Gemini error {code}")
+
+class FakeGeminiModel:
+    """Offline stand-in for the Gemini model with configurable latency and faults
+
+    Replies are split into fixed-size chunks so streaming behaviour (time to
+    first byte, chunk throughput) can be measured without network access.
+    A fraction of calls can fail (`failure_rate`) or stall (`slow_rate`,
+    `slow_delay`) to exercise retries, the circuit breaker and hedging.
+    """
+    def __init__(self, reply: Optional[str] = None, first_chunk_delay: float = 0.0,
+                 chunk_delay: float = 0.0, chunk_size: int = 16, failure_rate: float = 0.0,
+                 failure_code: int = 503, slow_rate: float = 0.0, slow_delay: float = 0.0,
+                 seed: Optional[int] = None):
+        self.reply = reply
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.failure_rate = failure_rate
+        self.failure_code = failure_code
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+
+    def _first_delay(self) -> float:
+        """Count the call, inject a failure if due, and return the first-chunk delay"""
+        self.calls += 1
+        if self._random.random() < self.failure_rate:
+            self.failures += 1
+            raise FakeGeminiError(self.failure_code)
+        if self._random.random() < self.slow_rate:
+            return self.first_chunk_delay + self.slow_delay
+        return self.first_chunk_delay
+
+    def _reply_for(self, prompt: str) -> str:
+        if self.reply is not None:
+            return self.reply
+        # Echo the last user turn so replies differ per prompt
+        user_lines = [line for line in prompt.splitlines() if line.startswith("User: ")]
+        last_turn = user_lines[-1][len("User: "):] if user_lines else prompt
+        return f"Echo: {last_turn}"
+
+    def _chunks(self, text: str) -> list:
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+
+    def generate(self, prompt: str) -> str:
+        delay = self._first_delay()
+        text = self._reply_for(prompt)
+        time.sleep(delay + self.chunk_delay * (len(self._chunks(text)) - 1))
+        return text
+
+    async def agenerate(self, prompt: str) -> str:
+        delay = self._first_delay()
+        text = self._reply_for(prompt)
+        await asyncio.sleep(delay + self.chunk_delay * (len(self._chunks(text)) - 1))
+        return text
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        delay = self._first_delay()
+        chunks = self._chunks(self._reply_for(prompt))
+        await asyncio.sleep(delay)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self.chunk_delay)
+            yield chunk
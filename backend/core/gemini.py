@@ -1,10 +1,198 @@
-from google import genai
+from typing import AsyncIterator, Optional
 from core.config import settings
+from core.fake_gemini import FakeGeminiModel
+from core.cache import ResponseCache, MongoCacheBackend, cache_key
+from core.singleflight import SingleFlight
+from core.resilience import CircuitBreaker, ResiliencePolicy
+from core import metrics
+import asyncio
+import time
 
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+class GeminiModel:
+    """Model backed by the google-genai SDK"""
+    def __init__(self, api_key: str, model_name: str, timeout: float = None):
+        # The SDK takes about a second to import, so it is only loaded once a real model is needed
+        from google import genai #type: ignore
+        from google.genai import types #type: ignore
 
-def generate_response(prompt: str) -> str:
-    response = client.models.generate_content(
-    model="gemini-2.5-flash", contents=prompt
-    )
-    return response.text
+        http_options = types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        self.model_name = model_name
+
+    def generate(self, prompt: str) -> str:
+        response = self.client.models.generate_content(
+            model=self.model_name, contents=prompt
+        )
+        return response.text
+
+    async def agenerate(self, prompt: str) -> str:
+        response = await self.client.aio.models.generate_content(
+            model=self.model_name, contents=prompt
+        )
+        return response.text
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model=self.model_name, contents=prompt
+        ):
+            if chunk.text:
+                yield chunk.text
+
+def _build_model():
+    if settings.GEMINI_FAKE:
+        return FakeGeminiModel(
+            first_chunk_delay=settings.FAKE_GEMINI_FIRST_CHUNK_DELAY,
+            chunk_delay=settings.FAKE_GEMINI_CHUNK_DELAY,
+            failure_rate=settings.FAKE_GEMINI_FAILURE_RATE,
+        )
+    return GeminiModel(settings.GEMINI_API_KEY, settings.GEMINI_MODEL, settings.GEMINI_TIMEOUT)
+
+# Built on first use so importing the app needs no API key or network
+_model = None
+
+def get_model():
+    """Active model, creating the configured one on first use"""
+    global _model
+    if _model is None:
+        _model = _build_model()
+    return _model
+
+policy = ResiliencePolicy(
+    max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+    timeout=settings.GEMINI_TIMEOUT,
+    max_attempts=settings.GEMINI_MAX_ATTEMPTS,
+    max_backoff=settings.GEMINI_RETRY_MAX_WAIT,
+    hedge_delay=settings.GEMINI_HEDGE_DELAY,
+    breaker=CircuitBreaker(settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_TIMEOUT),
+)
+
+def _build_cache():
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None
+    shared = None
+    if settings.RESPONSE_CACHE_SHARED:
+        from core.mongo import response_cache_collection
+        shared = MongoCacheBackend(response_cache_collection)
+    return ResponseCache(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL, shared)
+
+response_cache = _build_cache()
+inflight = SingleFlight() if settings.SINGLE_FLIGHT_ENABLED else None
+
+def set_model(model):
+    """Swap the active model (e.g. for a fake one), returning the previous model (None if never built)"""
+    global _model
+    previous, _model = _model, model
+    return previous
+
+def is_available() -> bool:
+    """False while the circuit breaker is rejecting calls"""
+    return not policy.breaker.is_open()
+
+def _observe(operation: str, prompt: str, started: float, reply: Optional[str], outcome: str):
+    metrics.gemini_request_duration.observe(time.perf_counter() - started, operation=operation, outcome=outcome)
+    metrics.gemini_prompt_chars.observe(len(prompt), operation=operation)
+    if reply is not None:
+        metrics.gemini_response_chars.observe(len(reply), operation=operation)
+
+def _generate(prompt: str) -> str:
+    started, reply, outcome = time.perf_counter(), None, "error"
+    try:
+        reply = policy.call(lambda: get_model().generate(prompt))
+        outcome = "ok"
+        return reply
+    finally:
+        _observe("generate", prompt, started, reply, outcome)
+
+async def _agenerate(prompt: str) -> str:
+    started, reply, outcome = time.perf_counter(), None, "error"
+    try:
+        reply = await policy.acall(lambda: get_model().agenerate(prompt), hedge=True)
+        outcome = "ok"
+        return reply
+    finally:
+        _observe("agenerate", prompt, started, reply, outcome)
+
+async def _astream(prompt: str) -> AsyncIterator[str]:
+    started, parts, outcome = time.perf_counter(), [], "error"
+    try:
+        async for chunk in policy.astream(lambda: get_model().astream(prompt)):
+            if not parts:
+                metrics.gemini_first_chunk_duration.observe(time.perf_counter() - started, operation="astream")
+            parts.append(chunk)
+            yield chunk
+        outcome = "ok"
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = "cancelled"
+        raise
+    finally:
+        _observe("astream", prompt, started, "".join(parts), outcome)
+
+def _prompt_key(prompt: str) -> str:
+    model = get_model()
+    return cache_key(prompt, getattr(model, "model_name", type(model).__name__))
+
+# use_cache=False skips both the response cache and request coalescing, so
+# the caller always gets a fresh reply of its own.
+
+def generate_response(prompt: str, use_cache: bool = True) -> str:
+    if not use_cache:
+        return _generate(prompt)
+
+    key = _prompt_key(prompt)
+    if response_cache is not None:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+
+    def call():
+        reply = _generate(prompt)
+        if response_cache is not None and reply:
+            response_cache.set(key, reply)
+        return reply
+
+    return inflight.do(key, call) if inflight else call()
+
+async def agenerate_response(prompt: str, use_cache: bool = True) -> str:
+    """Async variant of generate_response that does not hold a worker thread"""
+    if not use_cache:
+        return await _agenerate(prompt)
+
+    key = _prompt_key(prompt)
+    if response_cache is not None:
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            return cached
+
+    async def call():
+        reply = await _agenerate(prompt)
+        if response_cache is not None and reply:
+            await response_cache.aset(key, reply)
+        return reply
+
+    return await (inflight.ado(key, call) if inflight else call())
+
+async def astream_response(prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+    """Yield reply text chunks as the model produces them; identical concurrent streams share one upstream call"""
+    if not use_cache:
+        async for chunk in _astream(prompt):
+            yield chunk
+        return
+
+    key = _prompt_key(prompt)
+    if response_cache is not None:
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            yield cached
+            return
+
+    async def upstream():
+        parts = []
+        async for chunk in _astream(prompt):
+            parts.append(chunk)
+            yield chunk
+        if response_cache is not None and parts:
+            await response_cache.aset(key, "".join(parts))
+
+    source = inflight.astream(key, upstream) if inflight else upstream()
+    async for chunk in source:
+        yield chunk
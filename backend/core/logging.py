@@ -1,45 +1,124 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Optional
+
+from core.config import settings
+
+# Request ID of the request being handled, set by the log_requests middleware
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+_listener: Optional[logging.handlers.QueueListener] = None
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request ID (must run on the logging thread's caller)"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra` fields are included as top-level keys"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread
+
+    The stock handler formats every record before enqueueing it, which
+    puts the formatting cost back on the caller. Records only ever cross
+    threads in this process, so they can be queued as-is.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
 
 def setup_logging():
-    """Setup basic logging configuration"""
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
-    # Configure logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('logs/app.log'),
-            logging.StreamHandler()  # Also log to console
-        ]
-    )
-    
-    # Create logger for the application
+    """Route all logging through a background queue listener; safe to call more than once"""
+    global _listener
     logger = logging.getLogger('llm_chatbot')
-    logger.setLevel(logging.INFO)
-    
+    if _listener is not None:
+        return logger
+
+    log_dir = os.path.dirname(settings.LOG_FILE)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s')
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        settings.LOG_FILE, maxBytes=settings.LOG_MAX_BYTES, backupCount=settings.LOG_BACKUP_COUNT
+    )
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    queue_handler = LazyQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(settings.LOG_LEVEL)
+    logger.setLevel(settings.LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(
+        queue_handler.queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
     return logger
 
+def shutdown_logging():
+    """Drain queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 def log_request(method: str, path: str, status_code: int, duration: float):
-    """Log HTTP request details"""
+    """Log HTTP request details, sampling fast successful requests"""
     logger = logging.getLogger('llm_chatbot')
-    logger.info(f"Request: {method} {path} - Status: {status_code} - Duration: {duration:.3f}s")
+    if status_code < 400 and duration < settings.LOG_SLOW_REQUEST_SECONDS:
+        if not logger.isEnabledFor(logging.INFO) or random.random() >= settings.LOG_REQUEST_SAMPLE_RATE:
+            return
+    logger.info(
+        "Request: %s %s - Status: %s - Duration: %.3fs", method, path, status_code, duration,
+        extra={"method": method, "path": path, "status": status_code, "duration_ms": round(duration * 1000, 1)}
+    )
 
 def log_error(error: Exception, context: str = ""):
     """Log error with context"""
     logger = logging.getLogger('llm_chatbot')
-    logger.error(f"Error in {context}: {str(error)}", exc_info=True)
+    logger.error("Error in %s: %s", context, error, exc_info=True)
 
-def log_info(message: str):
-    """Log info message"""
+def log_info(message: str, *args, **fields):
+    """Log info message; %-style args are only formatted if the record is emitted"""
     logger = logging.getLogger('llm_chatbot')
-    logger.info(message)
+    logger.info(message, *args, extra=fields or None)
 
-def log_warning(message: str):
+def log_warning(message: str, *args, **fields):
     """Log warning message"""
     logger = logging.getLogger('llm_chatbot')
-    logger.warning(message) 
\ No newline at end of file
+    logger.warning(message, *args, extra=fields or None)
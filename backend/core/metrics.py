@@ -0,0 +1,227 @@
+from bisect import bisect_left
+from pymongo import monitoring #type: ignore
+from typing import Dict, Iterable, Optional, Tuple
+import math
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+class Gauge(_Metric):
+    """Value that can go up and down per label set"""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+class Histogram(_Metric):
+    """Cumulative bucket counts plus sum and count per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}"
+
+class Registry:
+    """Ordered collection of metrics rendered in the Prometheus text format"""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# HTTP
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "Requests currently being handled")
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route template and status",
+    ("method", "route", "status"))
+websocket_connections = registry.gauge(
+    "websocket_connections", "Open WebSocket chat connections")
+websocket_message_duration = registry.histogram(
+    "websocket_message_duration_seconds", "Time from reading a WebSocket message to its last frame",
+    ("outcome",))
+compression_input_bytes = registry.counter(
+    "http_compression_input_bytes_total", "Response bytes before compression", ("encoding",))
+compression_output_bytes = registry.counter(
+    "http_compression_output_bytes_total", "Response bytes after compression", ("encoding",))
+
+# Admission control (model-backed routes only)
+admission_queue_depth = registry.gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot")
+admission_in_flight = registry.gauge(
+    "admission_in_flight", "Requests holding an admission slot")
+admission_wait_duration = registry.histogram(
+    "admission_wait_seconds", "Time admitted requests waited for a slot")
+admission_rejected = registry.counter(
+    "admission_rejected_total", "Requests refused with 429 by reason (user_rate, queue_full, slo)",
+    ("reason",))
+
+# Background jobs
+jobs_running = registry.gauge(
+    "jobs_running", "Background jobs running in this process", ("kind",))
+jobs_lag = registry.histogram(
+    "jobs_lag_seconds", "Time from when a job was due to when it started", ("kind",))
+jobs_duration = registry.histogram(
+    "jobs_duration_seconds", "Job run time by outcome (ok, retry, failed)", ("kind", "outcome"))
+
+# Gemini (upstream calls only; cache hits and coalesced callers are not counted)
+gemini_request_duration = registry.histogram(
+    "gemini_request_duration_seconds", "Model call latency including retries; streams are timed to the last chunk",
+    ("operation", "outcome"))
+gemini_first_chunk_duration = registry.histogram(
+    "gemini_first_chunk_seconds", "Time to the first streamed chunk", ("operation",))
+gemini_prompt_chars = registry.histogram(
+    "gemini_prompt_chars", "Prompt size in characters (about 4 per token)", ("operation",), SIZE_BUCKETS)
+gemini_response_chars = registry.histogram(
+    "gemini_response_chars", "Reply size in characters (about 4 per token)", ("operation",), SIZE_BUCKETS)
+
+# MongoDB
+mongo_command_duration = registry.histogram(
+    "mongo_command_duration_seconds", "Server round trip per command, from the driver's command monitoring",
+    ("command", "outcome"))
+
+# Worker threads (anyio's default limiter, used for sync routes and run_in_threadpool)
+threadpool_busy = registry.gauge("threadpool_busy_threads", "Worker threads currently in use")
+threadpool_capacity = registry.gauge("threadpool_capacity_threads", "Worker thread limit")
+threadpool_waiting = registry.gauge("threadpool_waiting_tasks", "Tasks queued for a worker thread")
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Record every driver command's duration in mongo_command_duration_seconds"""
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_duration.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        mongo_command_duration.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
+def sample_threadpool():
+    """Refresh the worker thread gauges; must be called from the event loop"""
+    from anyio import to_thread #type: ignore
+    limiter = to_thread.current_default_thread_limiter()
+    statistics = limiter.statistics()
+    threadpool_busy.set(statistics.borrowed_tokens)
+    threadpool_capacity.set(statistics.total_tokens)
+    threadpool_waiting.set(statistics.tasks_waiting)
+
+def route_label(scope: dict) -> Optional[str]:
+    """Route template that handled a request (e.g. /api/chat/{user_id}/{chat_id})"""
+    route = scope.get("route")
+    return getattr(route, "path", None)
@@ -1,9 +1,100 @@
-from pymongo import MongoClient #type: ignore
-import os
-from dotenv import load_dotenv #type: ignore
-
-load_dotenv()
-client = MongoClient(os.getenv("MONGO_API_KEY"))
-db = client["Gemini_Chatbot"]
-chat_collection = db["chat"]
-user_collection = db["users"]
\ No newline at end of file
+from pymongo import MongoClient, AsyncMongoClient #type: ignore
+from core.config import settings
+from core.metrics import MongoCommandMetrics
+
+# Clients are created on first use (normally in the app lifespan, after any
+# worker fork), so importing this module opens no sockets
+_client = None
+_db = None
+_async_client = None
+_async_db = None
+
+def _client_options() -> dict:
+    return {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "event_listeners": [MongoCommandMetrics()]
+    }
+
+def get_db():
+    """Sync database (scripts and tools)"""
+    global _client, _db
+    if _db is None:
+        _client = MongoClient(settings.MONGODB_URI, **_client_options())
+        _db = _client[settings.MONGO_DATABASE]
+    return _db
+
+def get_async_db():
+    """Async database used on the request path"""
+    global _async_client, _async_db
+    if _async_db is None:
+        _async_client = AsyncMongoClient(settings.MONGODB_URI, **_client_options())
+        _async_db = _async_client[settings.MONGO_DATABASE]
+    return _async_db
+
+def set_db(database=None, async_database=None):
+    """Point the module at other databases (e.g. an in-memory stand-in for benchmarks)"""
+    global _db, _async_db
+    if database is not None:
+        _db = database
+    if async_database is not None:
+        _async_db = async_database
+
+async def warmup():
+    """Open the async client and complete a round trip so the first request finds a live connection"""
+    await get_async_db().command("ping")
+
+async def close_clients():
+    """Close whichever clients were opened"""
+    global _client, _db, _async_client, _async_db
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = _async_db = None
+    if _client is not None:
+        _client.close()
+        _client = _db = None
+
+class LazyCollection:
+    """Collection handle resolved against the current database on each use"""
+    def __init__(self, name: str, get_database):
+        self.name = name
+        self._get_database = get_database
+
+    def __getattr__(self, attr):
+        return getattr(self._get_database()[self.name], attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+chat_collection = LazyCollection("chat", get_db)
+user_collection = LazyCollection("users", get_db)
+
+# Async collections for the chat request path
+async_chat_collection = LazyCollection("chat", get_async_db)
+async_user_collection = LazyCollection("users", get_async_db)
+
+# Normalized chat storage: one document per chat, one per message
+chats_collection = LazyCollection("chats", get_async_db)
+messages_collection = LazyCollection("messages", get_async_db)
+response_cache_collection = LazyCollection("response_cache", get_async_db)
+batch_results_collection = LazyCollection("batch_results", get_async_db)
+memories_collection = LazyCollection("memories", get_async_db)
+jobs_collection = LazyCollection("jobs", get_async_db)
+
+async def ensure_indexes():
+    """Create the indexes the chat queries rely on (idempotent)"""
+    await chats_collection.create_index("chat_id", unique=True)
+    await chats_collection.create_index([("user_id", 1), ("created_at", 1)])
+    await messages_collection.create_index([("chat_id", 1), ("seq", 1)], unique=True)
+    await response_cache_collection.create_index("expires_at", expireAfterSeconds=0)
+    await batch_results_collection.create_index([("user_id", 1), ("batch_id", 1), ("item_id", 1)], unique=True)
+    await batch_results_collection.create_index("expires_at", expireAfterSeconds=0)
+    await memories_collection.create_index("memory_id", unique=True)
+    await memories_collection.create_index([("user_id", 1), ("_id", 1)])
+    await memories_collection.create_index("chat_id")
+    await jobs_collection.create_index("job_id", unique=True)
+    # active_key only exists while a job is queued or running
+    await jobs_collection.create_index("active_key", unique=True, sparse=True)
+    await jobs_collection.create_index([("kind", 1), ("status", 1), ("run_at", 1)])
+    await jobs_collection.create_index("finished_at")
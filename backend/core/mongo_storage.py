@@ -0,0 +1,233 @@
+from core import mongo
+from core.mongo import (
+    async_chat_collection, async_user_collection, batch_results_collection, chats_collection, jobs_collection,
+    memories_collection, messages_collection
+)
+from core.storage import Storage
+from datetime import datetime, timedelta
+from pymongo import InsertOne, ReturnDocument, UpdateOne #type: ignore
+from pymongo.errors import BulkWriteError, DuplicateKeyError #type: ignore
+from typing import Dict, List, Optional
+import time
+
+CHAT_SUMMARY_PROJECTION = {"_id": 0, "chat_id": 1, "title": 1, "created_at": 1}
+MESSAGE_PROJECTION = {"_id": 0, "seq": 1, "sender": 1, "message": 1, "timestamp": 1}
+MEMORY_PROJECTION = {"_id": 0, "memory_id": 1, "user_id": 1, "chat_id": 1, "sender": 1, "message": 1, "vector": 1}
+BATCH_RESULT_PROJECTION = {"_id": 0, "item_id": 1, "chat_id": 1, "response": 1}
+JOB_PROJECTION = {"_id": 0, "job_id": 1, "kind": 1, "user_id": 1, "chat_id": 1, "payload": 1, "status": 1, "attempts": 1, "run_at": 1, "error": 1}
+DUPLICATE_KEY = 11000
+
+def _ignore_duplicates(e: BulkWriteError):
+    if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+        raise e
+
+class MongoStorage(Storage):
+    """Storage in MongoDB: chats, messages, users and the legacy flat "chat" collection"""
+
+    async def ensure_schema(self):
+        await mongo.ensure_indexes()
+
+    async def warmup(self):
+        await mongo.warmup()
+
+    async def close(self):
+        await mongo.close_clients()
+
+    async def create_user(self, username: str, password_hash: bytes) -> str:
+        result = await async_user_collection.insert_one({"username": username, "password": password_hash})
+        return str(result.inserted_id)
+
+    async def find_user(self, username: str) -> Optional[dict]:
+        user = await async_user_collection.find_one({"username": username})
+        if not user:
+            return None
+        return {"user_id": str(user["_id"]), "username": user["username"], "password": user["password"]}
+
+    async def insert_chat(self, chat: dict):
+        await chats_collection.insert_one(dict(chat))
+
+    async def list_chats(self, user_id: str) -> List[dict]:
+        cursor = chats_collection.find({"user_id": user_id}, CHAT_SUMMARY_PROJECTION).sort("created_at", 1)
+        return await cursor.to_list(length=None)
+
+    async def get_chat(self, chat_id: str) -> Optional[dict]:
+        return await chats_collection.find_one({"chat_id": chat_id}, {"_id": 0})
+
+    async def chat_version(self, chat_id: str) -> Optional[int]:
+        chat = await chats_collection.find_one({"chat_id": chat_id}, {"_id": 0, "version": 1})
+        return chat.get("version", 0) if chat is not None else None
+
+    async def reserve_seqs(self, chat_id: str, count: int, user_id: Optional[str] = None) -> Optional[int]:
+        query = {"chat_id": chat_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        chat = await chats_collection.find_one_and_update(
+            query,
+            {"$inc": {"message_count": count}},
+            projection={"message_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return chat["message_count"] - count if chat else None
+
+    async def release_seqs(self, chat_id: str, first: int, count: int) -> bool:
+        # Only this caller writes seqs first..first + count - 1, so none of them
+        # can land after this check; a later reservation fails the update
+        if await messages_collection.find_one({"chat_id": chat_id, "seq": {"$gte": first}}, {"_id": 1}):
+            return False
+        result = await chats_collection.update_one(
+            {"chat_id": chat_id, "message_count": first + count}, {"$set": {"message_count": first}}
+        )
+        return result.modified_count > 0
+
+    async def update_summary(self, chat_id: str, summary: str, upto: int, expected_upto: int) -> bool:
+        query = {"chat_id": chat_id}
+        query["summary_upto"] = expected_upto if expected_upto else {"$in": [0, None]}
+        result = await chats_collection.update_one(query, {"$set": {"summary": summary, "summary_upto": upto}})
+        return result.modified_count > 0
+
+    async def rename_chat(self, user_id: str, chat_id: str, title: str) -> bool:
+        result = await chats_collection.update_one(
+            {"chat_id": chat_id, "user_id": user_id, "title": {"$ne": title}},
+            {"$set": {"title": title}, "$inc": {"version": 1}}
+        )
+        return result.modified_count > 0
+
+    async def delete_chat(self, user_id: str, chat_id: str) -> bool:
+        result = await chats_collection.delete_one({"chat_id": chat_id, "user_id": user_id})
+        if result.deleted_count == 0:
+            return False
+        await messages_collection.delete_many({"chat_id": chat_id})
+        await memories_collection.delete_many({"chat_id": chat_id})
+        return True
+
+    async def insert_messages(self, docs: List[dict]):
+        # One unordered round trip; duplicates are messages a failed batch already wrote
+        try:
+            await messages_collection.bulk_write([InsertOne(dict(doc)) for doc in docs], ordered=False)
+        except BulkWriteError as e:
+            _ignore_duplicates(e)
+        chat_ids = list(dict.fromkeys(doc["chat_id"] for doc in docs))
+        await chats_collection.update_many({"chat_id": {"$in": chat_ids}}, {"$inc": {"version": 1}})
+
+    async def recent_messages(self, chat_id: str, limit: int) -> List[dict]:
+        cursor = messages_collection.find({"chat_id": chat_id}, MESSAGE_PROJECTION).sort("seq", -1).limit(limit)
+        messages = await cursor.to_list(length=limit)
+        messages.reverse()
+        return messages
+
+    async def messages_before(self, chat_id: str, before: int, limit: int) -> List[dict]:
+        query = {"chat_id": chat_id, "seq": {"$lt": before}}
+        cursor = messages_collection.find(query, MESSAGE_PROJECTION).sort("seq", -1).limit(limit)
+        messages = await cursor.to_list(length=limit)
+        messages.reverse()
+        return messages
+
+    async def message_range(self, chat_id: str, start: int, end: int) -> List[dict]:
+        cursor = messages_collection.find(
+            {"chat_id": chat_id, "seq": {"$gte": start, "$lt": end}}, MESSAGE_PROJECTION
+        ).sort("seq", 1)
+        return await cursor.to_list(length=None)
+
+    async def insert_flat_records(self, records: List[dict]):
+        # The driver stores the generated _id in each dict, so a retried record is a duplicate
+        try:
+            await async_chat_collection.bulk_write([InsertOne(r) for r in records], ordered=False)
+        except BulkWriteError as e:
+            _ignore_duplicates(e)
+
+    async def recent_flat_records(self, user_id: str, limit: int) -> List[dict]:
+        cursor = async_chat_collection.find({"user_id": user_id}, {"_id": 0}).sort("_id", -1).limit(limit)
+        records = await cursor.to_list(length=limit)
+        records.reverse()
+        return records
+
+    async def insert_memories(self, records: List[dict]):
+        # A retried record is a duplicate on the unique memory_id index
+        try:
+            await memories_collection.bulk_write([InsertOne(dict(r)) for r in records], ordered=False)
+        except BulkWriteError as e:
+            _ignore_duplicates(e)
+
+    async def load_memories(self, user_id: str, limit: int) -> List[dict]:
+        cursor = memories_collection.find({"user_id": user_id}, MEMORY_PROJECTION).sort("_id", -1).limit(limit)
+        records = await cursor.to_list(length=limit)
+        records.reverse()
+        for record in records:
+            record["vector"] = bytes(record["vector"])
+        return records
+
+    async def save_batch_results(self, user_id: str, batch_id: str, results: List[dict], ttl: int):
+        # Upserts on the unique (user_id, batch_id, item_id) key; a saved result is never overwritten
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        await batch_results_collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "batch_id": batch_id, "item_id": result["item_id"]},
+                {"$setOnInsert": {**result, "expires_at": expires_at}},
+                upsert=True
+            )
+            for result in results
+        ], ordered=False)
+
+    async def get_batch_results(self, user_id: str, batch_id: str) -> Dict[str, dict]:
+        cursor = batch_results_collection.find(
+            {"user_id": user_id, "batch_id": batch_id, "expires_at": {"$gt": datetime.utcnow()}},
+            BATCH_RESULT_PROJECTION
+        )
+        return {result["item_id"]: result async for result in cursor}
+
+    async def enqueue_job(self, job: dict, dedupe_key: Optional[str] = None) -> bool:
+        doc = {**job, "payload": job.get("payload") or {}, "status": "queued", "attempts": 0, "created_at": time.time()}
+        if dedupe_key is not None:
+            doc["active_key"] = dedupe_key
+        try:
+            await jobs_collection.insert_one(doc)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def claim_jobs(self, kind: str, limit: int, lease: float) -> List[dict]:
+        # One atomic find-and-modify per job, so concurrent workers never claim the same one
+        now, jobs = time.time(), []
+        for _ in range(limit):
+            job = await jobs_collection.find_one_and_update(
+                {"kind": kind, "job_id": {"$nin": [j["job_id"] for j in jobs]}, "$or": [
+                    {"status": "queued", "run_at": {"$lte": now}},
+                    {"status": "running", "lease_until": {"$lt": now}}
+                ]},
+                {"$set": {"status": "running", "lease_until": now + lease}, "$inc": {"attempts": 1}},
+                sort=[("run_at", 1)],
+                projection=JOB_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    async def finish_job(self, job_id: str, error: Optional[str] = None):
+        update = {"status": "failed" if error else "done", "finished_at": time.time()}
+        if error:
+            update["error"] = error
+        await jobs_collection.update_one({"job_id": job_id}, {"$set": update, "$unset": {"active_key": "", "lease_until": ""}})
+
+    async def retry_job(self, job_id: str, run_at: float, error: str):
+        await jobs_collection.update_one(
+            {"job_id": job_id},
+            {"$set": {"status": "queued", "run_at": run_at, "error": error}, "$unset": {"lease_until": ""}}
+        )
+
+    async def job_stats(self) -> dict:
+        now = time.time()
+        stats = {"queued": 0, "running": 0, "done": 0, "failed": 0, "oldest_due": None}
+        async for row in await jobs_collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            stats[row["_id"]] = row["count"]
+        oldest = await jobs_collection.find_one(
+            {"status": "queued", "run_at": {"$lte": now}}, {"_id": 0, "run_at": 1}, sort=[("run_at", 1)]
+        )
+        if oldest:
+            stats["oldest_due"] = oldest["run_at"]
+        return stats
+
+    async def purge_jobs(self, finished_before: float) -> int:
+        result = await jobs_collection.delete_many({"status": {"$in": ["done", "failed"]}, "finished_at": {"$lt": finished_before}})
+        return result.deleted_count
@@ -0,0 +1,246 @@
+from core.exceptions import ServiceUnavailableException
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential #type: ignore
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import asyncio
+import httpx #type: ignore
+import random
+import threading
+import time
+
+# HTTP statuses worth retrying; Gemini SDK errors expose theirs as `.code`
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient upstream failures: timeouts, connection errors, 429/5xx"""
+    if isinstance(error, ServiceUnavailableException):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, httpx.TransportError):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures
+
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through
+    (half-open) to decide whether to close again.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self) -> bool:
+        """Whether calls are currently rejected, without claiming a half-open trial"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def check(self):
+        if not self.allow():
+            raise ServiceUnavailableException("AI service unavailable")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Let another call probe a half-open circuit; for trials that ended without a verdict"""
+        with self._lock:
+            self._trial_in_flight = False
+
+class ResiliencePolicy:
+    """Concurrency cap, per-attempt timeout, jittered retries, circuit breaker and hedging
+
+    Wraps zero-argument callables that perform one upstream call, so the
+    same policy applies to any model implementation.
+    """
+    def __init__(self, max_concurrency: int, timeout: float, max_attempts: int,
+                 max_backoff: float, hedge_delay: float, breaker: CircuitBreaker):
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker
+        self._sync_slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _wait(self):
+        return wait_random_exponential(multiplier=0.5, max=self.max_backoff)
+
+    def _before_sleep(self, retry_state):
+        self.retries += 1
+
+    def _record_outcome(self, error: Optional[BaseException]):
+        """Settle the breaker once an attempt ends, so a half-open trial is never left open"""
+        if error is None:
+            self.breaker.record_success()
+        elif not isinstance(error, Exception):
+            # Cancelled (client gone, losing hedge): no verdict on upstream health
+            self.breaker.release_trial()
+        elif is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            # Caller mistakes (bad request, safety block) still mean the upstream answered
+            self.breaker.record_success()
+
+    def call(self, fn: Callable[[], object]):
+        """Run a blocking upstream call under the policy (no hedging)"""
+        retrying = Retrying(
+            stop=stop_after_attempt(self.max_attempts), wait=self._wait(),
+            retry=retry_if_exception(is_retryable), before_sleep=self._before_sleep, reraise=True
+        )
+        for attempt in retrying:
+            with attempt:
+                self.breaker.check()
+                with self._sync_slots:
+                    self.in_flight += 1
+                    error = None
+                    try:
+                        result = fn()
+                    except BaseException as e:
+                        error = e
+                        raise
+                    finally:
+                        self.in_flight -= 1
+                        self._record_outcome(error)
+        return result
+
+    async def _attempt(self, fn: Callable[[], Awaitable[object]]):
+        async with self._async_slots:
+            self.in_flight += 1
+            error = None
+            try:
+                return await asyncio.wait_for(fn(), self.timeout)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self.in_flight -= 1
+                self._record_outcome(error)
+
+    async def _hedged(self, fn: Callable[[], Awaitable[object]]):
+        """Send a duplicate if the first attempt is slower than hedge_delay; first reply wins"""
+        primary = asyncio.ensure_future(self._attempt(fn))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        if done:
+            return primary.result()
+
+        self.hedges += 1
+        backup = asyncio.ensure_future(self._attempt(fn))
+        pending, errors = {primary, backup}, []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.hedge_wins += 1
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[-1]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, fn: Callable[[], Awaitable[object]], hedge: bool = False):
+        """Run an async upstream call under the policy"""
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts), wait=self._wait(),
+            retry=retry_if_exception(is_retryable), before_sleep=self._before_sleep, reraise=True
+        )
+        async for attempt in retrying:
+            with attempt:
+                self.breaker.check()
+                if hedge and self.hedge_delay > 0:
+                    result = await self._hedged(fn)
+                else:
+                    result = await self._attempt(fn)
+        return result
+
+    async def astream(self, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Run an upstream stream under the policy
+
+        Retries only happen before the first chunk: once text has reached
+        the client a retry would duplicate it. tenacity cannot restart an
+        async generator midway, hence the hand-rolled loop.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.check()
+            started = False
+            try:
+                async with self._async_slots:
+                    self.in_flight += 1
+                    try:
+                        stream = fn()
+                        try:
+                            first = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            first = None
+                        # The upstream answered, which settles the breaker
+                        started = True
+                        self._record_outcome(None)
+                        if first is None:
+                            return
+                        yield first
+                        async for chunk in stream:
+                            yield chunk
+                        return
+                    finally:
+                        self.in_flight -= 1
+            except BaseException as e:
+                if not started:
+                    self._record_outcome(e)
+                elif isinstance(e, Exception) and is_retryable(e):
+                    self.breaker.record_failure()
+                if started or not isinstance(e, Exception) or attempt >= self.max_attempts or not is_retryable(e):
+                    raise
+            self.retries += 1
+            await asyncio.sleep(random.uniform(0, min(self.max_backoff, 0.5 * 2 ** attempt)))
+
+    def stats(self) -> dict:
+        return {
+            "circuit_state": self.breaker.state,
+            "circuit_rejected": self.breaker.rejected,
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
@@ -0,0 +1,108 @@
+from core.config import settings
+from core.exceptions import AuthenticationException, ServiceUnavailableException
+from core.logging import log_warning
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import asyncio
+import base64
+import bcrypt #type: ignore
+import hashlib
+import hmac
+import json
+import secrets
+import time
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending = 0
+
+# Never used to sign sessions: unset, or placeholders that are public in this repo
+INSECURE_SECRET_KEYS = {"", "supersecret", "your_secret_key_here"}
+_signing_key: Optional[bytes] = None
+
+# Module-level so they can be pickled into the worker processes
+def _hash(password: bytes) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt())
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+    return _pool
+
+def shutdown_password_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def _run_in_pool(fn, *args):
+    """Run a bcrypt call in the pool, shedding load once too many are queued"""
+    global _pending
+    if _pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        raise ServiceUnavailableException("Too many login attempts in progress, please retry shortly")
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        _pending -= 1
+
+async def hash_password(password: str) -> bytes:
+    return await _run_in_pool(_hash, password.encode('utf-8'))
+
+async def verify_password(password: str, hashed: bytes) -> bool:
+    return await _run_in_pool(_check, password.encode('utf-8'), hashed)
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def get_signing_key() -> bytes:
+    """Key for session tokens; raises RuntimeError when SECRET_KEY is unset or a placeholder
+
+    Offline runs (GEMINI_FAKE) get a random key per process instead, so
+    their tokens do not survive a restart or work across workers.
+    """
+    global _signing_key
+    if _signing_key is None:
+        if settings.SECRET_KEY not in INSECURE_SECRET_KEYS:
+            _signing_key = settings.SECRET_KEY.encode("utf-8")
+        elif settings.GEMINI_FAKE:
+            _signing_key = secrets.token_bytes(32)
+            log_warning("SECRET_KEY is not set: signing sessions with a random per-process key (GEMINI_FAKE only)")
+        else:
+            raise RuntimeError("SECRET_KEY is unset or a placeholder; set it to a long random value, e.g. python -c 'import secrets; print(secrets.token_urlsafe(48))'")
+    return _signing_key
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(get_signing_key(), payload.encode("ascii"), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+def create_session_token(user_id: str, username: str) -> str:
+    """Issue an HMAC-signed session token: <base64 payload>.<base64 signature>"""
+    payload = _b64encode(json.dumps({
+        "sub": user_id,
+        "usr": username,
+        "exp": int(time.time()) + settings.SESSION_TTL_SECONDS
+    }, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+def verify_session_token(token: str) -> str:
+    """Return the user id of a valid, unexpired token"""
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            raise AuthenticationException("Invalid session token")
+        claims = json.loads(_b64decode(payload))
+    except AuthenticationException:
+        raise
+    except Exception:
+        raise AuthenticationException("Invalid session token")
+
+    if claims.get("exp", 0) < time.time():
+        raise AuthenticationException("Session expired")
+    return claims["sub"]
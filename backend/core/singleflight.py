@@ -0,0 +1,130 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+class _Call:
+    """A synchronous in-flight call that followers wait on"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class _StreamFanout:
+    """Replays one upstream stream to any number of subscribers"""
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def pump(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+def _consume_exception(task: asyncio.Task):
+    # Avoid "exception was never retrieved" when every waiter went away
+    if not task.cancelled():
+        task.exception()
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one upstream call
+
+    Every caller sharing a key receives the leader's result or exception.
+    Async calls run as their own task, so a caller that disconnects does
+    not cancel the call for the others. Sync and async callers are tracked
+    separately and only coalesce with their own kind.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _count(self, leader: bool):
+        if leader:
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+    def do(self, key: str, fn: Callable[[], object]):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(leader)
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[object]]):
+        with self._lock:
+            task = self._tasks.get(key)
+            leader = task is None
+            if leader:
+                task = self._tasks[key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda _: self._tasks.pop(key, None))
+                task.add_done_callback(_consume_exception)
+            self._count(leader)
+        return await asyncio.shield(task)
+
+    async def astream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        with self._lock:
+            fanout = self._streams.get(key)
+            leader = fanout is None
+            if leader:
+                fanout = self._streams[key] = _StreamFanout()
+                task = asyncio.ensure_future(fanout.pump(fn()))
+                task.add_done_callback(lambda _: self._streams.pop(key, None))
+            self._count(leader)
+        async for chunk in fanout.subscribe():
+            yield chunk
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = self.leaders + self.followers
+            return {
+                "in_flight": len(self._calls) + len(self._tasks) + len(self._streams),
+                "upstream_calls": self.leaders,
+                "coalesced_calls": self.followers,
+                "coalescing_ratio": self.followers / calls if calls else 0.0
+            }
@@ -0,0 +1,373 @@
+from concurrent.futures import ThreadPoolExecutor
+from core.storage import Storage
+from typing import Dict, List, Optional
+from uuid import uuid4
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT,
+    summary_upto INTEGER,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS chats_user_created ON chats (user_id, created_at);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    message TEXT NOT NULL,
+    timestamp TEXT,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS flat_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    record_id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    user_input TEXT NOT NULL,
+    bot_reply TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS flat_records_user ON flat_records (user_id, id);
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    memory_id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    chat_id TEXT,
+    sender TEXT NOT NULL,
+    message TEXT NOT NULL,
+    vector BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memories_user ON memories (user_id, id);
+CREATE INDEX IF NOT EXISTS memories_chat ON memories (chat_id);
+CREATE TABLE IF NOT EXISTS batch_results (
+    user_id TEXT NOT NULL,
+    batch_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    chat_id TEXT,
+    response TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (user_id, batch_id, item_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS batch_results_expiry ON batch_results (expires_at);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id TEXT,
+    chat_id TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    error TEXT,
+    active_key TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (kind, status, run_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+"""
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache always hits and each is only prepared once
+INSERT_USER = "INSERT INTO users (user_id, username, password) VALUES (?, ?, ?)"
+FIND_USER = "SELECT user_id, username, password FROM users WHERE username = ?"
+INSERT_CHAT = "INSERT INTO chats (chat_id, user_id, title, created_at, message_count) VALUES (?, ?, ?, ?, ?)"
+LIST_CHATS = "SELECT chat_id, title, created_at FROM chats WHERE user_id = ? ORDER BY created_at"
+GET_CHAT = "SELECT chat_id, user_id, title, created_at, message_count, summary, summary_upto, version FROM chats WHERE chat_id = ?"
+CHAT_VERSION = "SELECT version FROM chats WHERE chat_id = ?"
+RESERVE_SEQS = "UPDATE chats SET message_count = message_count + ? WHERE chat_id = ? RETURNING message_count"
+RESERVE_SEQS_OWNED = "UPDATE chats SET message_count = message_count + ? WHERE chat_id = ? AND user_id = ? RETURNING message_count"
+RELEASE_SEQS = (
+    "UPDATE chats SET message_count = ? WHERE chat_id = ? AND message_count = ? "
+    "AND NOT EXISTS (SELECT 1 FROM messages WHERE chat_id = ? AND seq >= ?)"
+)
+UPDATE_SUMMARY = "UPDATE chats SET summary = ?, summary_upto = ? WHERE chat_id = ? AND summary_upto = ?"
+UPDATE_FIRST_SUMMARY = "UPDATE chats SET summary = ?, summary_upto = ? WHERE chat_id = ? AND (summary_upto IS NULL OR summary_upto = 0)"
+RENAME_CHAT = "UPDATE chats SET title = ?, version = version + 1 WHERE chat_id = ? AND user_id = ? AND title != ?"
+BUMP_VERSION = "UPDATE chats SET version = version + 1 WHERE chat_id = ?"
+DELETE_CHAT = "DELETE FROM chats WHERE chat_id = ? AND user_id = ?"
+DELETE_MESSAGES = "DELETE FROM messages WHERE chat_id = ?"
+INSERT_MESSAGE = "INSERT OR IGNORE INTO messages (chat_id, seq, sender, message, timestamp) VALUES (?, ?, ?, ?, ?)"
+RECENT_MESSAGES = "SELECT seq, sender, message, timestamp FROM messages WHERE chat_id = ? ORDER BY seq DESC LIMIT ?"
+MESSAGES_BEFORE = "SELECT seq, sender, message, timestamp FROM messages WHERE chat_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?"
+MESSAGE_RANGE = "SELECT seq, sender, message, timestamp FROM messages WHERE chat_id = ? AND seq >= ? AND seq < ? ORDER BY seq"
+INSERT_FLAT = "INSERT OR IGNORE INTO flat_records (record_id, user_id, user_input, bot_reply) VALUES (?, ?, ?, ?)"
+RECENT_FLAT = "SELECT user_id, user_input, bot_reply FROM flat_records WHERE user_id = ? ORDER BY id DESC LIMIT ?"
+INSERT_MEMORY = "INSERT OR IGNORE INTO memories (memory_id, user_id, chat_id, sender, message, vector) VALUES (?, ?, ?, ?, ?, ?)"
+LOAD_MEMORIES = "SELECT memory_id, user_id, chat_id, sender, message, vector FROM memories WHERE user_id = ? ORDER BY id DESC LIMIT ?"
+DELETE_MEMORIES = "DELETE FROM memories WHERE chat_id = ?"
+EXPIRE_BATCH_RESULTS = "DELETE FROM batch_results WHERE expires_at <= ?"
+INSERT_BATCH_RESULT = "INSERT OR IGNORE INTO batch_results (user_id, batch_id, item_id, chat_id, response, expires_at) VALUES (?, ?, ?, ?, ?, ?)"
+GET_BATCH_RESULTS = "SELECT item_id, chat_id, response FROM batch_results WHERE user_id = ? AND batch_id = ? AND expires_at > ?"
+# active_key is the dedupe key while a job is queued or running; NULLs never collide
+INSERT_JOB = (
+    "INSERT OR IGNORE INTO jobs (job_id, kind, user_id, chat_id, payload, status, attempts, run_at, created_at, active_key) "
+    "VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?)"
+)
+CLAIM_JOBS = (
+    "UPDATE jobs SET status = 'running', lease_until = ?, attempts = attempts + 1 WHERE job_id IN ("
+    "SELECT job_id FROM jobs WHERE kind = ? AND ((status = 'queued' AND run_at <= ?) OR (status = 'running' AND lease_until < ?)) "
+    "ORDER BY run_at LIMIT ?) RETURNING job_id, kind, user_id, chat_id, payload, status, attempts, run_at, error"
+)
+FINISH_JOB = "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL, active_key = NULL WHERE job_id = ?"
+RETRY_JOB = "UPDATE jobs SET status = 'queued', run_at = ?, error = ?, lease_until = NULL WHERE job_id = ?"
+JOB_STATS = "SELECT status, COUNT(*) AS count, MIN(CASE WHEN run_at <= ? THEN run_at END) AS oldest_due FROM jobs GROUP BY status"
+PURGE_JOBS = "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?"
+
+class SQLiteStorage(Storage):
+    """Embedded storage for single-node installs: one SQLite file in WAL mode
+
+    All statements run on one dedicated thread that owns the connection,
+    which keeps the event loop free and serializes writes the way SQLite
+    wants anyway. Message reads use the (chat_id, seq) primary key, which
+    is the table's clustered index (WITHOUT ROWID).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=64)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL plus NORMAL only syncs at checkpoints; a power loss can drop the last commits, not corrupt
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=OFF")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _transaction(self, work):
+        """Run work(conn) in one write transaction"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _write(self, statements: List[tuple]) -> List[int]:
+        """Run (sql, params) pairs in one transaction, returning each rowcount"""
+        return self._transaction(lambda conn: [conn.execute(sql, params).rowcount for sql, params in statements])
+
+    def _query(self, sql: str, params: tuple) -> List[dict]:
+        return [dict(row) for row in self._connect().execute(sql, params).fetchall()]
+
+    async def ensure_schema(self):
+        def migrate():
+            conn = self._connect()
+            conn.executescript(SCHEMA)
+            # Files created before chats had a version
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(chats)")}
+            if "version" not in columns:
+                conn.execute("ALTER TABLE chats ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        await self._run(migrate)
+
+    async def warmup(self):
+        await self._run(lambda: self._connect().execute("SELECT 1").fetchone())
+
+    async def close(self):
+        if self._executor is None:
+            return
+
+        def close_connection():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(close_connection)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def create_user(self, username: str, password_hash: bytes) -> str:
+        user_id = uuid4().hex
+        await self._run(self._write, [(INSERT_USER, (user_id, username, password_hash))])
+        return user_id
+
+    async def find_user(self, username: str) -> Optional[dict]:
+        rows = await self._run(self._query, FIND_USER, (username,))
+        return rows[0] if rows else None
+
+    async def insert_chat(self, chat: dict):
+        params = (chat["chat_id"], chat["user_id"], chat["title"], chat["created_at"], chat.get("message_count", 0))
+        await self._run(self._write, [(INSERT_CHAT, params)])
+
+    async def list_chats(self, user_id: str) -> List[dict]:
+        return await self._run(self._query, LIST_CHATS, (user_id,))
+
+    async def get_chat(self, chat_id: str) -> Optional[dict]:
+        rows = await self._run(self._query, GET_CHAT, (chat_id,))
+        if not rows:
+            return None
+        # Like Mongo documents, chats without a summary have no summary fields
+        return {k: v for k, v in rows[0].items() if v is not None}
+
+    async def chat_version(self, chat_id: str) -> Optional[int]:
+        rows = await self._run(self._query, CHAT_VERSION, (chat_id,))
+        return rows[0]["version"] if rows else None
+
+    async def reserve_seqs(self, chat_id: str, count: int, user_id: Optional[str] = None) -> Optional[int]:
+        def reserve():
+            conn = self._connect()
+            # fetchall() so the RETURNING statement completes and its implicit transaction commits
+            if user_id is None:
+                rows = conn.execute(RESERVE_SEQS, (count, chat_id)).fetchall()
+            else:
+                rows = conn.execute(RESERVE_SEQS_OWNED, (count, chat_id, user_id)).fetchall()
+            return rows[0][0] - count if rows else None
+        return await self._run(reserve)
+
+    async def release_seqs(self, chat_id: str, first: int, count: int) -> bool:
+        counts = await self._run(self._write, [(RELEASE_SEQS, (first, chat_id, first + count, chat_id, first))])
+        return counts[0] > 0
+
+    async def update_summary(self, chat_id: str, summary: str, upto: int, expected_upto: int) -> bool:
+        if expected_upto:
+            statement = (UPDATE_SUMMARY, (summary, upto, chat_id, expected_upto))
+        else:
+            statement = (UPDATE_FIRST_SUMMARY, (summary, upto, chat_id))
+        counts = await self._run(self._write, [statement])
+        return counts[0] > 0
+
+    async def rename_chat(self, user_id: str, chat_id: str, title: str) -> bool:
+        counts = await self._run(self._write, [(RENAME_CHAT, (title, chat_id, user_id, title))])
+        return counts[0] > 0
+
+    async def delete_chat(self, user_id: str, chat_id: str) -> bool:
+        def delete(conn):
+            deleted = conn.execute(DELETE_CHAT, (chat_id, user_id)).rowcount
+            if deleted:
+                conn.execute(DELETE_MESSAGES, (chat_id,))
+                conn.execute(DELETE_MEMORIES, (chat_id,))
+            return deleted > 0
+        return await self._run(self._transaction, delete)
+
+    async def insert_messages(self, docs: List[dict]):
+        rows = [
+            (doc["chat_id"], doc["seq"], doc["sender"], doc["message"], doc.get("timestamp"))
+            for doc in docs
+        ]
+        chat_ids = [(chat_id,) for chat_id in dict.fromkeys(doc["chat_id"] for doc in docs)]
+
+        def insert(conn):
+            conn.executemany(INSERT_MESSAGE, rows)
+            conn.executemany(BUMP_VERSION, chat_ids)
+        await self._run(self._transaction, insert)
+
+    async def recent_messages(self, chat_id: str, limit: int) -> List[dict]:
+        rows = await self._run(self._query, RECENT_MESSAGES, (chat_id, limit))
+        rows.reverse()
+        return rows
+
+    async def messages_before(self, chat_id: str, before: int, limit: int) -> List[dict]:
+        rows = await self._run(self._query, MESSAGES_BEFORE, (chat_id, before, limit))
+        rows.reverse()
+        return rows
+
+    async def message_range(self, chat_id: str, start: int, end: int) -> List[dict]:
+        return await self._run(self._query, MESSAGE_RANGE, (chat_id, start, end))
+
+    async def insert_flat_records(self, records: List[dict]):
+        # Ids are kept in the dicts so a retried batch is recognised
+        for record in records:
+            record.setdefault("record_id", uuid4().hex)
+        rows = [(r["record_id"], r["user_id"], r["user_input"], r["bot_reply"]) for r in records]
+        await self._run(self._transaction, lambda conn: conn.executemany(INSERT_FLAT, rows))
+
+    async def recent_flat_records(self, user_id: str, limit: int) -> List[dict]:
+        rows = await self._run(self._query, RECENT_FLAT, (user_id, limit))
+        rows.reverse()
+        return rows
+
+    async def insert_memories(self, records: List[dict]):
+        rows = [
+            (r["memory_id"], r["user_id"], r.get("chat_id"), r["sender"], r["message"], r["vector"])
+            for r in records
+        ]
+        await self._run(self._transaction, lambda conn: conn.executemany(INSERT_MEMORY, rows))
+
+    async def load_memories(self, user_id: str, limit: int) -> List[dict]:
+        rows = await self._run(self._query, LOAD_MEMORIES, (user_id, limit))
+        rows.reverse()
+        return [{k: v for k, v in row.items() if v is not None} for row in rows]
+
+    async def save_batch_results(self, user_id: str, batch_id: str, results: List[dict], ttl: int):
+        now = time.time()
+        rows = [
+            (user_id, batch_id, r["item_id"], r.get("chat_id"), r["response"], now + ttl)
+            for r in results
+        ]
+
+        def save(conn):
+            # No TTL index here: expired rows are cleared whenever new ones are written
+            conn.execute(EXPIRE_BATCH_RESULTS, (now,))
+            conn.executemany(INSERT_BATCH_RESULT, rows)
+        await self._run(self._transaction, save)
+
+    async def get_batch_results(self, user_id: str, batch_id: str) -> Dict[str, dict]:
+        rows = await self._run(self._query, GET_BATCH_RESULTS, (user_id, batch_id, time.time()))
+        return {row["item_id"]: {k: v for k, v in row.items() if v is not None} for row in rows}
+
+    async def enqueue_job(self, job: dict, dedupe_key: Optional[str] = None) -> bool:
+        params = (
+            job["job_id"], job["kind"], job.get("user_id"), job.get("chat_id"), json.dumps(job.get("payload") or {}),
+            job["run_at"], time.time(), dedupe_key
+        )
+        counts = await self._run(self._write, [(INSERT_JOB, params)])
+        return counts[0] > 0
+
+    async def claim_jobs(self, kind: str, limit: int, lease: float) -> List[dict]:
+        now = time.time()
+        rows = await self._run(self._transaction, lambda conn: [
+            dict(row) for row in conn.execute(CLAIM_JOBS, (now + lease, kind, now, now, limit)).fetchall()
+        ])
+        rows.sort(key=lambda row: row["run_at"])
+        for row in rows:
+            row["payload"] = json.loads(row["payload"])
+        return [{k: v for k, v in row.items() if v is not None} for row in rows]
+
+    async def finish_job(self, job_id: str, error: Optional[str] = None):
+        status = "failed" if error else "done"
+        await self._run(self._write, [(FINISH_JOB, (status, error, time.time(), job_id))])
+
+    async def retry_job(self, job_id: str, run_at: float, error: str):
+        await self._run(self._write, [(RETRY_JOB, (run_at, error, job_id))])
+
+    async def job_stats(self) -> dict:
+        rows = await self._run(self._query, JOB_STATS, (time.time(),))
+        stats = {"queued": 0, "running": 0, "done": 0, "failed": 0, "oldest_due": None}
+        for row in rows:
+            stats[row["status"]] = row["count"]
+            if row["status"] == "queued":
+                stats["oldest_due"] = row["oldest_due"]
+        return stats
+
+    async def purge_jobs(self, finished_before: float) -> int:
+        counts = await self._run(self._write, [(PURGE_JOBS, (finished_before,))])
+        return counts[0]
@@ -0,0 +1,178 @@
+from core.config import settings
+from typing import Dict, List, Optional
+
+class Storage:
+    """Persistence for users, chats, messages and flat /api/chat records
+
+    Implementations: MongoStorage (core/mongo_storage.py) and SQLiteStorage
+    (core/sqlite_storage.py), selected with STORAGE_BACKEND. Messages are
+    dicts {chat_id, seq, sender, message, timestamp}; message reads return
+    them oldest first, with `seq` but without `chat_id`. Each chat has a
+    `version` that goes up whenever its messages or title change (0 or
+    absent for a new chat), so readers can tell whether anything changed
+    without loading messages. Ownership checks and caching live above this
+    layer, in services/chat_store.py.
+    """
+
+    # Lifecycle
+    async def ensure_schema(self):
+        """Create tables/indexes the queries rely on (idempotent)"""
+        raise NotImplementedError
+
+    async def warmup(self):
+        """Open connections ahead of the first request"""
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    # Users
+    async def create_user(self, username: str, password_hash: bytes) -> str:
+        """Insert a user and return its id"""
+        raise NotImplementedError
+
+    async def find_user(self, username: str) -> Optional[dict]:
+        """{user_id, username, password} or None"""
+        raise NotImplementedError
+
+    # Chats
+    async def insert_chat(self, chat: dict):
+        raise NotImplementedError
+
+    async def list_chats(self, user_id: str) -> List[dict]:
+        """{chat_id, title, created_at} of a user's chats, oldest first"""
+        raise NotImplementedError
+
+    async def get_chat(self, chat_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def chat_version(self, chat_id: str) -> Optional[int]:
+        """Just the chat's version, a cheap read for revalidating cached data (None if no such chat)"""
+        raise NotImplementedError
+
+    async def reserve_seqs(self, chat_id: str, count: int, user_id: Optional[str] = None) -> Optional[int]:
+        """Atomically bump message_count by `count`, returning the first reserved seq (None if no such chat)"""
+        raise NotImplementedError
+
+    async def release_seqs(self, chat_id: str, first: int, count: int) -> bool:
+        """Undo reserve_seqs if it was the latest reservation and none of its seqs were stored
+
+        Resets message_count to `first`, returning False (and changing
+        nothing) if a later reservation or one of the messages got in first.
+        """
+        raise NotImplementedError
+
+    async def update_summary(self, chat_id: str, summary: str, upto: int, expected_upto: int) -> bool:
+        """Set summary/summary_upto only if summary_upto is still `expected_upto` (0 matches unset)"""
+        raise NotImplementedError
+
+    async def rename_chat(self, user_id: str, chat_id: str, title: str) -> bool:
+        """Set the title and bump the version, returning False if the title was already `title`"""
+        raise NotImplementedError
+
+    async def delete_chat(self, user_id: str, chat_id: str) -> bool:
+        """Delete a chat with its messages and memories, returning False if it did not exist"""
+        raise NotImplementedError
+
+    # Messages
+    async def insert_messages(self, docs: List[dict]):
+        """Insert sequenced messages, possibly spanning chats, then bump each chat's version
+
+        Messages already stored are ignored. The version goes up after the
+        messages are visible, so a reader never pairs a new version with old
+        messages.
+        """
+        raise NotImplementedError
+
+    async def recent_messages(self, chat_id: str, limit: int) -> List[dict]:
+        raise NotImplementedError
+
+    async def messages_before(self, chat_id: str, before: int, limit: int) -> List[dict]:
+        """Up to `limit` messages with seq < before, the newest of them"""
+        raise NotImplementedError
+
+    async def message_range(self, chat_id: str, start: int, end: int) -> List[dict]:
+        """Messages with start <= seq < end"""
+        raise NotImplementedError
+
+    # Flat /api/chat records
+    async def insert_flat_records(self, records: List[dict]):
+        """Insert {user_id, user_input, bot_reply} records; retrying the same dicts is safe"""
+        raise NotImplementedError
+
+    async def recent_flat_records(self, user_id: str, limit: int) -> List[dict]:
+        """A user's newest `limit` records, oldest first"""
+        raise NotImplementedError
+
+    # Embedded messages for long-term memory (see services/memory.py)
+    async def insert_memories(self, records: List[dict]):
+        """Insert {memory_id, user_id, chat_id, sender, message, vector} records; vector is float32 bytes"""
+        raise NotImplementedError
+
+    async def load_memories(self, user_id: str, limit: int) -> List[dict]:
+        """A user's newest `limit` memory records, oldest first"""
+        raise NotImplementedError
+
+    # Batch results (see services/batch_service.py)
+    async def save_batch_results(self, user_id: str, batch_id: str, results: List[dict], ttl: int):
+        """Store completed {item_id, response, chat_id?} results for `ttl` seconds; saving one again is a no-op"""
+        raise NotImplementedError
+
+    async def get_batch_results(self, user_id: str, batch_id: str) -> Dict[str, dict]:
+        """Unexpired results of a batch by item_id"""
+        raise NotImplementedError
+
+    # Background jobs (see services/jobs.py). Jobs are dicts {job_id, kind,
+    # user_id, chat_id, payload, status, attempts, run_at, error?}; times
+    # are epoch seconds and status is queued, running, done or failed.
+    async def enqueue_job(self, job: dict, dedupe_key: Optional[str] = None) -> bool:
+        """Insert a queued job; False if a queued or running job already has `dedupe_key`"""
+        raise NotImplementedError
+
+    async def claim_jobs(self, kind: str, limit: int, lease: float) -> List[dict]:
+        """Mark up to `limit` due jobs of `kind` running for `lease` seconds, oldest run_at first
+
+        Running jobs whose lease has expired (their worker died) are claimed
+        again. Each claim counts as an attempt.
+        """
+        raise NotImplementedError
+
+    async def finish_job(self, job_id: str, error: Optional[str] = None):
+        """Mark a job done, or failed with `error`, releasing its dedupe key"""
+        raise NotImplementedError
+
+    async def retry_job(self, job_id: str, run_at: float, error: str):
+        """Queue a job again to run at `run_at`"""
+        raise NotImplementedError
+
+    async def job_stats(self) -> dict:
+        """Job counts by status, plus `oldest_due`: the earliest run_at of queued jobs already due (or None)"""
+        raise NotImplementedError
+
+    async def purge_jobs(self, finished_before: float) -> int:
+        """Delete done and failed jobs finished before the given time, returning how many"""
+        raise NotImplementedError
+
+_storage: Optional[Storage] = None
+
+def _build_storage() -> Storage:
+    if settings.STORAGE_BACKEND == "sqlite":
+        from core.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(settings.SQLITE_PATH)
+    if settings.STORAGE_BACKEND == "mongo":
+        from core.mongo_storage import MongoStorage
+        return MongoStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+
+def get_storage() -> Storage:
+    """Configured storage backend, created on first use"""
+    global _storage
+    if _storage is None:
+        _storage = _build_storage()
+    return _storage
+
+def set_storage(storage: Optional[Storage]) -> Optional[Storage]:
+    """Swap the storage backend (e.g. in benchmarks), returning the previous one"""
+    global _storage
+    previous, _storage = _storage, storage
+    return previous
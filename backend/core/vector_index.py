@@ -0,0 +1,67 @@
+from typing import List, Optional, Sequence, Tuple
+import numpy as np #type: ignore
+
+class VectorIndex:
+    """In-memory exact cosine search over unit vectors in one float32 matrix
+
+    Vectors live in a single preallocated array that doubles as it fills,
+    so adding is amortized O(1) and a search is one matrix product. Each
+    vector carries an opaque payload. With `max_size` set, the oldest
+    vectors are dropped once it is exceeded.
+    """
+    def __init__(self, dim: int, capacity: int = 256, max_size: Optional[int] = None):
+        self.dim = dim
+        self.max_size = max_size
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._payloads: list = []
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the vector matrix (payloads not included)"""
+        return self._vectors.nbytes
+
+    def add(self, vectors: np.ndarray, payloads: Sequence):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(vectors) != len(payloads):
+            raise ValueError("One payload per vector is required")
+        size, count = len(self), len(vectors)
+        if self.max_size is not None and size + count > self.max_size:
+            # Drop a tenth extra so eviction's copy is not paid on every add
+            drop = min(size, size + count - self.max_size + self.max_size // 10)
+            self._vectors[:size - drop] = self._vectors[drop:size]
+            del self._payloads[:drop]
+            size -= drop
+            vectors, payloads = vectors[-self.max_size:], list(payloads)[-self.max_size:]
+            count = len(vectors)
+
+        if size + count > len(self._vectors):
+            capacity = max(size + count, len(self._vectors) * 2)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:size] = self._vectors[:size]
+            self._vectors = grown
+        self._vectors[size:size + count] = vectors
+        self._payloads.extend(payloads)
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[float, object]]]:
+        """Top-k (score, payload) pairs per query row, best first"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        size = len(self)
+        k = min(k, size)
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ self._vectors[:size].T
+        if k < size:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(size), (len(queries), size))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(float(score), self._payloads[i]) for i, score in zip(row, row_scores)]
+            for row, row_scores in zip(top, top_scores)
+        ]
@@ -1,8 +1,10 @@
 from pydantic import BaseModel #type: ignore
+from typing import List, Optional
 
 class ChatRequest(BaseModel):
     user_id: str
     message: str
+    bypass_cache: bool = False
 
 class ChatResponse(BaseModel):
     response: str
@@ -15,6 +17,7 @@ class SendMessageRequest(BaseModel):
     user_id: str
     chat_id: str
     message: str
+    bypass_cache: bool = False
 
 class ChatSummary(BaseModel):
     chat_id: str
@@ -26,17 +29,33 @@ class ChatMessage(BaseModel):
     message: str
     timestamp: str
 
+class ChatHistoryPage(BaseModel):
+    messages: List[ChatMessage]
+    next_cursor: Optional[int] = None
+
 class RenameRequest(BaseModel):
     new_title: str
 
+class BatchItem(BaseModel):
+    id: Optional[str] = None  # defaults to the item's position; reuse ids to resume
+    user_id: Optional[str] = None  # defaults to the session user
+    chat_id: Optional[str] = None  # without one the item is a flat /api/chat exchange
+    message: str
+    bypass_cache: bool = False
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    batch_id: Optional[str] = None
+    concurrency: Optional[int] = None
+
 
 #This is how the chats are stored.
-# { user_id: XXXXXXXXXXX 
-#   chats : {
-#               {
-#                   chat_id: XXXXXX,
-#                    created_at: creation_date
-#                   chats: {all the messages and bot messages in this chat}
-#               }
-    # If a user choses to create a new chat then another chat dict should appear with "chat_id, created_at, chats"
-# #
\ No newline at end of file
+# chats collection, one document per chat:
+#   { chat_id, user_id, title, created_at, message_count, summary, summary_upto }
+#   summary condenses messages with seq < summary_upto (see services/prompt_builder.py)
+#   indexed on chat_id (unique) and (user_id, created_at)
+# messages collection, one document per message:
+#   { chat_id, seq, sender, message, timestamp }
+#   indexed on (chat_id, seq) (unique); seq runs 0..message_count-1
+# Older deployments kept every chat inside one { user_id, chats: [...] }
+# document; scripts/migrate_chats.py converts those.
@@ -1,4 +1,5 @@
 from pydantic import BaseModel #type: ignore
+from typing import Optional
 
 class UserCreate(BaseModel):
     username: str
@@ -10,4 +11,5 @@ class UserLogin(BaseModel):
 
 class UserResponse(BaseModel):
     user_id: str
-    username: str
\ No newline at end of file
+    username: str
+    token: Optional[str] = None
\ No newline at end of file
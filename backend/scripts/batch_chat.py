@@ -0,0 +1,128 @@
+"""Run a file of chat items through POST /api/batch and collect the results
+
+Input is NDJSON (or a JSON list) of {id?, chat_id?, message, bypass_cache?}
+items; items without an id are numbered by position. Items are sent in
+chunks and results are appended to --output as they stream back. Run the
+same command again after a failure to resume: items already "ok" in the
+output file are skipped, and the batch id (derived from the input file
+unless given) lets the server replay anything it stored but never sent.
+
+    python -m scripts.batch_chat items.ndjson --output results.ndjson --username alice --password ...
+    python -m scripts.batch_chat items.ndjson --output results.ndjson --token $TOKEN --concurrency 16
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import httpx #type: ignore
+
+def load_items(path: str) -> list:
+    with open(path, "rb") as f:
+        data = f.read()
+    text = data.decode("utf-8")
+    if text.lstrip().startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for index, item in enumerate(items):
+        item.setdefault("id", str(index))
+    return items
+
+def default_batch_id(path: str) -> str:
+    with open(path, "rb") as f:
+        return "file-" + hashlib.sha256(f.read()).hexdigest()[:24]
+
+def completed_ids(path: str) -> set:
+    """Ids already reported ok in an earlier run's output"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by the earlier failure
+            if result.get("type") == "result" and result.get("status") == "ok":
+                done.add(result["id"])
+    return done
+
+def login(client: httpx.Client, username: str, password: str) -> str:
+    response = client.post("/api/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["token"]
+
+def send_chunk(client: httpx.Client, items: list, batch_id: str, concurrency: int, output, done: set) -> int:
+    """Stream one chunk's results into `output`; returns the number of failed items"""
+    body = "".join(json.dumps(item) + "\n" for item in items)
+    failed = 0
+    with client.stream(
+        "POST", "/api/batch",
+        params={"batch_id": batch_id, "concurrency": concurrency},
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"}
+    ) as response:
+        if response.status_code != 200:
+            response.read()
+            raise SystemExit(f"Batch rejected ({response.status_code}): {response.text}")
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            if result["type"] != "result":
+                continue
+            output.write(line + "\n")
+            output.flush()
+            if result["status"] == "ok":
+                done.add(result["id"])
+            else:
+                failed += 1
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="NDJSON or JSON list of items")
+    parser.add_argument("--output", required=True, help="NDJSON results, appended to when resuming")
+    parser.add_argument("--url", default=os.getenv("CHATBOT_URL", "http://localhost:8000"))
+    parser.add_argument("--token", default=os.getenv("CHATBOT_TOKEN"))
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--batch-id", help="defaults to a hash of the input file")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="items per request")
+    parser.add_argument("--retries", type=int, default=3, help="attempts per chunk on connection errors")
+    args = parser.parse_args()
+
+    items = load_items(args.input)
+    batch_id = args.batch_id or default_batch_id(args.input)
+    done = completed_ids(args.output)
+    todo = [item for item in items if item["id"] not in done]
+    print(f"batch {batch_id}: {len(items)} items, {len(items) - len(todo)} already done", file=sys.stderr)
+
+    failed = 0
+    with httpx.Client(base_url=args.url, timeout=httpx.Timeout(30, read=None)) as client:
+        token = args.token or login(client, args.username, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+        with open(args.output, "a", encoding="utf-8") as output:
+            for start in range(0, len(todo), args.chunk_size):
+                chunk = todo[start:start + args.chunk_size]
+                for attempt in range(1, args.retries + 1):
+                    pending = [item for item in chunk if item["id"] not in done]
+                    if not pending:
+                        break
+                    try:
+                        failed += send_chunk(client, pending, batch_id, args.concurrency, output, done)
+                        break
+                    except httpx.TransportError as e:
+                        if attempt == args.retries:
+                            raise SystemExit(f"Giving up after {attempt} attempts: {e}; rerun to resume")
+                        time.sleep(2 ** attempt)
+                print(f"{len(done)}/{len(items)} ok, {failed} failed", file=sys.stderr)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
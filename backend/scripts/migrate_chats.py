@@ -0,0 +1,89 @@
+"""Split legacy per-user chat documents into the chats and messages collections
+
+Legacy documents in the "chat" collection look like
+{user_id, chats: [{chat_id, title, created_at, history: [...]}]}. They are
+streamed through a cursor and written out in bulk batches, so memory stays
+bounded regardless of collection size. Re-running is safe: chats and
+messages are upserted on their natural keys.
+
+    python -m scripts.migrate_chats [--batch-size 1000] [--dry-run] [--delete-source]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import ASCENDING, UpdateOne #type: ignore
+from core.mongo import get_db, chat_collection
+
+def chat_ops(user_id: str, chat: dict):
+    """Yield upserts for one legacy chat and its messages"""
+    history = chat.get("history", [])
+    yield "chats", UpdateOne(
+        {"chat_id": chat["chat_id"]},
+        {"$setOnInsert": {
+            "user_id": user_id,
+            "title": chat.get("title", "New Chat"),
+            "created_at": chat.get("created_at"),
+            "message_count": len(history)
+        }},
+        upsert=True
+    )
+    for seq, msg in enumerate(history):
+        yield "messages", UpdateOne(
+            {"chat_id": chat["chat_id"], "seq": seq},
+            {"$setOnInsert": {
+                "sender": msg["sender"],
+                "message": msg["message"],
+                "timestamp": msg.get("timestamp")
+            }},
+            upsert=True
+        )
+
+def migrate(batch_size: int, dry_run: bool, delete_source: bool):
+    db = get_db()
+    chats, messages = db["chats"], db["messages"]
+    if not dry_run:
+        chats.create_index("chat_id", unique=True)
+        chats.create_index([("user_id", ASCENDING), ("created_at", ASCENDING)])
+        messages.create_index([("chat_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+
+    pending = {"chats": [], "messages": []}
+    migrated_ids = []
+    totals = {"users": 0, "chats": 0, "messages": 0}
+
+    def flush():
+        if not dry_run:
+            # Chats first so a crash never leaves messages without a parent
+            for name in ("chats", "messages"):
+                if pending[name]:
+                    db[name].bulk_write(pending[name], ordered=False)
+            if delete_source and migrated_ids:
+                chat_collection.delete_many({"_id": {"$in": migrated_ids}})
+        for name in pending:
+            totals[name] += len(pending[name])
+            pending[name].clear()
+        migrated_ids.clear()
+
+    cursor = chat_collection.find({"chats": {"$exists": True}}, batch_size=batch_size)
+    for user_doc in cursor:
+        for chat in user_doc.get("chats", []):
+            for name, op in chat_ops(user_doc["user_id"], chat):
+                pending[name].append(op)
+        migrated_ids.append(user_doc["_id"])
+        totals["users"] += 1
+        if len(pending["chats"]) + len(pending["messages"]) >= batch_size:
+            flush()
+    flush()
+
+    action = "Would migrate" if dry_run else "Migrated"
+    print(f"{action} {totals['users']} users, {totals['chats']} chats, {totals['messages']} messages")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split legacy chat documents into chats/messages")
+    parser.add_argument("--batch-size", type=int, default=1000, help="write operations per bulk_write")
+    parser.add_argument("--dry-run", action="store_true", help="count what would be migrated without writing")
+    parser.add_argument("--delete-source", action="store_true", help="delete legacy documents once migrated")
+    args = parser.parse_args()
+    migrate(args.batch_size, args.dry_run, args.delete_source)
@@ -1,50 +1,109 @@
 from fastapi import FastAPI, Request, HTTPException #type: ignore
 from fastapi.middleware.cors import CORSMiddleware #type: ignore
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from anyio import to_thread #type: ignore
 from api.routes import router
+from api import ws
+from core.admission import AdmissionMiddleware, build_controller
+from core.compression import CompressionMiddleware
+from core.config import settings
 from core.exceptions import APIException
-from core.logging import setup_logging, log_request, log_error
+from core import metrics
+from core.gemini import get_model
+from core.logging import setup_logging, shutdown_logging, log_request, log_error, log_info, request_id_var
+from core.storage import get_storage
+from services.write_behind import writer
+from services import jobs
+from core.security import get_signing_key, shutdown_password_pool
+from contextlib import asynccontextmanager
+import logging
 import time
+import uuid
 import warnings
 
 warnings.filterwarnings('ignore')
 
-# Setup logging
-logger = setup_logging()
+logger = logging.getLogger('llm_chatbot')
 
-app = FastAPI(title="LLM Chatbot API", version="1.0.0")
+async def warmup():
+    """Connect to storage and build the model so the first request doesn't pay for it"""
+    start_time = time.perf_counter()
+    try:
+        await get_storage().warmup()
+    except Exception as e:
+        log_error(e, "warmup_storage")
+    try:
+        get_model()
+    except Exception as e:
+        log_error(e, "warmup_model")
+    log_info("Warmup finished in %.3fs", time.perf_counter() - start_time)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Set up logging and clients in the serving process, and release them on shutdown
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    Everything here runs after any pre-fork worker split, so no socket or
+    thread is shared between workers. The worker only starts accepting
+    requests (and answering /health) once this completes.
+    """
+    setup_logging()
+    # Refuse to serve sessions anyone could forge
+    get_signing_key()
+    to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+    try:
+        await get_storage().ensure_schema()
+    except Exception as e:
+        log_error(e, "ensure_schema")
+    if settings.STARTUP_WARMUP:
+        await warmup()
+    if writer is not None:
+        writer.start()
+    if jobs.queue is not None:
+        jobs.queue.start()
+    yield
+    if jobs.queue is not None:
+        await jobs.queue.stop()
+    if writer is not None:
+        await writer.stop()
+    shutdown_password_pool()
+    await get_storage().close()
+    shutdown_logging()
 
-@app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Middleware to log all requests"""
+    """Tag each request with an ID, log it and record its latency (to response start for streams)"""
     start_time = time.time()
-    
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    metrics.http_requests_in_flight.inc()
+    status = 500
+
     # Log request start
-    logger.info(f"Request started: {request.method} {request.url.path}")
-    
+    logger.debug("Request started: %s %s", request.method, request.url.path)
+
     try:
         response = await call_next(request)
         duration = time.time() - start_time
-        
+        status = response.status_code
+
         # Log request completion
         log_request(request.method, request.url.path, response.status_code, duration)
-        
+
+        response.headers["X-Request-ID"] = request_id
         return response
     except Exception as e:
         duration = time.time() - start_time
         log_error(e, f"Request {request.method} {request.url.path}")
         raise
+    finally:
+        metrics.http_requests_in_flight.dec()
+        metrics.http_request_duration.observe(
+            time.time() - start_time,
+            method=request.method,
+            route=metrics.route_label(request.scope) or "unmatched",
+            status=status
+        )
+        request_id_var.reset(token)
 
-@app.exception_handler(APIException)
 async def api_exception_handler(request: Request, exc: APIException):
     """Handle custom API exceptions"""
     log_error(exc, f"API Exception in {request.method} {request.url.path}")
@@ -53,7 +112,6 @@ async def api_exception_handler(request: Request, exc: APIException):
         content={"error": exc.message}
     )
 
-@app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle general exceptions"""
     log_error(exc, f"General Exception in {request.method} {request.url.path}")
@@ -62,10 +120,46 @@ async def general_exception_handler(request: Request, exc: Exception):
         content={"error": "Internal server error"}
     )
 
-app.include_router(router, prefix="/api")
-
-@app.get("/health")
 async def health_check():
     """Health check endpoint"""
     logger.info("Health check requested")
     return {"status": "healthy", "message": "LLM Chatbot API is running"}
+
+async def prometheus_metrics():
+    """Prometheus text exposition of request, Gemini, Mongo and threadpool metrics"""
+    metrics.sample_threadpool()
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+def create_app() -> FastAPI:
+    """Build the application; clients are created later, in the lifespan"""
+    app = FastAPI(title="LLM Chatbot API", version="1.0.0", lifespan=lifespan)
+
+    # Shared with the routes that admit work themselves: WebSocket messages, batch items
+    app.state.admission = build_controller() if settings.ADMISSION_ENABLED else None
+    # Innermost, so refused requests still get CORS headers and are logged
+    if app.state.admission is not None:
+        app.add_middleware(AdmissionMiddleware, controller=app.state.admission)
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(CompressionMiddleware)
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.middleware("http")(log_requests)
+
+    app.add_exception_handler(APIException, api_exception_handler)
+    app.add_exception_handler(Exception, general_exception_handler)
+
+    app.include_router(router, prefix="/api")
+    app.include_router(ws.router)
+    app.get("/health")(health_check)
+    app.get("/metrics", response_class=PlainTextResponse)(prometheus_metrics)
+    return app
+
+# For `uvicorn server:app`; `uvicorn --factory server:create_app` builds it per worker instead
+app = create_app()
@@ -0,0 +1,242 @@
+from core.admission import AdmissionController
+from core.config import settings
+from core.exceptions import APIException
+from core.gemini import agenerate_response
+from core.logging import log_error, log_info
+from core.storage import get_storage
+from models.chat import BatchItem
+from services import chat_store, memory, write_behind
+from services.chat_service import get_user_history
+from services.chat_titles import title_new_chat
+from services.prompt_builder import PromptPrefix, chat_prompt_prefix
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import json
+
+MAX_MESSAGE_CHARS = 2000
+
+def _line(data: dict) -> str:
+    return json.dumps(data) + "\n"
+
+class BatchRun:
+    """One /api/batch request: fan items out to the model and stream NDJSON results
+
+    At most `concurrency` items are generated at a time (all of them still
+    share the global GEMINI_MAX_CONCURRENCY limit). Each item is answered
+    against its chat, or the user's flat /api/chat history, as it was when
+    the batch started, so items do not see each other's replies. Completed
+    items are written in bulk, and an item is only reported "ok" once its
+    exchange and its result record are stored. Sending the same batch_id
+    again replays stored results and generates only the rest; a crash
+    between the two writes can store that item's exchange twice. With
+    `admission`, each generated item costs a rate token, waited for as the
+    batch goes.
+    """
+    def __init__(self, session_user: str, batch_id: str, items: List[BatchItem], concurrency: Optional[int] = None,
+                 admission: Optional[AdmissionController] = None):
+        self.session_user = session_user
+        self.batch_id = batch_id
+        self.admission = admission
+        self.concurrency = min(max(1, concurrency or settings.BATCH_CONCURRENCY), settings.BATCH_MAX_CONCURRENCY)
+        self.entries = [self._entry(index, item) for index, item in enumerate(items)]
+        self._contexts: Dict[tuple, asyncio.Future] = {}
+
+    def _entry(self, index: int, item: BatchItem) -> dict:
+        return {
+            "index": index,
+            "id": item.id if item.id is not None else str(index),
+            "user_id": item.user_id or self.session_user,
+            "chat_id": item.chat_id,
+            "message": item.message,
+            "use_cache": not item.bypass_cache
+        }
+
+    def _invalid(self, entry: dict, seen: set) -> Optional[str]:
+        if entry["id"] in seen:
+            return "Duplicate item id"
+        seen.add(entry["id"])
+        if entry["user_id"] != self.session_user:
+            return "Not allowed to access another user's chats"
+        if not entry["message"] or len(entry["message"].strip()) == 0:
+            return "Message cannot be empty"
+        if len(entry["message"]) > MAX_MESSAGE_CHARS:
+            return f"Message too long (max {MAX_MESSAGE_CHARS} characters)"
+        return None
+
+    async def _load_context(self, user_id: str, chat_id: Optional[str]):
+        if chat_id is None:
+            prefix = PromptPrefix()
+            prefix.extend(await get_user_history(user_id))
+            return None, 0, prefix
+        chat = await chat_store.get_chat(user_id, chat_id)
+        await write_behind.sync_chat(chat_id)
+        # Copied: the shared prefix moves on as the batch's own replies are stored
+        return chat.get("summary"), chat.get("summary_upto") or 0, (await chat_prompt_prefix(chat_id)).copy()
+
+    async def _context(self, entry: dict):
+        """(summary, summary_upto, prompt prefix) for an item, loaded once per chat (or user) per batch"""
+        key = (entry["user_id"], entry["chat_id"])
+        if key not in self._contexts:
+            self._contexts[key] = asyncio.ensure_future(self._load_context(*key))
+        return await self._contexts[key]
+
+    async def _answer(self, entry: dict) -> str:
+        if self.admission is not None:
+            await self.admission.charge(entry["user_id"])
+        summary, upto, prefix = await self._context(entry)
+        memories = await memory.recall(entry["user_id"], entry["message"], prefix.window(upto))
+        return await agenerate_response(prefix.build(entry["message"], summary, memories, upto), use_cache=entry["use_cache"])
+
+    async def _store(self, completed: List[dict]):
+        """Write a group of answered items in as few round trips as possible
+
+        Returns (ok lines, error lines) for the group.
+        """
+        completed.sort(key=lambda entry: entry["index"])
+        by_chat: Dict[str, List[dict]] = {}
+        flat = []
+        for entry in completed:
+            if entry["chat_id"] is None:
+                flat.append(entry)
+            else:
+                by_chat.setdefault(entry["chat_id"], []).append(entry)
+
+        reserved = {}
+
+        async def reserve(chat_id: str, entries: List[dict]):
+            # Messages queued by other requests get their seqs first
+            await write_behind.sync_chat(chat_id)
+            first_seq = await chat_store.reserve_seqs(chat_id, len(entries) * 2, entries[0]["user_id"])
+            if first_seq is not None:
+                reserved[chat_id] = (first_seq, len(entries) * 2)
+            return first_seq
+
+        missing, stored, docs, titled = [], [], [], []
+        try:
+            first_seqs = await asyncio.gather(*[reserve(chat_id, entries) for chat_id, entries in by_chat.items()])
+            for (chat_id, entries), first_seq in zip(by_chat.items(), first_seqs):
+                if first_seq is None:
+                    # Deleted while the batch ran
+                    missing.extend(entries)
+                    continue
+                for i, entry in enumerate(entries):
+                    timestamp = datetime.utcnow().isoformat()
+                    docs.append({"chat_id": chat_id, "seq": first_seq + 2 * i, "sender": "user", "message": entry["message"], "timestamp": timestamp})
+                    docs.append({"chat_id": chat_id, "seq": first_seq + 2 * i + 1, "sender": "bot", "message": entry["reply"], "timestamp": timestamp})
+                stored.extend(entries)
+                if first_seq == 0:
+                    titled.append((entries[0]["user_id"], chat_id))
+            if docs:
+                await chat_store.insert_messages_bulk(docs)
+
+            if flat:
+                await write_behind.sync_user(self.session_user)
+                await get_storage().insert_flat_records([
+                    {"user_id": entry["user_id"], "user_input": entry["message"], "bot_reply": entry["reply"]}
+                    for entry in flat
+                ])
+                stored.extend(flat)
+
+            if stored:
+                await get_storage().save_batch_results(self.session_user, self.batch_id, [
+                    {"item_id": entry["id"], "response": entry["reply"], **({"chat_id": entry["chat_id"]} if entry["chat_id"] else {})}
+                    for entry in stored
+                ], settings.BATCH_RESULT_TTL)
+        except Exception as e:
+            log_error(e, "store_batch_results")
+            for chat_id, (first_seq, count) in reserved.items():
+                await chat_store.release_seqs(chat_id, first_seq, count)
+            # Not recorded as done, so resuming the batch retries them
+            failed = [entry for entry in completed if entry not in missing]
+            return [], [self._error(entry, "Chat not found") for entry in missing] + [self._error(entry, "Failed to store result") for entry in failed]
+
+        for user_id, chat_id in titled:
+            await title_new_chat(user_id, chat_id)
+        memory.remember_later(self.session_user, [
+            {"chat_id": entry["chat_id"], "sender": sender, "message": text}
+            for entry in stored
+            for sender, text in (("user", entry["message"]), ("bot", entry["reply"]))
+        ])
+        ok = [self._ok(entry["id"], entry["reply"], entry["chat_id"]) for entry in stored]
+        return ok, [self._error(entry, "Chat not found") for entry in missing]
+
+    def _ok(self, item_id: str, response: str, chat_id: Optional[str], resumed: bool = False) -> str:
+        result = {"type": "result", "id": item_id, "status": "ok", "response": response}
+        if chat_id:
+            result["chat_id"] = chat_id
+        if resumed:
+            result["resumed"] = True
+        return _line(result)
+
+    def _error(self, entry: dict, message: str) -> str:
+        return _line({"type": "result", "id": entry["id"], "status": "error", "error": message})
+
+    async def results(self) -> AsyncIterator[str]:
+        """NDJSON lines: a "batch" header, one "result" per item as it completes, then a "summary" """
+        previous = await get_storage().get_batch_results(self.session_user, self.batch_id)
+        counts = {"ok": 0, "error": 0, "resumed": 0}
+        lines, todo, seen = [], [], set()
+        for entry in self.entries:
+            invalid = self._invalid(entry, seen)
+            if invalid:
+                lines.append(self._error(entry, invalid))
+            elif entry["id"] in previous:
+                stored = previous[entry["id"]]
+                lines.append(self._ok(entry["id"], stored["response"], stored.get("chat_id"), resumed=True))
+                counts["resumed"] += 1
+            else:
+                todo.append(entry)
+        counts["error"] = len(lines) - counts["resumed"]
+
+        yield _line({"type": "batch", "batch_id": self.batch_id, "items": len(self.entries), "resumed": counts["resumed"]})
+        for line in lines:
+            yield line
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.BATCH_WRITE_SIZE)
+        todo_iter = iter(todo)
+
+        async def worker():
+            # Workers share one iterator, so at most `concurrency` items are in flight
+            for entry in todo_iter:
+                try:
+                    entry["reply"] = await self._answer(entry)
+                    await queue.put((entry, None))
+                except APIException as e:
+                    await queue.put((entry, e.message))
+                except Exception as e:
+                    log_error(e, "batch_generate")
+                    await queue.put((entry, "AI service unavailable"))
+
+        loop = asyncio.get_running_loop()
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(todo)))]
+        remaining, completed, flush_at = len(todo), [], None
+        try:
+            while remaining:
+                timeout = None if flush_at is None else max(0.0, flush_at - loop.time())
+                try:
+                    entry, error = await asyncio.wait_for(queue.get(), timeout)
+                    remaining -= 1
+                    if error:
+                        counts["error"] += 1
+                        yield self._error(entry, error)
+                    else:
+                        completed.append(entry)
+                        flush_at = flush_at or loop.time() + settings.BATCH_FLUSH_INTERVAL
+                except asyncio.TimeoutError:
+                    pass
+
+                if completed and (len(completed) >= settings.BATCH_WRITE_SIZE or not remaining or loop.time() >= flush_at):
+                    ok, errors = await self._store(completed)
+                    counts["ok"] += len(ok)
+                    counts["error"] += len(errors)
+                    for line in ok + errors:
+                        yield line
+                    completed, flush_at = [], None
+        finally:
+            # Client gone or done; unstored replies are regenerated if the batch is resumed
+            for task in workers:
+                task.cancel()
+
+        log_info("Batch %s finished: %s ok, %s failed, %s resumed", self.batch_id, counts["ok"], counts["error"], counts["resumed"])
+        yield _line({"type": "summary", **counts})
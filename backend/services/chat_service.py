@@ -1,19 +1,25 @@
-from core.gemini import generate_response
-from core.mongo import chat_collection #type: ignore
-from core.exceptions import ValidationException, NotFoundException
+from core.gemini import agenerate_response
+from core.storage import get_storage
+from core.exceptions import ValidationException, NotFoundException, ServiceUnavailableException
 from core.logging import log_error, log_info
 from models.chat import ChatRequest
+from services.prompt_builder import build_prompt, render_message
+from services import memory, write_behind
+from core.config import settings
 
-def get_user_history(user_id: str, limit=10):
-    """Get user chat history"""
+async def get_user_history(user_id: str, limit=None):
+    """Get the user's recent exchanges as a list of messages"""
     try:
         if not user_id:
             raise ValidationException("User ID is required")
         
-        chats = chat_collection.find({"user_id": user_id}).sort("_id", -1).limit(limit)
-        history = ""
-        for chat in reversed(list(chats)):
-            history += f"User: {chat['user_input']}\nBot: {chat['bot_reply']}\n"
+        limit = limit or settings.PROMPT_RECENT_TURNS
+        await write_behind.sync_user(user_id)
+        chats = await get_storage().recent_flat_records(user_id, limit)
+        history = []
+        for chat in chats:
+            history.append({"sender": "user", "message": chat["user_input"]})
+            history.append({"sender": "bot", "message": chat["bot_reply"]})
         
         return history
         
@@ -23,7 +29,7 @@ def get_user_history(user_id: str, limit=10):
         log_error(e, "get_user_history")
         raise ValidationException("Failed to retrieve chat history")
 
-def handle_chat(user_id: str, user_input: str) -> str:
+async def handle_chat(user_id: str, user_input: str, use_cache: bool = True) -> str:
     """Handle chat with basic validation and error handling"""
     try:
         # Basic validation
@@ -37,32 +43,37 @@ def handle_chat(user_id: str, user_input: str) -> str:
             raise ValidationException("Message too long (max 2000 characters)")
         
         # Get conversation history
-        history = get_user_history(user_id)
-        full_prompt = f"{history}User: {user_input}\nBot:"
+        history = await get_user_history(user_id)
+        memories = await memory.recall(user_id, user_input, [render_message(msg) for msg in history])
+        full_prompt = build_prompt(history, user_input, memories=memories)
         
         # Generate AI response
         try:
-            reply = generate_response(full_prompt)
+            reply = await agenerate_response(full_prompt, use_cache=use_cache)
         except Exception as e:
             log_error(e, "generate_response")
-            raise ValidationException("Failed to generate AI response")
+            raise ServiceUnavailableException("AI service unavailable")
         
         # Store in database
         try:
-            chat_collection.insert_one({
+            await write_behind.insert_flat_record(user_id, {
                 "user_id": user_id,
                 "user_input": user_input,
                 "bot_reply": reply
             })
+            memory.remember_later(user_id, [
+                {"sender": "user", "message": user_input},
+                {"sender": "bot", "message": reply}
+            ])
         except Exception as e:
             log_error(e, "store_chat")
             # Don't fail the request if storage fails, but log it
             pass
         
-        log_info(f"Chat handled successfully for user: {user_id}")
+        log_info("Chat handled successfully for user: %s", user_id)
         return reply
         
-    except ValidationException:
+    except (ValidationException, ServiceUnavailableException):
         raise
     except Exception as e:
         log_error(e, "handle_chat")
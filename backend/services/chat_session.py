@@ -0,0 +1,67 @@
+from core.logging import log_error
+from services import chat_store, memory, write_behind
+from services.chat_titles import title_new_chat
+from services.prompt_builder import PromptPrefix, chat_prompt_prefix, refresh_summary, summary_is_stale
+from datetime import datetime
+import asyncio
+
+async def store_exchange(user_id: str, chat_id: str, message: str, reply: str):
+    """Append the user message and bot reply to a chat"""
+    new_messages = [
+        {"sender": "user", "message": message, "timestamp": datetime.utcnow().isoformat()},
+        {"sender": "bot", "message": reply, "timestamp": datetime.utcnow().isoformat()}
+    ]
+    await write_behind.append_messages(user_id, chat_id, new_messages)
+    memory.remember_later(user_id, [{"chat_id": chat_id, **msg} for msg in new_messages])
+
+class ChatSession:
+    """State a long-lived (WebSocket) connection keeps for one chat
+
+    The rendered recent turns are loaded once when the connection opens and
+    then extended in memory, so each message only needs the (cached) chat
+    metadata for ownership and the current summary. Writes made to the
+    same chat through other connections are not seen until reconnecting.
+    """
+    def __init__(self, user_id: str, chat: dict, prefix: PromptPrefix):
+        self.user_id = user_id
+        self.chat_id = chat["chat_id"]
+        self.message_count = chat.get("message_count", 0)
+        self.prefix = prefix
+        self._summary_task = None
+
+    @classmethod
+    async def open(cls, user_id: str, chat_id: str) -> "ChatSession":
+        """Load the chat for `user_id`, raising NotFoundException if it is not theirs"""
+        chat = await chat_store.get_chat(user_id, chat_id)
+        await write_behind.sync_chat(chat_id)
+        # A private copy: this connection extends it without re-reading storage
+        prefix = (await chat_prompt_prefix(chat_id)).copy()
+        return cls(user_id, chat, prefix)
+
+    async def prompt_for(self, message: str) -> str:
+        # Re-checked per message: picks up summary refreshes and notices deletion
+        chat = await chat_store.get_chat(self.user_id, self.chat_id)
+        upto = chat.get("summary_upto") or 0
+        memories = await memory.recall(self.user_id, message, self.prefix.window(upto))
+        return self.prefix.build(message, chat.get("summary"), memories, upto)
+
+    async def record(self, message: str, reply: str):
+        """Persist an exchange and add it to the in-memory prompt prefix"""
+        await store_exchange(self.user_id, self.chat_id, message, reply)
+        self.prefix.extend([{"sender": "user", "message": message}, {"sender": "bot", "message": reply}])
+        if self.message_count == 0:
+            await title_new_chat(self.user_id, self.chat_id)
+        self.message_count += 2
+
+        chat = await chat_store.get_chat(self.user_id, self.chat_id)
+        if summary_is_stale({**chat, "message_count": self.message_count}) and not self._summarizing():
+            self._summary_task = asyncio.create_task(self._refresh_summary())
+
+    def _summarizing(self) -> bool:
+        return self._summary_task is not None and not self._summary_task.done()
+
+    async def _refresh_summary(self):
+        try:
+            await refresh_summary(self.user_id, self.chat_id)
+        except Exception as e:
+            log_error(e, "session_refresh_summary")
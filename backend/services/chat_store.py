@@ -0,0 +1,189 @@
+from core.cache import ChatCache
+from core.config import settings
+from core.exceptions import NotFoundException
+from core.logging import log_error
+from core.storage import get_storage
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+# Per-process cache of hot chats; writes below keep it in step with storage
+cache = None
+if settings.CHAT_CACHE_ENABLED:
+    cache = ChatCache(settings.CHAT_CACHE_MAX_BYTES, settings.CHAT_CACHE_TTL, settings.CHAT_CACHE_WINDOW)
+
+def _strip_seq(messages: List[dict]) -> List[dict]:
+    return [{k: v for k, v in msg.items() if k != "seq"} for msg in messages]
+
+async def create_chat(user_id: str, title: str) -> dict:
+    """Insert a new, empty chat and return it"""
+    chat = {
+        "chat_id": str(uuid4()),
+        "user_id": user_id,
+        "title": title,
+        "created_at": datetime.utcnow().isoformat(),
+        "message_count": 0,
+        "version": 0
+    }
+    await get_storage().insert_chat(chat)
+    if cache is not None:
+        cache.put_chat(chat)
+        cache.add_to_chat_list(user_id, {k: chat[k] for k in ("chat_id", "title", "created_at")})
+    return chat
+
+async def list_chats(user_id: str) -> List[dict]:
+    """List a user's chats oldest first, without any message data"""
+    if cache is not None:
+        chats = cache.get_chat_list(user_id)
+        if chats is not None:
+            return chats
+    chats = await get_storage().list_chats(user_id)
+    if cache is not None:
+        cache.put_chat_list(user_id, chats)
+    return chats
+
+async def get_chat(user_id: str, chat_id: str) -> dict:
+    """Load chat metadata, raising NotFoundException if the user does not own it"""
+    chat = cache.get_chat(chat_id) if cache is not None else None
+    if chat is None:
+        chat = await get_storage().get_chat(chat_id)
+        if chat and cache is not None:
+            cache.put_chat(chat)
+    if not chat or chat.get("user_id") != user_id:
+        raise NotFoundException("Chat not found")
+    return chat
+
+async def get_chat_version(chat_id: str) -> int:
+    """A chat's version read from storage, never the cache, raising NotFoundException if it is gone"""
+    version = await get_storage().chat_version(chat_id)
+    if version is None:
+        raise NotFoundException("Chat not found")
+    return version
+
+async def _recent_window(chat_id: str, limit: int) -> List[dict]:
+    """Last `limit` messages of a chat with their seq, served from the cache when possible"""
+    if cache is None:
+        return await get_storage().recent_messages(chat_id, limit)
+
+    # Read first, so a window is never tagged newer than its messages
+    version = await get_storage().chat_version(chat_id)
+    window = cache.get_window(chat_id, version)
+    # Enough messages cached, or the window already reaches the start of the chat
+    if window is not None and (len(window) >= limit or not window or window[0]["seq"] == 0):
+        return window[-limit:]
+
+    messages = await get_storage().recent_messages(chat_id, max(limit, cache.window))
+    if version is not None:
+        cache.put_window(chat_id, messages, version)
+    return messages[-limit:]
+
+async def get_recent_messages(chat_id: str, limit: int, with_seq: bool = False) -> List[dict]:
+    """Load the last `limit` messages of a chat in order"""
+    window = await _recent_window(chat_id, limit)
+    return window if with_seq else _strip_seq(window)
+
+async def get_message_range(chat_id: str, start: int, end: int) -> List[dict]:
+    """Load messages with start <= seq < end in order"""
+    return _strip_seq(await get_storage().message_range(chat_id, start, end))
+
+async def get_messages_page(chat_id: str, before: Optional[int] = None, limit: int = 50) -> Tuple[List[dict], Optional[int]]:
+    """Load up to `limit` messages older than seq `before` (newest page if None)
+
+    Returns the messages in order plus the cursor for the next older page,
+    or None once the start of the chat is reached.
+    """
+    if before is None:
+        page = await _recent_window(chat_id, limit)
+    else:
+        page = await get_storage().messages_before(chat_id, before, limit)
+
+    next_cursor = page[0]["seq"] if page and page[0]["seq"] > 0 else None
+    return _strip_seq(page), next_cursor
+
+async def reserve_seqs(chat_id: str, count: int, user_id: Optional[str] = None) -> Optional[int]:
+    """Atomically reserve `count` sequence numbers, returning the first (None if no such chat)"""
+    first_seq = await get_storage().reserve_seqs(chat_id, count, user_id)
+    if first_seq is None:
+        return None
+    if cache is not None:
+        cache.update_chat(chat_id, message_count=first_seq + count)
+    return first_seq
+
+async def release_seqs(chat_id: str, first_seq: int, count: int):
+    """Give back seqs reserved for messages that failed to store, so they leave no gap
+
+    A no-op if another reservation followed or some of the messages landed.
+    """
+    try:
+        released = await get_storage().release_seqs(chat_id, first_seq, count)
+    except Exception as e:
+        log_error(e, "release_seqs")
+        return
+    if released and cache is not None:
+        cache.update_chat(chat_id, message_count=first_seq)
+
+async def append_messages(user_id: str, chat_id: str, messages: List[dict]):
+    """Append messages to a chat, allocating their sequence numbers atomically"""
+    first_seq = await reserve_seqs(chat_id, len(messages), user_id)
+    if first_seq is None:
+        raise NotFoundException("Chat not found")
+
+    docs = [{"chat_id": chat_id, "seq": first_seq + i, **msg} for i, msg in enumerate(messages)]
+    try:
+        await get_storage().insert_messages(docs)
+    except Exception:
+        await release_seqs(chat_id, first_seq, len(docs))
+        raise
+    if cache is not None:
+        cache.extend_window(chat_id, _window_entries(docs))
+        cache.bump_version(chat_id)
+
+async def insert_messages_bulk(docs: List[dict]):
+    """Insert already-sequenced message documents, possibly spanning chats, in one round trip
+
+    Re-inserting a message that already landed is ignored, so a failed
+    batch can simply be retried.
+    """
+    await get_storage().insert_messages(docs)
+
+    if cache is not None:
+        by_chat: Dict[str, List[dict]] = {}
+        for doc in docs:
+            by_chat.setdefault(doc["chat_id"], []).append(doc)
+        for chat_id, chat_docs in by_chat.items():
+            chat_docs.sort(key=lambda doc: doc["seq"])
+            cache.extend_window(chat_id, _window_entries(chat_docs))
+            cache.bump_version(chat_id)
+
+def _window_entries(docs: List[dict]) -> List[dict]:
+    """Message documents as cached in a window (as read back from storage, with seq)"""
+    return [{k: doc[k] for k in ("seq", "sender", "message", "timestamp") if k in doc} for doc in docs]
+
+async def update_summary(chat_id: str, summary: str, upto: int, expected_upto: int) -> bool:
+    """Store a rolling summary covering messages before seq `upto`
+
+    Only applies if the stored summary still ends at `expected_upto`, so
+    concurrent refreshes cannot move it backwards.
+    """
+    if not await get_storage().update_summary(chat_id, summary, upto, expected_upto):
+        return False
+    if cache is not None:
+        cache.update_chat(chat_id, summary=summary, summary_upto=upto)
+    return True
+
+async def rename_chat(user_id: str, chat_id: str, title: str) -> bool:
+    """Set a chat's title, returning False if nothing changed"""
+    if not await get_storage().rename_chat(user_id, chat_id, title):
+        return False
+    if cache is not None:
+        cache.update_chat(chat_id, title=title)
+        cache.bump_version(chat_id)
+        cache.rename_in_chat_list(user_id, chat_id, title)
+    return True
+
+async def delete_chat(user_id: str, chat_id: str) -> bool:
+    """Delete a chat and its messages, returning False if it did not exist"""
+    deleted = await get_storage().delete_chat(user_id, chat_id)
+    if cache is not None:
+        cache.invalidate_chat(chat_id, user_id)
+    return deleted
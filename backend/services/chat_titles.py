@@ -0,0 +1,62 @@
+from core.config import settings
+from core.exceptions import NotFoundException
+from core.gemini import agenerate_response
+from core.logging import log_error, log_info
+from services import chat_store, jobs, write_behind
+from services.prompt_builder import render_message
+from typing import Optional
+import re
+
+DEFAULT_TITLE = "New Chat"
+MAX_TITLE_CHARS = 60
+TITLE_INSTRUCTIONS = (
+    "Write a short title, at most six words, for a conversation that starts with the exchange below. "
+    "Reply with the title only, without quotes."
+)
+
+def clean_title(text: str) -> Optional[str]:
+    """First line of a model reply, without quotes, a "Title:" label or trailing punctuation"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines:
+        return None
+    title = re.sub(r"^(title\s*:\s*)", "", lines[0], flags=re.IGNORECASE)
+    title = re.sub(r"\s+", " ", title.strip().strip("\"'*#`").strip()).rstrip(".!:;,")
+    if len(title) > MAX_TITLE_CHARS:
+        title = title[:MAX_TITLE_CHARS].rsplit(" ", 1)[0]
+    return title or None
+
+async def _untitled(user_id: str, chat_id: str) -> bool:
+    """Whether the chat still exists with the default title (the user has not renamed it)"""
+    try:
+        chat = await chat_store.get_chat(user_id, chat_id)
+    except NotFoundException:
+        return False
+    return chat.get("title") == DEFAULT_TITLE
+
+async def generate_title(job: dict):
+    """Job handler: title a chat from its first exchange, unless it was renamed meanwhile"""
+    user_id, chat_id = job["user_id"], job["chat_id"]
+    if not await _untitled(user_id, chat_id):
+        return
+    await write_behind.sync_chat(chat_id)
+    messages = await chat_store.get_message_range(chat_id, 0, 2)
+    if not messages:
+        return
+
+    transcript = "".join(render_message(msg) for msg in messages)
+    title = clean_title(await agenerate_response(f"{TITLE_INSTRUCTIONS}\n\n{transcript}\nTitle:", use_cache=False))
+    # Checked again: the user may have renamed it while the model was answering
+    if title and await _untitled(user_id, chat_id):
+        await chat_store.rename_chat(user_id, chat_id, title)
+        log_info("Chat %s titled '%s'", chat_id, title)
+
+jobs.register("chat_title", generate_title, concurrency=settings.JOBS_TITLE_CONCURRENCY)
+
+async def title_new_chat(user_id: str, chat_id: str):
+    """Queue a title for a chat that just got its first exchange; errors are only logged"""
+    if not settings.CHAT_AUTO_TITLE:
+        return
+    try:
+        await jobs.enqueue("chat_title", user_id=user_id, chat_id=chat_id, dedupe_key=f"chat_title:{chat_id}")
+    except Exception as e:
+        log_error(e, "enqueue_chat_title")
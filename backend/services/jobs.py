@@ -0,0 +1,175 @@
+from core import metrics
+from core.config import settings
+from core.logging import log_error, log_info
+from core.storage import get_storage
+from typing import Awaitable, Callable, Dict, Optional
+from uuid import uuid4
+import asyncio
+import time
+
+class JobKind:
+    """A registered job type: its handler and how many may run at once per process"""
+    def __init__(self, handler: Callable[[dict], Awaitable[None]], concurrency: int, max_attempts: int):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+_kinds: Dict[str, JobKind] = {}
+
+def register(kind: str, handler: Callable[[dict], Awaitable[None]], concurrency: int = 1, max_attempts: Optional[int] = None):
+    """Run `handler(job)` for jobs of `kind`; handlers should be safe to run twice"""
+    _kinds[kind] = JobKind(handler, concurrency, max_attempts or settings.JOBS_MAX_ATTEMPTS)
+
+class JobQueue:
+    """Persistent background jobs run by an in-process worker
+
+    Jobs live in storage, so they survive restarts and are shared by every
+    worker process: each process claims due jobs under a lease, and a job
+    whose process died is claimed again once the lease runs out. Failed
+    jobs are retried with exponential backoff until their kind's
+    max_attempts. At most `concurrency` jobs run at once per process, and
+    no more of one kind than its own limit.
+    """
+    def __init__(self, concurrency: int, poll_interval: float, lease: float, retry_base: float, retry_max: float, retention: float):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.retention = retention
+        self._running: Dict[str, int] = {}
+        self._tasks = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def enqueue(self, kind: str, user_id: Optional[str] = None, chat_id: Optional[str] = None,
+                      payload: Optional[dict] = None, dedupe_key: Optional[str] = None, delay: float = 0.0) -> bool:
+        """Store a job to run after `delay` seconds; False if one with `dedupe_key` is already pending"""
+        if kind not in _kinds:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = {"job_id": uuid4().hex, "kind": kind, "payload": payload or {}, "run_at": time.time() + delay}
+        if user_id is not None:
+            job["user_id"] = user_id
+        if chat_id is not None:
+            job["chat_id"] = chat_id
+        created = await get_storage().enqueue_job(job, dedupe_key)
+        if created and not delay:
+            self._wakeup.set()
+        return created
+
+    async def _claim(self):
+        free = self.concurrency - sum(self._running.values())
+        for kind, spec in _kinds.items():
+            slots = min(free, spec.concurrency - self._running.get(kind, 0))
+            if slots <= 0:
+                continue
+            for job in await get_storage().claim_jobs(kind, slots, self.lease):
+                self._running[kind] = self._running.get(kind, 0) + 1
+                metrics.jobs_running.inc(kind=kind)
+                task = asyncio.create_task(self._execute(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                free -= 1
+
+    async def _execute(self, job: dict):
+        kind, spec = job["kind"], _kinds[job["kind"]]
+        metrics.jobs_lag.observe(max(0.0, time.time() - job["run_at"]), kind=kind)
+        start = time.monotonic()
+        outcome = "ok"
+        try:
+            # Past the lease another worker may claim it, so stop there
+            await asyncio.wait_for(spec.handler(job), self.lease)
+            await get_storage().finish_job(job["job_id"])
+            self.completed += 1
+        except Exception as e:
+            log_error(e, f"job {kind} {job['job_id']}")
+            error = f"{type(e).__name__}: {e}"[:500]
+            try:
+                if job["attempts"] >= spec.max_attempts:
+                    outcome = "failed"
+                    self.failed += 1
+                    await get_storage().finish_job(job["job_id"], error)
+                else:
+                    outcome = "retry"
+                    self.retried += 1
+                    delay = min(self.retry_max, self.retry_base * 2 ** (job["attempts"] - 1))
+                    await get_storage().retry_job(job["job_id"], time.time() + delay, error)
+            except Exception as e:
+                # Left running: it is claimed again when the lease expires
+                log_error(e, "update_job")
+        finally:
+            self._running[kind] -= 1
+            metrics.jobs_running.dec(kind=kind)
+            metrics.jobs_duration.observe(time.monotonic() - start, kind=kind, outcome=outcome)
+            self._wakeup.set()
+
+    async def _run(self):
+        purged_at = 0.0
+        while True:
+            try:
+                await self._claim()
+                if time.monotonic() - purged_at > 3600:
+                    purged_at = time.monotonic()
+                    await get_storage().purge_jobs(time.time() - self.retention)
+            except Exception as e:
+                log_error(e, "job_queue")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, grace: float = 5.0):
+        """Stop claiming jobs and give running ones `grace` seconds to finish
+
+        Jobs cut off here keep their lease and are retried once it expires.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=grace)
+            for task in pending:
+                task.cancel()
+        log_info("Job queue stopped with %s jobs cut off", sum(self._running.values()))
+
+    async def stats(self) -> dict:
+        """Queue depth and lag across all processes, plus this process's counters"""
+        stats = await get_storage().job_stats()
+        oldest_due = stats.pop("oldest_due")
+        return {
+            **stats,
+            "lag_seconds": round(time.time() - oldest_due, 3) if oldest_due is not None else 0.0,
+            "running_here": {kind: count for kind, count in self._running.items() if count},
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed_here": self.failed,
+        }
+
+queue = None
+if settings.JOBS_ENABLED:
+    queue = JobQueue(
+        settings.JOBS_CONCURRENCY,
+        settings.JOBS_POLL_INTERVAL,
+        settings.JOBS_LEASE_SECONDS,
+        settings.JOBS_RETRY_BASE,
+        settings.JOBS_RETRY_MAX,
+        settings.JOBS_RETENTION
+    )
+
+async def enqueue(kind: str, **kwargs) -> bool:
+    """Queue a job (see JobQueue.enqueue); a no-op returning False when JOBS_ENABLED is off"""
+    if queue is None:
+        return False
+    return await queue.enqueue(kind, **kwargs)
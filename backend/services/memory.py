@@ -0,0 +1,116 @@
+from cachetools import TTLCache #type: ignore
+from core.config import settings
+from core.embeddings import get_embedder
+from core.logging import log_error
+from core.storage import get_storage
+from core.vector_index import VectorIndex
+from services.prompt_builder import estimate_tokens, render_message
+from typing import Dict, Iterable, List, Optional
+from uuid import uuid4
+import asyncio
+import numpy as np #type: ignore
+
+# Loaded per-user indexes. The TTL bounds how long memories written by
+# other workers stay invisible here.
+_indexes = TTLCache(maxsize=settings.MEMORY_INDEX_CACHE_SIZE, ttl=settings.MEMORY_INDEX_TTL)
+_loading: Dict[str, asyncio.Future] = {}
+_tasks = set()
+
+async def _embed(texts: List[str]) -> np.ndarray:
+    embedder = get_embedder()
+    batches = [texts[i:i + settings.EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), settings.EMBEDDING_BATCH_SIZE)]
+    return np.concatenate([await embedder.aembed(batch) for batch in batches])
+
+async def _load_index(user_id: str) -> VectorIndex:
+    records = await get_storage().load_memories(user_id, settings.MEMORY_MAX_PER_USER)
+    index = VectorIndex(settings.EMBEDDING_DIM, capacity=max(len(records), 256), max_size=settings.MEMORY_MAX_PER_USER)
+    if records:
+        vectors = np.frombuffer(b"".join(r["vector"] for r in records), dtype=np.float32)
+        index.add(vectors, [(r["sender"], r["message"]) for r in records])
+    return index
+
+async def _index_for(user_id: str) -> VectorIndex:
+    """The user's index, loaded from storage once for concurrent callers"""
+    index = _indexes.get(user_id)
+    if index is not None:
+        return index
+    if user_id not in _loading:
+        _loading[user_id] = asyncio.ensure_future(_load_index(user_id))
+    try:
+        index = await _loading[user_id]
+    finally:
+        _loading.pop(user_id, None)
+    _indexes[user_id] = index
+    return index
+
+async def remember(user_id: str, messages: List[dict]):
+    """Embed and store {sender, message, chat_id?} messages, adding them to a loaded index"""
+    messages = [msg for msg in messages if msg["message"].strip()]
+    if not messages:
+        return
+    vectors = await _embed([msg["message"] for msg in messages])
+    index = _indexes.get(user_id)
+    records = []
+    for msg, vector in zip(messages, vectors):
+        record = {"memory_id": uuid4().hex, "user_id": user_id, "sender": msg["sender"], "message": msg["message"], "vector": vector.tobytes()}
+        if msg.get("chat_id"):
+            record["chat_id"] = msg["chat_id"]
+        records.append(record)
+    await get_storage().insert_memories(records)
+    # An index loaded while this was being stored already has these records
+    if index is not None and _indexes.get(user_id) is index:
+        index.add(vectors, [(msg["sender"], msg["message"]) for msg in messages])
+
+def remember_later(user_id: str, messages: List[dict]):
+    """Schedule remember() off the request path; a no-op unless MEMORY_ENABLED"""
+    if not settings.MEMORY_ENABLED:
+        return
+
+    async def run():
+        try:
+            await remember(user_id, messages)
+        except Exception as e:
+            log_error(e, "remember")
+
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def recall(user_id: str, message: str, exclude_lines: Iterable[str] = ()) -> Optional[List[dict]]:
+    """Up to MEMORY_TOP_K past messages most similar to `message`, best match first
+
+    Messages whose rendered line is in `exclude_lines` (the recent turns
+    already in the prompt) are skipped. Returns None when memory is
+    disabled, and on errors, so prompts fall back to recency alone.
+    """
+    if not settings.MEMORY_ENABLED:
+        return None
+    try:
+        index = await _index_for(user_id)
+        if not len(index):
+            return None
+        exclude = set(exclude_lines)
+        query = await _embed([message])
+        hits = index.search(query, settings.MEMORY_TOP_K + len(exclude))[0]
+    except Exception as e:
+        log_error(e, "recall")
+        return None
+
+    # Memories may use up to a quarter of the prompt budget
+    memories, seen, budget = [], set(), settings.PROMPT_TOKEN_BUDGET // 4
+    for score, (sender, text) in hits:
+        line = render_message({"sender": sender, "message": text})
+        if score < settings.MEMORY_MIN_SCORE or line in exclude or line in seen:
+            continue
+        budget -= estimate_tokens(line)
+        if budget < 0:
+            break
+        seen.add(line)
+        memories.append({"sender": sender, "message": text})
+        if len(memories) == settings.MEMORY_TOP_K:
+            break
+    return memories or None
+
+def forget_user(user_id: str):
+    """Drop a loaded index so the next recall reloads it (e.g. after a chat is deleted)"""
+    _indexes.pop(user_id, None)
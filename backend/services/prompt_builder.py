@@ -0,0 +1,227 @@
+from core.config import settings
+from core.gemini import agenerate_response
+from core.logging import log_error, log_info
+from services import chat_store
+from cachetools import LRUCache #type: ignore
+from collections import deque
+from typing import List, Optional
+
+# Rough average for English text; good enough for budgeting, not billing
+CHARS_PER_TOKEN = 4
+
+# Upper bound on messages folded into the summary per model call
+SUMMARY_MAX_MESSAGES = 200
+
+SUMMARY_INSTRUCTIONS = (
+    "Update the running summary of a conversation between a user and an AI assistant. "
+    "Keep facts, names, decisions and open questions; drop pleasantries. "
+    "Reply with the updated summary only, in under 200 words."
+)
+
+_refreshing = set()
+
+# Rendered recent turns per chat, reused and extended across turns
+_prefixes = LRUCache(maxsize=settings.PROMPT_PREFIX_CACHE_SIZE)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for prompt budgeting"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def verbatim_limit() -> int:
+    """Most messages a prompt can hold verbatim
+
+    Messages newer than the chat's summary_upto are always sent verbatim,
+    so besides the recent window this covers the turns that wait for the
+    next summary refresh (SUMMARY_REFRESH_TURNS) and as many again while
+    that refresh runs in the background.
+    """
+    return (settings.PROMPT_RECENT_TURNS + 2 * settings.SUMMARY_REFRESH_TURNS) * 2
+
+def render_message(msg: dict) -> str:
+    return f"{msg['sender'].capitalize()}: {msg['message']}\n"
+
+def _header(summary: Optional[str], memories: Optional[List[dict]]) -> str:
+    header = f"Summary of the earlier conversation: {summary}\n" if summary else ""
+    if memories:
+        header += "Relevant earlier messages:\n" + "".join(render_message(msg) for msg in memories) + "Recent conversation:\n"
+    return header
+
+def _assemble(lines: List[str], message: str, header: str, line_tokens: Optional[List[int]] = None) -> str:
+    tail = f"User: {message}\nBot:"
+    remaining = settings.PROMPT_TOKEN_BUDGET - estimate_tokens(header) - estimate_tokens(tail)
+
+    kept = []
+    for i in range(len(lines) - 1, -1, -1):
+        remaining -= line_tokens[i] if line_tokens is not None else estimate_tokens(lines[i])
+        if remaining < 0:
+            break
+        kept.append(lines[i])
+    kept.reverse()
+
+    return header + "".join(kept) + tail
+
+def _window_start(end: int, summary_upto: int) -> int:
+    """First seq sent verbatim: the recent window, widened back to the end of the summary"""
+    return max(0, min(summary_upto, end - settings.PROMPT_RECENT_TURNS * 2))
+
+def build_prompt(history: List[dict], message: str, summary: Optional[str] = None,
+                 memories: Optional[List[dict]] = None, summary_upto: int = 0) -> str:
+    """Assemble the model prompt within the configured token budget
+
+    `history` is a chat's messages up to the newest. Keeps the last
+    PROMPT_RECENT_TURNS turns verbatim, and every message from seq
+    `summary_upto` on that `summary` does not cover yet, dropping the
+    oldest first when over PROMPT_TOKEN_BUDGET. Anything older is expected
+    to be represented by `summary`, and by `memories` (relevant older
+    messages, see services/memory.py) when given.
+    """
+    start = max(_window_start(len(history), summary_upto), len(history) - verbatim_limit())
+    lines = [render_message(msg) for msg in history[start:]]
+    return _assemble(lines, message, _header(summary, memories))
+
+class PromptPrefix:
+    """The rendered verbatim turns of a chat, kept up to date by appending
+
+    Covers messages before seq `end`, holding at most verbatim_limit() of
+    them with their seqs, which may have gaps. Extending renders only the
+    new messages and drops lines past that limit, so a turn costs the same
+    however long the chat is. build() gives the same prompt as
+    build_prompt() over the same messages.
+    """
+    __slots__ = ("end", "lines", "seqs", "tokens", "total_tokens", "_text", "_text_skip")
+
+    def __init__(self, end: int = 0):
+        self.end = end
+        self.lines = deque()
+        self.seqs = deque()
+        self.tokens = deque()
+        self.total_tokens = 0
+        self._text = None
+        self._text_skip = None
+
+    def extend(self, messages: List[dict]):
+        """Append messages newer than `end`; those without a seq follow on from it"""
+        limit = verbatim_limit()
+        next_seq = self.end + max(0, len(messages) - limit)
+        for msg in messages[-limit:]:
+            seq = msg.get("seq", next_seq)
+            line = render_message(msg)
+            self.lines.append(line)
+            self.seqs.append(seq)
+            self.tokens.append(estimate_tokens(line))
+            self.total_tokens += self.tokens[-1]
+            next_seq = seq + 1
+        self.end = next_seq
+        while len(self.lines) > limit:
+            self.lines.popleft()
+            self.seqs.popleft()
+            self.total_tokens -= self.tokens.popleft()
+        self._text = None
+
+    def copy(self) -> "PromptPrefix":
+        other = PromptPrefix(self.end)
+        other.lines, other.seqs, other.tokens = deque(self.lines), deque(self.seqs), deque(self.tokens)
+        other.total_tokens, other._text, other._text_skip = self.total_tokens, self._text, self._text_skip
+        return other
+
+    def _skip(self, summary_upto: int) -> int:
+        """How many held lines are older than the verbatim window"""
+        start = _window_start(self.end, summary_upto)
+        skip = 0
+        while skip < len(self.seqs) and self.seqs[skip] < start:
+            skip += 1
+        return skip
+
+    def window(self, summary_upto: int = 0) -> List[str]:
+        """The lines a prompt sends verbatim, given the chat's summary_upto"""
+        return list(self.lines)[self._skip(summary_upto):]
+
+    def build(self, message: str, summary: Optional[str] = None, memories: Optional[List[dict]] = None,
+              summary_upto: int = 0) -> str:
+        header = _header(summary, memories)
+        tail = f"User: {message}\nBot:"
+        skip = self._skip(summary_upto)
+        tokens = self.total_tokens - sum(self.tokens[i] for i in range(skip))
+        if tokens <= settings.PROMPT_TOKEN_BUDGET - estimate_tokens(header) - estimate_tokens(tail):
+            if self._text is None or self._text_skip != skip:
+                self._text, self._text_skip = "".join(self.window(summary_upto)), skip
+            return header + self._text + tail
+        # Over budget: drop the oldest turns, as build_prompt does
+        return _assemble(self.window(summary_upto), message, header, list(self.tokens)[skip:])
+
+def _in_sync(prefix: PromptPrefix, window: List[dict]) -> bool:
+    """Whether `prefix` holds exactly the messages of `window` that are older than its end
+
+    A message stored late into a seq gap (a slower concurrent writer) shows
+    up here as a mismatch.
+    """
+    if window and window[0]["seq"] > prefix.end:
+        # More new messages than the window holds
+        return False
+    first = prefix.seqs[0] if prefix.seqs else prefix.end
+    held = [msg["seq"] for msg in window if first <= msg["seq"] < prefix.end]
+    return list(prefix.seqs)[len(prefix.seqs) - len(held):] == held
+
+async def chat_prompt_prefix(chat_id: str) -> PromptPrefix:
+    """Cached prefix of a chat, extended with any messages stored since it was last used
+
+    Keyed by chat id and checked against the seqs of the chat's recent
+    window (itself usually served from the chat cache), so messages appended
+    through any path are picked up and a prefix is never ahead of storage.
+    Seq gaps are skipped over; the prefix is rebuilt from the window if a
+    message later lands in one.
+    """
+    window = await chat_store.get_recent_messages(chat_id, verbatim_limit(), with_seq=True)
+    # No awaits from here on, so concurrent turns cannot interleave their updates
+    prefix = _prefixes.get(chat_id)
+    stored_end = window[-1]["seq"] + 1 if window else 0
+    if prefix is None or prefix.end > stored_end or not _in_sync(prefix, window):
+        prefix = PromptPrefix(window[0]["seq"] if window else 0)
+        _prefixes[chat_id] = prefix
+    new_messages = [msg for msg in window if msg["seq"] >= prefix.end]
+    if new_messages:
+        prefix.extend(new_messages)
+    return prefix
+
+def forget_prompt_prefix(chat_id: str):
+    _prefixes.pop(chat_id, None)
+
+def summary_is_stale(chat: dict) -> bool:
+    """Whether enough turns have left the verbatim window to refresh the summary"""
+    target = chat.get("message_count", 0) - settings.PROMPT_RECENT_TURNS * 2
+    return target - chat.get("summary_upto", 0) >= settings.SUMMARY_REFRESH_TURNS * 2
+
+async def refresh_summary(user_id: str, chat_id: str):
+    """Fold turns that fell out of the verbatim window into the chat's rolling summary
+
+    Meant to run as a background task; failures are logged and retried
+    naturally on a later turn.
+    """
+    if chat_id in _refreshing:
+        return
+    _refreshing.add(chat_id)
+    try:
+        chat = await chat_store.get_chat(user_id, chat_id)
+        summary, upto = chat.get("summary"), chat.get("summary_upto", 0)
+        target = chat["message_count"] - settings.PROMPT_RECENT_TURNS * 2
+
+        while target - upto > 0:
+            end = min(target, upto + SUMMARY_MAX_MESSAGES)
+            messages = await chat_store.get_message_range(chat_id, upto, end)
+            transcript = "".join(render_message(msg) for msg in messages)
+            prompt = (
+                f"{SUMMARY_INSTRUCTIONS}\n\n"
+                f"Current summary: {summary or '(none)'}\n\n"
+                f"New messages:\n{transcript}\nUpdated summary:"
+            )
+            new_summary = (await agenerate_response(prompt, use_cache=False)).strip()
+            if not await chat_store.update_summary(chat_id, new_summary, end, upto):
+                # Another worker advanced the summary first
+                return
+            summary, upto = new_summary, end
+
+        log_info("Summary refreshed for chat %s up to message %s", chat_id, upto)
+    except Exception as e:
+        log_error(e, "refresh_summary")
+    finally:
+        _refreshing.discard(chat_id)
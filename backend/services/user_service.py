@@ -1,10 +1,9 @@
-from core.mongo import user_collection
-from core.exceptions import ValidationException, AuthenticationException, NotFoundException
+from core.storage import get_storage
+from core.exceptions import ValidationException, AuthenticationException, NotFoundException, ServiceUnavailableException
 from core.logging import log_error, log_info
-from bson.objectid import ObjectId #type: ignore
-import bcrypt #type: ignore
+from core.security import hash_password, verify_password
 
-def create_user(username: str, password: str) -> str:
+async def create_user(username: str, password: str) -> str:
     """Create a new user"""
     try:
         # Basic validation
@@ -15,30 +14,25 @@ def create_user(username: str, password: str) -> str:
             raise ValidationException("Password must be at least 6 characters long")
         
         # Check if username already exists
-        existing_user = user_collection.find_one({"username": username})
+        existing_user = await get_storage().find_user(username)
         if existing_user:
             raise ValidationException("Username already exists")
         
-        # Hash password
-        hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        # Hash password off the event loop
+        hashed_pw = await hash_password(password)
         
         # Insert user into database
-        result = user_collection.insert_one({
-            "username": username, 
-            "password": hashed_pw
-        })
-        
-        user_id = str(result.inserted_id)
-        log_info(f"User created successfully: {username}")
+        user_id = await get_storage().create_user(username, hashed_pw)
+        log_info("User created successfully: %s", username)
         return user_id
         
-    except ValidationException:
+    except (ValidationException, ServiceUnavailableException):
         raise
     except Exception as e:
         log_error(e, "create_user")
         raise ValidationException("Failed to create user")
 
-def authenticate_user(username: str, password: str) -> str:
+async def authenticate_user(username: str, password: str) -> str:
     """Authenticate user"""
     try:
         # Basic validation
@@ -46,19 +40,19 @@ def authenticate_user(username: str, password: str) -> str:
             raise AuthenticationException("Username and password are required")
         
         # Query database
-        user = user_collection.find_one({"username": username})
+        user = await get_storage().find_user(username)
         if not user:
             raise AuthenticationException("Invalid credentials")
         
         # Verify password
-        if not bcrypt.checkpw(password.encode('utf-8'), user["password"]):
+        if not await verify_password(password, user["password"]):
             raise AuthenticationException("Invalid credentials")
         
-        user_id = str(user["_id"])
-        log_info(f"User authenticated successfully: {username}")
+        user_id = user["user_id"]
+        log_info("User authenticated successfully: %s", username)
         return user_id
         
-    except AuthenticationException:
+    except (AuthenticationException, ServiceUnavailableException):
         raise
     except Exception as e:
         log_error(e, "authenticate_user")
@@ -0,0 +1,188 @@
+from core.config import settings
+from core.logging import log_error, log_info, log_warning
+from core.storage import get_storage
+from services import chat_store
+from typing import Dict, List, Optional
+import asyncio
+
+class WriteBehindQueue:
+    """Buffer new messages in-process and persist them in batches
+
+    Pending writes are grouped per chat (and per user for flat /api/chat
+    records) so ordering within a chat is preserved. A background task
+    flushes every `flush_interval` seconds, or sooner once `max_batch`
+    writes are pending. Once `max_pending` writes are buffered, enqueuing
+    waits for a flush (backpressure). Failed batches are put back at the
+    front of their queues and retried on the next flush.
+    """
+    def __init__(self, flush_interval: float, max_batch: int, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._chats: Dict[str, List[dict]] = {}
+        self._flat: Dict[str, List[dict]] = {}
+        self._pending = 0
+        # Keys of the batch being written: still pending to readers until it lands
+        self._writing_chats = set()
+        self._writing_users = set()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.written = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def has_pending_chat(self, chat_id: str) -> bool:
+        return chat_id in self._chats or chat_id in self._writing_chats
+
+    def has_pending_user(self, user_id: str) -> bool:
+        return user_id in self._flat or user_id in self._writing_users
+
+    async def _admit(self, count: int):
+        if self._pending >= self.max_pending:
+            await self.flush()
+        self._pending += count
+        if self._pending >= self.max_batch:
+            self._wakeup.set()
+
+    async def enqueue_messages(self, chat_id: str, messages: List[dict]):
+        await self._admit(len(messages))
+        self._chats.setdefault(chat_id, []).extend(dict(msg) for msg in messages)
+
+    async def enqueue_flat(self, user_id: str, record: dict):
+        await self._admit(1)
+        self._flat.setdefault(user_id, []).append(dict(record))
+
+    def discard_chat(self, chat_id: str):
+        """Drop pending messages of a chat that is being deleted"""
+        self._pending -= len(self._chats.pop(chat_id, []))
+
+    async def _sequence(self, chat_id: str, messages: List[dict]) -> List[dict]:
+        # Messages requeued after a failed flush keep the seq they were given
+        unsequenced = [msg for msg in messages if "seq" not in msg]
+        if unsequenced:
+            first_seq = await chat_store.reserve_seqs(chat_id, len(unsequenced))
+            if first_seq is None:
+                log_warning("Dropping %s queued messages for missing chat %s", len(messages), chat_id)
+                messages.clear()
+                return []
+            for i, msg in enumerate(unsequenced):
+                msg["seq"] = first_seq + i
+        return [{"chat_id": chat_id, **msg} for msg in messages]
+
+    async def _write(self, chats: Dict[str, List[dict]], flat: Dict[str, List[dict]]):
+        sequenced = await asyncio.gather(*[self._sequence(c, msgs) for c, msgs in chats.items()])
+        docs = [doc for chat_docs in sequenced for doc in chat_docs]
+        if docs:
+            await chat_store.insert_messages_bulk(docs)
+
+        records = [record for user_records in flat.values() for record in user_records]
+        if records:
+            # Records keep the id storage gave them across retries, so duplicates are skipped
+            await get_storage().insert_flat_records(records)
+        return len(docs) + len(records)
+
+    async def flush(self, chat_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Write pending data: everything, or just one chat's or one user's"""
+        async with self._flush_lock:
+            if chat_id is not None:
+                chats, flat = ({chat_id: self._chats.pop(chat_id)} if chat_id in self._chats else {}), {}
+            elif user_id is not None:
+                chats, flat = {}, ({user_id: self._flat.pop(user_id)} if user_id in self._flat else {})
+            else:
+                chats, self._chats = self._chats, {}
+                flat, self._flat = self._flat, {}
+            count = sum(map(len, chats.values())) + sum(map(len, flat.values()))
+            if not count:
+                return
+            self._pending -= count
+            self._writing_chats, self._writing_users = set(chats), set(flat)
+
+            try:
+                self.written += await self._write(chats, flat)
+                self.flushes += 1
+            except Exception as e:
+                log_error(e, "write_behind_flush")
+                for key, msgs in chats.items():
+                    if msgs:
+                        self._chats[key] = msgs + self._chats.get(key, [])
+                        self._pending += len(msgs)
+                for key, records in flat.items():
+                    self._flat[key] = records + self._flat.get(key, [])
+                    self._pending += len(records)
+            finally:
+                self._writing_chats, self._writing_users = set(), set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out everything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        log_info("Write-behind queue stopped with %s writes pending", self._pending)
+
+    def stats(self) -> dict:
+        return {"pending": self._pending, "flushes": self.flushes, "written": self.written}
+
+writer = None
+if settings.PERSISTENCE_MODE == "write_behind":
+    writer = WriteBehindQueue(
+        settings.WRITE_BEHIND_FLUSH_INTERVAL,
+        settings.WRITE_BEHIND_MAX_BATCH,
+        settings.WRITE_BEHIND_MAX_PENDING
+    )
+
+async def append_messages(user_id: str, chat_id: str, messages: List[dict]):
+    """Persist chat messages now (sync mode) or queue them (write-behind mode)
+
+    In write-behind mode the caller is expected to have checked that the
+    chat exists and belongs to the user.
+    """
+    if writer is None:
+        await chat_store.append_messages(user_id, chat_id, messages)
+    else:
+        await writer.enqueue_messages(chat_id, messages)
+
+async def insert_flat_record(user_id: str, record: dict):
+    """Persist an /api/chat exchange record now or queue it"""
+    if writer is None:
+        await get_storage().insert_flat_records([record])
+    else:
+        await writer.enqueue_flat(user_id, record)
+
+async def sync_chat(chat_id: str):
+    """Read-your-writes barrier: make queued messages of a chat visible to reads
+
+    Also waits out a flush that is writing the chat's messages right now.
+    """
+    if writer is not None and writer.has_pending_chat(chat_id):
+        await writer.flush(chat_id=chat_id)
+
+async def sync_user(user_id: str):
+    """Read-your-writes barrier for a user's flat /api/chat records"""
+    if writer is not None and writer.has_pending_user(user_id):
+        await writer.flush(user_id=user_id)
+
+def discard_chat(chat_id: str):
+    if writer is not None:
+        writer.discard_chat(chat_id)
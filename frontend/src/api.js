@@ -15,6 +15,10 @@ API.interceptors.request.use(
         if (userId) {
             config.headers['User-ID'] = userId;
         }
+        const token = localStorage.getItem('token');
+        if (token) {
+            config.headers['Authorization'] = `Bearer ${token}`;
+        }
         return config;
     },
     (error) => {
@@ -29,6 +33,7 @@ API.interceptors.response.use(
         if (error.response?.status === 401) {
             localStorage.removeItem('user_id');
             localStorage.removeItem('username');
+            localStorage.removeItem('token');
             window.location.href = '/login';
         }
         return Promise.reject(error);
@@ -46,8 +51,8 @@ export const newChat = (userId, title) =>
 export const getChats = (userId) =>
     API.get(`/get_chats/${userId}`);
 
-export const getChatHistory = (userId, chatId) =>
-    API.get(`/chat/${userId}/${chatId}`);
+export const getChatHistory = (userId, chatId, before = null) =>
+    API.get(`/chat/${userId}/${chatId}`, { params: before === null ? {} : { before } });
 
 export const sendMessage = (userId, chatId, message) =>
     API.post('/send_message', { user_id: userId, chat_id: chatId, message });
@@ -26,6 +26,7 @@ export default function Chat() {
     const [chats, setChats] = useState([]);
     const [currentChat, setCurrentChat] = useState(null);
     const [messages, setMessages] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [inputMessage, setInputMessage] = useState("");
     const [isLoading, setIsLoading] = useState(false);
     const [isSidebarOpen, setIsSidebarOpen] = useState(false);
@@ -79,13 +80,27 @@ export default function Chat() {
     const loadChatHistory = async (chatId) => {
         try {
             const response = await getChatHistory(userId, chatId);
-            setMessages(response);
+            setMessages(response.messages);
+            setNextCursor(response.next_cursor);
         } catch (error) {
             console.error("Error loading chat history:", error);
             setError("Failed to load chat history");
         }
     };
 
+    const loadOlderMessages = async () => {
+        if (!currentChat || nextCursor === null) return;
+
+        try {
+            const response = await getChatHistory(userId, currentChat.chat_id, nextCursor);
+            setMessages(prev => [...response.messages, ...prev]);
+            setNextCursor(response.next_cursor);
+        } catch (error) {
+            console.error("Error loading older messages:", error);
+            setError("Failed to load chat history");
+        }
+    };
+
     const createNewChat = async () => {
         try {
             const response = await newChat(userId, "New Chat");
@@ -98,6 +113,7 @@ export default function Chat() {
             setChats(prev => [newChatData, ...prev]);
             setCurrentChat(newChatData);
             setMessages([]);
+            setNextCursor(null);
             setIsSidebarOpen(false);
         } catch (error) {
             console.error("Error creating new chat:", error);
@@ -175,6 +191,7 @@ export default function Chat() {
     const handleLogout = () => {
         localStorage.removeItem("user_id");
         localStorage.removeItem("username");
+        localStorage.removeItem("token");
         navigate("/login");
     };
 
@@ -302,6 +319,17 @@ export default function Chat() {
 
                 {/* Chat Messages */}
                 <div className="flex-1 overflow-y-auto p-4 space-y-4">
+                    {nextCursor !== null && (
+                        <div className="flex justify-center">
+                            <button
+                                onClick={loadOlderMessages}
+                                className="text-sm text-blue-600 hover:text-blue-700 py-1 px-3 rounded-lg hover:bg-blue-50"
+                            >
+                                Load earlier messages
+                            </button>
+                        </div>
+                    )}
+
                     {messages.length === 0 ? (
                         <div className="flex items-center justify-center h-full">
                             <div className="text-center">
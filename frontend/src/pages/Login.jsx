@@ -30,6 +30,7 @@ export default function Login() {
             const response = await loginUser(formData);
             localStorage.setItem('user_id', response.user_id);
             localStorage.setItem('username', response.username);
+            localStorage.setItem('token', response.token);
             navigate('/');
         } catch (err) {
             setError(err.response?.data?.error || 'Login failed. Please try again.');